@@ -6,40 +6,49 @@ Supports live window streaming and interactive terminal sessions.
 """
 
 import asyncio
-import json
+import base64
+import logging
+import logging.handlers
 import os
+import random
+import re
 import sys
 import argparse
 import subprocess
 import threading
 import queue
 import time
-import struct
+from collections import deque
 from concurrent.futures import ThreadPoolExecutor
 from urllib.parse import urljoin
 from typing import Dict, Set, Optional
 
 import aiohttp
+import orjson
 
 # Import the local server functions
 from server import (
-    load_app_config, get_window_list, get_volume, set_volume,
+    get_sorted_apps, get_app_by_id, get_window_list, get_volume, set_volume,
     get_brightness, set_brightness, get_system_info, get_rustdesk_status,
+    toggle_endpoint_mute, run_com, suspend_system, save_screenshot, FRAME_HEADER, window_id_hash,
+    _json_dumps, KEYFRAME_INTERVAL, CAPTURE_WORKERS,
     HAS_WIN32, HAS_PYCAW, HAS_SBC
 )
 
 # Import window capture
 try:
-    from window_capture import WindowCapture, ChromeController
+    from window_capture import (
+        WindowCapture, WindowCaptureSession, AdaptiveEncoder, ChromeController, send_key_batch
+    )
     HAS_CAPTURE = WindowCapture.is_available()
 except ImportError:
     HAS_CAPTURE = False
     WindowCapture = None
     ChromeController = None
+    send_key_batch = None
 
 import subprocess
 import ctypes
-from pathlib import Path
 from datetime import datetime
 import pyperclip
 import time
@@ -58,10 +67,176 @@ try:
     import win32gui
     import win32con
     import win32api
+    import win32clipboard
 except ImportError:
     pass
 
 
+# Log records are queued and written by a listener thread, so logging from
+# the event loop never blocks on stdout
+log = logging.getLogger("relay_client")
+_log_listener: Optional[logging.handlers.QueueListener] = None
+
+
+def setup_logging(level: int = logging.INFO):
+    """Route relay_client logging through a QueueHandler/QueueListener pair (idempotent)."""
+    global _log_listener
+    log.setLevel(level)
+    if _log_listener is not None:
+        return
+    log_queue = queue.Queue(-1)
+    stream_handler = logging.StreamHandler()
+    stream_handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(message)s", "%H:%M:%S"))
+    log.addHandler(logging.handlers.QueueHandler(log_queue))
+    log.propagate = False
+    _log_listener = logging.handlers.QueueListener(log_queue, stream_handler)
+    _log_listener.start()
+
+
+# /api/windows/<id>/<action>, where action may be nested (snap/left, chrome/back)
+WINDOW_ROUTE_RE = re.compile(r"^/api/windows/(\d+)/(.+)$")
+
+# Snap position -> (column, row, full_height) on a 2x2 screen grid
+SNAP_LAYOUTS = {
+    "left": (0, 0, True),
+    "right": (1, 0, True),
+    "top-left": (0, 0, False),
+    "top-right": (1, 0, False),
+    "bottom-left": (0, 1, False),
+    "bottom-right": (1, 1, False),
+}
+
+# Chrome action -> ChromeController method (navigate takes a URL and is handled separately)
+CHROME_ACTIONS = {
+    "back": "go_back",
+    "forward": "go_forward",
+    "refresh": "refresh",
+    "new-tab": "new_tab",
+    "close-tab": "close_tab",
+    "next-tab": "next_tab",
+    "prev-tab": "prev_tab",
+}
+
+# Application-level liveness: the relay sends health_ping every 10 s, so a
+# connection that has been silent for HEARTBEAT_TIMEOUT is a zombie
+HEARTBEAT_CHECK_INTERVAL = 25.0
+HEARTBEAT_TIMEOUT = 60.0
+
+# Concurrent stream cap (CAPTURE_WORKERS, shared with server, is the encode budget in cores)
+MAX_STREAMS = 4
+
+# Quiet period before a burst of stream_adjust messages (e.g. a slider) is applied
+ADJUST_DEBOUNCE = 0.15
+
+
+def _focus_for_input(hwnd: int, settle: float):
+    """Restore and foreground a window, then give it time to take input (blocking)."""
+    if win32gui.IsIconic(hwnd):
+        win32gui.ShowWindow(hwnd, win32con.SW_RESTORE)
+    try:
+        win32gui.SetForegroundWindow(hwnd)
+    except Exception:
+        pass
+    time.sleep(settle)
+
+
+def _sync_click(hwnd: int, x: int, y: int):
+    """Focus a window and click at a window-relative point; returns screen coords."""
+    rect = win32gui.GetWindowRect(hwnd)
+    abs_x, abs_y = rect[0] + x, rect[1] + y
+    _focus_for_input(hwnd, 0.1)
+    pyautogui.click(abs_x, abs_y)
+    return abs_x, abs_y
+
+
+def _sync_scroll(hwnd: int, clicks: int):
+    """Focus a window and scroll the wheel by clicks (positive = up)."""
+    _focus_for_input(hwnd, 0.05)
+    pyautogui.scroll(clicks)
+
+
+def _sync_mouse(hwnd: int, action: str, x: int, y: int):
+    """Focus a window, move the pointer and press/release the left button; returns screen coords."""
+    rect = win32gui.GetWindowRect(hwnd)
+    abs_x, abs_y = rect[0] + x, rect[1] + y
+    _focus_for_input(hwnd, 0.02)
+    pyautogui.moveTo(abs_x, abs_y)
+    if action == "down":
+        pyautogui.mouseDown()
+    elif action == "up":
+        pyautogui.mouseUp()
+    return abs_x, abs_y
+
+
+def _sync_keystroke(hwnd: int, vk_code: int, modifier_vks: list) -> bool:
+    """Foreground a window and send one key with modifiers (SendInput targets the foreground window)."""
+    try:
+        if win32gui.GetForegroundWindow() != hwnd:
+            win32gui.SetForegroundWindow(hwnd)
+            time.sleep(0.05)
+    except Exception as e:
+        log.warning("[KEYSTROKE] Could not focus window: %s", e)
+    # Modifiers down, key down/up, modifiers up - atomically
+    return send_key_batch(vk_code, modifier_vks)
+
+
+def _get_clipboard_text() -> str:
+    """Read clipboard text directly via Win32, falling back to pyperclip."""
+    if not HAS_WIN32:
+        return pyperclip.paste()
+    win32clipboard.OpenClipboard()
+    try:
+        if not win32clipboard.IsClipboardFormatAvailable(win32con.CF_UNICODETEXT):
+            return ""
+        return win32clipboard.GetClipboardData(win32con.CF_UNICODETEXT)
+    finally:
+        win32clipboard.CloseClipboard()
+
+
+def _set_clipboard_text(content: str):
+    """Write clipboard text directly via Win32, falling back to pyperclip."""
+    if not HAS_WIN32:
+        pyperclip.copy(content)
+        return
+    win32clipboard.OpenClipboard()
+    try:
+        win32clipboard.EmptyClipboard()
+        win32clipboard.SetClipboardData(win32con.CF_UNICODETEXT, content)
+    finally:
+        win32clipboard.CloseClipboard()
+
+
+def _sync_launch(command):
+    """Start a detached process (blocking Popen; run in an executor)."""
+    subprocess.Popen(
+        command,
+        shell=True,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+        creationflags=subprocess.CREATE_NEW_PROCESS_GROUP | subprocess.DETACHED_PROCESS
+    )
+
+
+def _sync_focus(hwnd: int):
+    """Restore and foreground a window (run in an executor)."""
+    if win32gui.IsIconic(hwnd):
+        win32gui.ShowWindow(hwnd, win32con.SW_RESTORE)
+    win32gui.SetForegroundWindow(hwnd)
+
+
+def _sync_snap(hwnd: int, layout):
+    """Restore a window and move it into a SNAP_LAYOUTS cell (run in an executor)."""
+    screen_width = win32api.GetSystemMetrics(0)
+    screen_height = win32api.GetSystemMetrics(1)
+    col, row, full_height = layout
+    half_width, half_height = screen_width // 2, screen_height // 2
+    win32gui.ShowWindow(hwnd, win32con.SW_RESTORE)
+    win32gui.SetWindowPos(
+        hwnd, None, col * half_width, row * half_height,
+        half_width, screen_height if full_height else half_height, 0
+    )
+
+
 class NonBlockingTerminalManager:
     """Manages non-blocking terminal execution to prevent WebSocket event loop blocking."""
 
@@ -102,7 +277,7 @@ class NonBlockingTerminalManager:
                     text=True,
                     timeout=30,
                     cwd=session.cwd,
-                    env={**os.environ, "PYTHONIOENCODING": "utf-8"}
+                    env=session.env
                 )
             else:
                 # Unix
@@ -169,10 +344,8 @@ class SmartReconnectionManager:
             self.max_delay
         )
 
-        # Add random jitter (±20%) to prevent thundering herd
-        import random
-        jitter = delay * 0.2 * (random.random() - 0.5)
-        final_delay = max(1.0, delay + jitter)
+        # Add random jitter (±25%) to prevent thundering herd
+        final_delay = max(1.0, delay * random.uniform(0.75, 1.25))
 
         return final_delay
 
@@ -180,14 +353,14 @@ class SmartReconnectionManager:
         """Reset backoff on successful connection"""
         self.consecutive_failures = 0
         self.successful_connections += 1
-        print(f"[RECONNECT] Connection successful (total: {self.successful_connections})")
+        log.info("[RECONNECT] Connection successful (total: %s)", self.successful_connections)
 
     def on_connection_failure(self, error: str):
         """Increment failure count and log attempt"""
         self.consecutive_failures += 1
         delay = self.get_reconnect_delay()
-        print(f"[RECONNECT] Connection failed (attempt #{self.consecutive_failures}): {error}")
-        print(f"[RECONNECT] Retrying in {delay:.1f} seconds...")
+        log.warning("[RECONNECT] Connection failed (attempt #%s): %s", self.consecutive_failures, error)
+        log.info("[RECONNECT] Retrying in %.1f seconds...", delay)
         return delay
 
 # Global non-blocking terminal manager
@@ -202,8 +375,10 @@ class TerminalSession:
         self.process: Optional[subprocess.Popen] = None
         self.output_queue: queue.Queue = queue.Queue()
         self.running = False
-        self.history: list = []
+        self.history: deque = deque(maxlen=500)  # Only the recent tail is ever recalled
         self.cwd = os.path.expanduser("~")
+        # Built once per session rather than copying os.environ for every command
+        self.env = {**os.environ, "PYTHONIOENCODING": "utf-8"} if os.name == 'nt' else None
 
     def start(self):
         """Start the terminal session."""
@@ -317,10 +492,26 @@ class RelayClient:
         self.auth_token = auth_token
         self.ws = None
         self.running = False
-        self.active_streams: Dict[str, asyncio.Task] = {}  # window_id -> capture task
-        self.stream_options: Dict[str, dict] = {}  # window_id -> {fps, quality, max_width}
+        self.active_streams: Dict[str, dict] = {}  # window_id -> stream state (see start_stream)
+        self._capture_task: Optional[asyncio.Task] = None  # Single producer shared by all streams
+        self._writer_task: Optional[asyncio.Task] = None  # Sends the newest frame per window
+        self._latest_frames: Dict[str, bytes] = {}  # window_id -> newest unsent frame
+        self._frame_ready = asyncio.Event()
+        self._producer_wake = asyncio.Event()  # Cuts the producer's sleep short when streams change
+        # Capture + JPEG encode threads; workers are only spawned as concurrent captures need them
+        self._capture_pool = ThreadPoolExecutor(max_workers=CAPTURE_WORKERS, thread_name_prefix="capture")
+        self._encode_ms_ema = 0.0  # Rolling capture+encode time per frame
+        self._pending_adjust: Dict[str, tuple] = {}  # window_id -> (TimerHandle, merged options)
+        self._adjust_tasks: Set[asyncio.Task] = set()  # Keeps scheduled adjusts alive
         self.reconnection_manager = SmartReconnectionManager()
         self.terminal_sessions: Dict[str, TerminalSession] = {}  # session_id -> TerminalSession
+        self._session: Optional[aiohttp.ClientSession] = None  # Shared across reconnects
+        self._hb_task: Optional[asyncio.Task] = None  # Zombie-connection watchdog
+        self._last_rx = 0.0  # time.monotonic() of the last message from the relay
+        # Slow screen grabs get their own threads so they can't starve the default executor
+        self._screenshot_pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix="screenshot")
+        # One thread for focus + injected input so clicks, scrolls and keys land in arrival order
+        self._input_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="input")
 
         # Host identification for multi-host support
         import socket
@@ -330,377 +521,329 @@ class RelayClient:
         self.platform = platform.system()
         self.platform_version = platform.release()
 
+        # Request dispatch tables, built once
+        self._routes = {
+            ("GET", "/api/apps"): self._h_apps,
+            ("GET", "/api/windows"): self._h_windows,
+            ("POST", "/api/launch-custom"): self._h_launch_custom,
+            ("GET", "/api/system/volume"): self._h_volume_get,
+            ("POST", "/api/system/volume"): self._h_volume_set,
+            ("POST", "/api/system/volume/mute"): self._h_volume_mute,
+            ("GET", "/api/system/brightness"): self._h_brightness_get,
+            ("POST", "/api/system/brightness"): self._h_brightness_set,
+            ("GET", "/api/clipboard"): self._h_clipboard_get,
+            ("POST", "/api/clipboard"): self._h_clipboard_set,
+            ("POST", "/api/paste-image"): self._h_paste_image,
+            ("GET", "/api/rustdesk/status"): self._h_rustdesk_status,
+            ("POST", "/api/rustdesk/connect"): self._h_rustdesk_connect,
+            ("GET", "/api/rustdesk/devices"): self._h_rustdesk_devices,
+            ("GET", "/api/system/info"): self._h_system_info,
+            ("POST", "/api/action/lock"): self._h_action_lock,
+            ("POST", "/api/action/sleep"): self._h_action_sleep,
+            ("POST", "/api/action/screenshot"): self._h_action_screenshot,
+            ("GET", "/api/health"): self._h_health,
+            ("POST", "/api/folders/search"): self._h_folders_search,
+            ("POST", "/api/folders/open"): self._h_folders_open,
+        }
+        self._window_routes = {
+            "focus": self._h_window_focus,
+            "close": self._h_window_close,
+            "minimize": self._h_window_minimize,
+            "maximize": self._h_window_maximize,
+            "restore": self._h_window_restore,
+            "info": self._h_window_info,
+            "snapshot": self._h_window_snapshot,
+        }
+
     async def handle_request(self, request_id: str, endpoint: str, method: str, data: dict = None) -> dict:
         """Handle an incoming request from the relay."""
         try:
-            # Route to appropriate handler
-            if endpoint == "/api/apps" and method == "GET":
-                apps = load_app_config()
-                return {"apps": sorted(apps, key=lambda x: x.get("priority", 99))}
-
-            elif endpoint == "/api/windows" and method == "GET":
-                return {"windows": get_window_list()}
-
-            elif endpoint.startswith("/api/launch/") and method == "POST":
-                app_id = endpoint.split("/")[-1]
-                apps = load_app_config()
-                app_config = next((a for a in apps if a["id"] == app_id), None)
-                if not app_config:
-                    return {"error": "App not found"}
-                subprocess.Popen(
-                    app_config["command"],
-                    shell=True,
-                    stdout=subprocess.DEVNULL,
-                    stderr=subprocess.DEVNULL,
-                    creationflags=subprocess.CREATE_NEW_PROCESS_GROUP | subprocess.DETACHED_PROCESS
-                )
-                return {"status": "launched", "app": app_config["name"]}
-
-            elif endpoint == "/api/launch-custom" and method == "POST":
-                command = data.get("command", "") if data else ""
-                if command:
-                    subprocess.Popen(
-                        command,
-                        shell=True,
-                        stdout=subprocess.DEVNULL,
-                        stderr=subprocess.DEVNULL,
-                        creationflags=subprocess.CREATE_NEW_PROCESS_GROUP | subprocess.DETACHED_PROCESS
-                    )
-                return {"status": "launched"}
+            # Exact (method, path) routes first
+            handler = self._routes.get((method, endpoint))
+            if handler is not None:
+                return await handler(data)
+
+            # /api/windows/<id>/<action> routes (any method, as before); the id is parsed once
+            match = WINDOW_ROUTE_RE.match(endpoint)
+            if match:
+                hwnd, action = int(match.group(1)), match.group(2)
+                if action.startswith("chrome/"):
+                    return await self._h_window_chrome(hwnd, action[7:], data)
+                if action.startswith("snap/"):
+                    return await self._h_window_snap(hwnd, action[5:], data)
+                handler = self._window_routes.get(action)
+                if handler is not None:
+                    return await handler(hwnd, data)
+
+            elif method == "POST" and endpoint.startswith("/api/launch/"):
+                return await self._h_launch(endpoint.rsplit("/", 1)[-1], data)
+
+            return {"error": f"Unknown endpoint: {endpoint}"}
 
-            elif endpoint.startswith("/api/windows/") and "/focus" in endpoint:
-                window_id = endpoint.split("/")[3]
-                if HAS_WIN32:
+        except Exception as e:
+            return {"error": str(e)}
+
+    # ========== REQUEST HANDLERS ==========
+
+    async def _run_blocking(self, func, *args, executor=None):
+        """Run a blocking call in a thread so streams and requests keep flowing."""
+        return await asyncio.get_running_loop().run_in_executor(executor, func, *args)
+
+    async def _h_apps(self, data):
+        return {"apps": get_sorted_apps()}
+
+    async def _h_windows(self, data):
+        return {"windows": await self._run_blocking(get_window_list)}
+
+    async def _h_launch(self, app_id: str, data):
+        app_config = get_app_by_id(app_id)
+        if not app_config:
+            return {"error": "App not found"}
+        await self._run_blocking(_sync_launch, app_config["command"])
+        return {"status": "launched", "app": app_config["name"]}
+
+    async def _h_launch_custom(self, data):
+        command = data.get("command", "") if data else ""
+        if command:
+            await self._run_blocking(_sync_launch, command)
+        return {"status": "launched"}
+
+    async def _h_window_focus(self, hwnd: int, data):
+        if HAS_WIN32:
+            await self._run_blocking(_sync_focus, hwnd)
+        return {"status": "focused"}
+
+    async def _h_window_close(self, hwnd: int, data):
+        if HAS_WIN32:
+            await self._run_blocking(win32gui.PostMessage, hwnd, win32con.WM_CLOSE, 0, 0)
+        return {"status": "closed"}
+
+    async def _h_window_minimize(self, hwnd: int, data):
+        if HAS_WIN32:
+            await self._run_blocking(win32gui.ShowWindow, hwnd, win32con.SW_MINIMIZE)
+        return {"status": "minimized"}
+
+    async def _h_window_maximize(self, hwnd: int, data):
+        if HAS_WIN32:
+            await self._run_blocking(win32gui.ShowWindow, hwnd, win32con.SW_MAXIMIZE)
+        return {"status": "maximized"}
+
+    async def _h_window_restore(self, hwnd: int, data):
+        if HAS_WIN32:
+            await self._run_blocking(win32gui.ShowWindow, hwnd, win32con.SW_RESTORE)
+        return {"status": "restored"}
+
+    async def _h_window_snap(self, hwnd: int, position: str, data):
+        layout = SNAP_LAYOUTS.get(position)
+        if layout is None:
+            return {"error": f"Unknown snap position: {position}"}
+        if HAS_WIN32:
+            await self._run_blocking(_sync_snap, hwnd, layout)
+        return {"status": "snapped_" + position.replace("-", "_")}
+
+    async def _h_window_info(self, hwnd: int, data):
+        if HAS_CAPTURE:
+            return await self._run_blocking(WindowCapture.get_window_info, hwnd)
+        return {"error": "Window capture not available"}
+
+    async def _h_window_snapshot(self, hwnd: int, data):
+        quality = data.get("quality", 60) if data else 60
+        max_width = data.get("max_width", 800) if data else 800
+        if HAS_CAPTURE:
+            result = await self._run_blocking(
+                WindowCapture.capture_window, hwnd, quality, max_width,
+                executor=self._capture_pool
+            )
+            if result:
+                jpeg_bytes, width, height = result
+                b64_data = base64.b64encode(jpeg_bytes).decode('ascii')
+                return {"frame": b64_data, "width": width, "height": height, "window_id": str(hwnd)}
+            return {"error": "Window not available"}
+        return {"error": "Window capture not available"}
+
+    async def _h_window_chrome(self, hwnd: int, action: str, data):
+        if not HAS_CAPTURE or ChromeController is None:
+            return {"error": "Chrome control not available"}
+
+        if action == "navigate":
+            url = data.get("url", "") if data else ""
+            success = await self._run_blocking(ChromeController.navigate_to_url, hwnd, url)
+        elif action in CHROME_ACTIONS:
+            success = await self._run_blocking(getattr(ChromeController, CHROME_ACTIONS[action]), hwnd)
+        else:
+            return {"error": f"Unknown chrome action: {action}"}
+
+        return {"status": "success" if success else "failed"}
+
+    async def _h_volume_get(self, data):
+        return await run_com(get_volume)
+
+    async def _h_volume_set(self, data):
+        level = data.get("level", 50) if data else 50
+        return await run_com(set_volume, level)
+
+    async def _h_volume_mute(self, data):
+        if HAS_PYCAW:
+            muted = await run_com(toggle_endpoint_mute)
+            return {"status": "toggled", "muted": muted}
+        return {"error": "pycaw not available"}
+
+    async def _h_brightness_get(self, data):
+        return await run_com(get_brightness)
+
+    async def _h_brightness_set(self, data):
+        level = data.get("level", 100) if data else 100
+        return await run_com(set_brightness, level)
+
+    async def _h_clipboard_get(self, data):
+        try:
+            content = await self._run_blocking(_get_clipboard_text)
+            return {"content": content[:1000]}
+        except:
+            return {"content": "", "error": "Clipboard error"}
+
+    async def _h_clipboard_set(self, data):
+        content = data.get("content", "") if data else ""
+        await self._run_blocking(_set_clipboard_text, content)
+        return {"status": "copied"}
+
+    async def _h_paste_image(self, data):
+        # Clipboard work and the paste key sequence sleep between steps
+        return await self._run_blocking(self._paste_image_sync, data)
+
+    def _paste_image_sync(self, data):
+        """Paste image to clipboard and simulate Ctrl+V (runs in an executor)."""
+        try:
+            import io
+            from PIL import Image
+            import win32clipboard
+
+            image_b64 = data.get("image", "") if data else ""
+            window_id = data.get("window_id", "") if data else ""
+
+            if not image_b64:
+                return {"error": "No image data"}
+
+            # Decode base64 to image
+            image_data = base64.b64decode(image_b64)
+            image = Image.open(io.BytesIO(image_data))
+
+            # Convert to BMP format for clipboard
+            output = io.BytesIO()
+            image.convert("RGB").save(output, "BMP")
+            bmp_data = output.getvalue()[14:]  # Strip BMP header
+            output.close()
+
+            # Copy to clipboard
+            win32clipboard.OpenClipboard()
+            win32clipboard.EmptyClipboard()
+            win32clipboard.SetClipboardData(win32clipboard.CF_DIB, bmp_data)
+            win32clipboard.CloseClipboard()
+
+            # Focus the target window before pasting
+            if window_id and HAS_WIN32:
+                try:
                     hwnd = int(window_id)
                     if win32gui.IsIconic(hwnd):
                         win32gui.ShowWindow(hwnd, win32con.SW_RESTORE)
                     win32gui.SetForegroundWindow(hwnd)
-                return {"status": "focused"}
-
-            elif endpoint.startswith("/api/windows/") and "/close" in endpoint:
-                window_id = endpoint.split("/")[3]
-                if HAS_WIN32:
-                    hwnd = int(window_id)
-                    win32gui.PostMessage(hwnd, win32con.WM_CLOSE, 0, 0)
-                return {"status": "closed"}
-
-            elif endpoint.startswith("/api/windows/") and "/minimize" in endpoint:
-                window_id = endpoint.split("/")[3]
-                if HAS_WIN32:
-                    hwnd = int(window_id)
-                    win32gui.ShowWindow(hwnd, win32con.SW_MINIMIZE)
-                return {"status": "minimized"}
-
-            elif endpoint.startswith("/api/windows/") and "/maximize" in endpoint:
-                window_id = endpoint.split("/")[3]
-                if HAS_WIN32:
-                    hwnd = int(window_id)
-                    win32gui.ShowWindow(hwnd, win32con.SW_MAXIMIZE)
-                return {"status": "maximized"}
-
-            elif endpoint.startswith("/api/windows/") and "/restore" in endpoint:
-                window_id = endpoint.split("/")[3]
-                if HAS_WIN32:
-                    hwnd = int(window_id)
-                    win32gui.ShowWindow(hwnd, win32con.SW_RESTORE)
-                return {"status": "restored"}
-
-            elif endpoint.startswith("/api/windows/") and "/snap/left" in endpoint:
-                window_id = endpoint.split("/")[3]
-                if HAS_WIN32:
-                    hwnd = int(window_id)
-                    screen_width = win32api.GetSystemMetrics(0)
-                    screen_height = win32api.GetSystemMetrics(1)
-                    win32gui.ShowWindow(hwnd, win32con.SW_RESTORE)
-                    win32gui.SetWindowPos(hwnd, None, 0, 0, screen_width // 2, screen_height, 0)
-                return {"status": "snapped_left"}
-
-            elif endpoint.startswith("/api/windows/") and "/snap/right" in endpoint:
-                window_id = endpoint.split("/")[3]
-                if HAS_WIN32:
-                    hwnd = int(window_id)
-                    screen_width = win32api.GetSystemMetrics(0)
-                    screen_height = win32api.GetSystemMetrics(1)
-                    win32gui.ShowWindow(hwnd, win32con.SW_RESTORE)
-                    win32gui.SetWindowPos(hwnd, None, screen_width // 2, 0, screen_width // 2, screen_height, 0)
-                return {"status": "snapped_right"}
-
-            elif endpoint.startswith("/api/windows/") and "/snap/top-left" in endpoint:
-                window_id = endpoint.split("/")[3]
-                if HAS_WIN32:
-                    hwnd = int(window_id)
-                    screen_width = win32api.GetSystemMetrics(0)
-                    screen_height = win32api.GetSystemMetrics(1)
-                    win32gui.ShowWindow(hwnd, win32con.SW_RESTORE)
-                    win32gui.SetWindowPos(hwnd, None, 0, 0, screen_width // 2, screen_height // 2, 0)
-                return {"status": "snapped_top_left"}
-
-            elif endpoint.startswith("/api/windows/") and "/snap/top-right" in endpoint:
-                window_id = endpoint.split("/")[3]
-                if HAS_WIN32:
-                    hwnd = int(window_id)
-                    screen_width = win32api.GetSystemMetrics(0)
-                    screen_height = win32api.GetSystemMetrics(1)
-                    win32gui.ShowWindow(hwnd, win32con.SW_RESTORE)
-                    win32gui.SetWindowPos(hwnd, None, screen_width // 2, 0, screen_width // 2, screen_height // 2, 0)
-                return {"status": "snapped_top_right"}
-
-            elif endpoint.startswith("/api/windows/") and "/snap/bottom-left" in endpoint:
-                window_id = endpoint.split("/")[3]
-                if HAS_WIN32:
-                    hwnd = int(window_id)
-                    screen_width = win32api.GetSystemMetrics(0)
-                    screen_height = win32api.GetSystemMetrics(1)
-                    win32gui.ShowWindow(hwnd, win32con.SW_RESTORE)
-                    win32gui.SetWindowPos(hwnd, None, 0, screen_height // 2, screen_width // 2, screen_height // 2, 0)
-                return {"status": "snapped_bottom_left"}
-
-            elif endpoint.startswith("/api/windows/") and "/snap/bottom-right" in endpoint:
-                window_id = endpoint.split("/")[3]
-                if HAS_WIN32:
-                    hwnd = int(window_id)
-                    screen_width = win32api.GetSystemMetrics(0)
-                    screen_height = win32api.GetSystemMetrics(1)
-                    win32gui.ShowWindow(hwnd, win32con.SW_RESTORE)
-                    win32gui.SetWindowPos(hwnd, None, screen_width // 2, screen_height // 2, screen_width // 2, screen_height // 2, 0)
-                return {"status": "snapped_bottom_right"}
-
-            elif endpoint == "/api/system/volume" and method == "GET":
-                return get_volume()
-
-            elif endpoint == "/api/system/volume" and method == "POST":
-                level = data.get("level", 50) if data else 50
-                return set_volume(level)
-
-            elif endpoint == "/api/system/volume/mute" and method == "POST":
-                if HAS_PYCAW:
-                    from pycaw.pycaw import AudioUtilities
-                    speakers = AudioUtilities.GetSpeakers()
-                    volume = speakers.EndpointVolume
-                    current_mute = volume.GetMute()
-                    volume.SetMute(not current_mute, None)
-                    return {"status": "toggled", "muted": not current_mute}
-                return {"error": "pycaw not available"}
-
-            elif endpoint == "/api/system/brightness" and method == "GET":
-                return get_brightness()
-
-            elif endpoint == "/api/system/brightness" and method == "POST":
-                level = data.get("level", 100) if data else 100
-                return set_brightness(level)
-
-            elif endpoint == "/api/clipboard" and method == "GET":
-                try:
-                    content = pyperclip.paste()
-                    return {"content": content[:1000]}
-                except:
-                    return {"content": "", "error": "Clipboard error"}
-
-            elif endpoint == "/api/clipboard" and method == "POST":
-                content = data.get("content", "") if data else ""
-                pyperclip.copy(content)
-                return {"status": "copied"}
-
-            elif endpoint == "/api/paste-image" and method == "POST":
-                # Paste image to clipboard and simulate Ctrl+V
-                try:
-                    import base64
-                    import io
-                    from PIL import Image
-                    import win32clipboard
-
-                    image_b64 = data.get("image", "") if data else ""
-                    window_id = data.get("window_id", "") if data else ""
-
-                    if not image_b64:
-                        return {"error": "No image data"}
-
-                    # Decode base64 to image
-                    image_data = base64.b64decode(image_b64)
-                    image = Image.open(io.BytesIO(image_data))
-
-                    # Convert to BMP format for clipboard
-                    output = io.BytesIO()
-                    image.convert("RGB").save(output, "BMP")
-                    bmp_data = output.getvalue()[14:]  # Strip BMP header
-                    output.close()
-
-                    # Copy to clipboard
-                    win32clipboard.OpenClipboard()
-                    win32clipboard.EmptyClipboard()
-                    win32clipboard.SetClipboardData(win32clipboard.CF_DIB, bmp_data)
-                    win32clipboard.CloseClipboard()
-
-                    # Focus the target window before pasting
-                    if window_id and HAS_WIN32:
-                        try:
-                            hwnd = int(window_id)
-                            if win32gui.IsIconic(hwnd):
-                                win32gui.ShowWindow(hwnd, win32con.SW_RESTORE)
-                            win32gui.SetForegroundWindow(hwnd)
-                            time.sleep(0.15)  # Give window time to focus
-                        except Exception as e:
-                            print(f"[PASTE-IMAGE] Could not focus window: {e}")
-
-                    # Simulate paste - try multiple methods for different terminals
-                    time.sleep(0.1)
-
-                    # For Windows Terminal / Claude Code, right-click is most reliable for images
-                    pyautogui.click(button='right')
-                    time.sleep(0.2)
-
-                    # Also try keyboard shortcuts as fallback
-                    pyautogui.hotkey('ctrl', 'v')
-                    time.sleep(0.1)
-                    pyautogui.hotkey('ctrl', 'shift', 'v')
-
-                    print(f"[PASTE-IMAGE] Image pasted to window {window_id}")
-                    return {"status": "pasted"}
+                    time.sleep(0.15)  # Give window time to focus
                 except Exception as e:
-                    return {"error": str(e)}
+                    log.warning("[PASTE-IMAGE] Could not focus window: %s", e)
 
-            elif endpoint == "/api/rustdesk/status" and method == "GET":
-                return get_rustdesk_status()
+            # Simulate paste - try multiple methods for different terminals
+            time.sleep(0.1)
 
-            elif endpoint == "/api/rustdesk/connect" and method == "POST":
-                # Connect to a RustDesk device by ID
-                device_id = data.get("device_id") if data else None
-                if not device_id:
-                    return {"error": "device_id required"}
-                try:
-                    # Find RustDesk executable
-                    rustdesk_paths = [
-                        r"C:\Program Files\RustDesk\rustdesk.exe",
-                        r"C:\Program Files (x86)\RustDesk\rustdesk.exe",
-                        os.path.expanduser(r"~\AppData\Local\RustDesk\rustdesk.exe"),
-                    ]
-                    rustdesk_exe = None
-                    for path in rustdesk_paths:
-                        if os.path.exists(path):
-                            rustdesk_exe = path
-                            break
+            # For Windows Terminal / Claude Code, right-click is most reliable for images
+            pyautogui.click(button='right')
+            time.sleep(0.2)
 
-                    if not rustdesk_exe:
-                        return {"error": "RustDesk not found"}
+            # Also try keyboard shortcuts as fallback
+            pyautogui.hotkey('ctrl', 'v')
+            time.sleep(0.1)
+            pyautogui.hotkey('ctrl', 'shift', 'v')
 
-                    # Launch RustDesk with connection
-                    subprocess.Popen([rustdesk_exe, "--connect", str(device_id)])
-                    print(f"[RUSTDESK] Connecting to device: {device_id}")
-                    return {"status": "connecting", "device_id": device_id}
-                except Exception as e:
-                    return {"error": str(e)}
-
-            elif endpoint == "/api/rustdesk/devices" and method == "GET":
-                # Return saved RustDesk devices
-                return {
-                    "devices": [
-                        {"id": "415005013", "name": "Network Device", "description": "Available on current network"}
-                    ]
-                }
-
-            elif endpoint == "/api/system/info" and method == "GET":
-                return get_system_info()
-
-            elif endpoint == "/api/action/lock" and method == "POST":
-                ctypes.windll.user32.LockWorkStation()
-                return {"status": "locked"}
-
-            elif endpoint == "/api/action/sleep" and method == "POST":
-                subprocess.run(
-                    ["rundll32.exe", "powrprof.dll,SetSuspendState", "0", "1", "0"],
-                    check=True
-                )
-                return {"status": "sleeping"}
+            log.info("[PASTE-IMAGE] Image pasted to window %s", window_id)
+            return {"status": "pasted"}
+        except Exception as e:
+            return {"error": str(e)}
 
-            elif endpoint == "/api/action/screenshot" and method == "POST":
-                try:
-                    import pyautogui
-                    screenshot_path = Path.home() / "Pictures" / f"screenshot_{datetime.now().strftime('%Y%m%d_%H%M%S')}.png"
-                    screenshot_path.parent.mkdir(parents=True, exist_ok=True)
-                    screenshot = pyautogui.screenshot()
-                    screenshot.save(str(screenshot_path))
-                    return {"status": "captured", "path": str(screenshot_path)}
-                except:
-                    return {"status": "error", "error": "Screenshot failed"}
-
-            elif endpoint == "/api/health" and method == "GET":
-                return {"status": "ok", "timestamp": datetime.now().isoformat(), "platform": "windows"}
-
-            # Window info endpoint
-            elif endpoint.startswith("/api/windows/") and "/info" in endpoint:
-                window_id = endpoint.split("/")[3]
-                if HAS_CAPTURE:
-                    return WindowCapture.get_window_info(int(window_id))
-                return {"error": "Window capture not available"}
-
-            # Window snapshot endpoint
-            elif endpoint.startswith("/api/windows/") and "/snapshot" in endpoint:
-                window_id = endpoint.split("/")[3]
-                quality = data.get("quality", 60) if data else 60
-                max_width = data.get("max_width", 800) if data else 800
-                if HAS_CAPTURE:
-                    result = WindowCapture.capture_window(int(window_id), quality=quality, max_width=max_width)
-                    if result:
-                        b64_data, width, height = result[0], result[1], result[2]
-                        return {"frame": b64_data, "width": width, "height": height, "window_id": window_id}
-                    return {"error": "Window not available"}
-                return {"error": "Window capture not available"}
-
-            # Chrome control endpoints
-            elif endpoint.startswith("/api/windows/") and "/chrome/" in endpoint:
-                parts = endpoint.split("/")
-                window_id = parts[3]
-                action = parts[5]  # navigate, back, forward, refresh, etc.
-                hwnd = int(window_id)
+    async def _h_rustdesk_status(self, data):
+        return await self._run_blocking(get_rustdesk_status)
 
-                if not HAS_CAPTURE or ChromeController is None:
-                    return {"error": "Chrome control not available"}
-
-                if action == "navigate":
-                    url = data.get("url", "") if data else ""
-                    success = ChromeController.navigate_to_url(hwnd, url)
-                elif action == "back":
-                    success = ChromeController.go_back(hwnd)
-                elif action == "forward":
-                    success = ChromeController.go_forward(hwnd)
-                elif action == "refresh":
-                    success = ChromeController.refresh(hwnd)
-                elif action == "new-tab":
-                    success = ChromeController.new_tab(hwnd)
-                elif action == "close-tab":
-                    success = ChromeController.close_tab(hwnd)
-                elif action == "next-tab":
-                    success = ChromeController.next_tab(hwnd)
-                elif action == "prev-tab":
-                    success = ChromeController.prev_tab(hwnd)
-                else:
-                    return {"error": f"Unknown chrome action: {action}"}
+    async def _h_rustdesk_connect(self, data):
+        # Connect to a RustDesk device by ID
+        device_id = data.get("device_id") if data else None
+        if not device_id:
+            return {"error": "device_id required"}
+        try:
+            # Find RustDesk executable
+            rustdesk_paths = [
+                r"C:\Program Files\RustDesk\rustdesk.exe",
+                r"C:\Program Files (x86)\RustDesk\rustdesk.exe",
+                os.path.expanduser(r"~\AppData\Local\RustDesk\rustdesk.exe"),
+            ]
+            rustdesk_exe = None
+            for path in rustdesk_paths:
+                if os.path.exists(path):
+                    rustdesk_exe = path
+                    break
 
-                return {"status": "success" if success else "failed"}
+            if not rustdesk_exe:
+                return {"error": "RustDesk not found"}
 
-            # Folders API endpoints
-            elif endpoint == "/api/folders/search" and method == "POST":
-                query = data.get("query", "") if data else ""
-                if not query:
-                    return {"error": "No query provided"}
-                result = await self.search_folder_with_claude(query)
-                return result
+            # Launch RustDesk with connection
+            await self._run_blocking(subprocess.Popen, [rustdesk_exe, "--connect", str(device_id)])
+            log.info("[RUSTDESK] Connecting to device: %s", device_id)
+            return {"status": "connecting", "device_id": device_id}
+        except Exception as e:
+            return {"error": str(e)}
 
-            elif endpoint == "/api/folders/open" and method == "POST":
-                path = data.get("path", "") if data else ""
-                if not path:
-                    return {"error": "No path provided"}
-                result = self.open_folder(path)
-                return result
+    async def _h_rustdesk_devices(self, data):
+        # Return saved RustDesk devices
+        return {
+            "devices": [
+                {"id": "415005013", "name": "Network Device", "description": "Available on current network"}
+            ]
+        }
 
-            else:
-                return {"error": f"Unknown endpoint: {endpoint}"}
+    async def _h_system_info(self, data):
+        return await self._run_blocking(get_system_info)
 
-        except Exception as e:
-            return {"error": str(e)}
+    async def _h_action_lock(self, data):
+        await self._run_blocking(ctypes.windll.user32.LockWorkStation)
+        return {"status": "locked"}
 
-    async def search_folder_with_claude(self, query: str) -> dict:
-        """Use Claude API to find a folder based on user description."""
+    async def _h_action_sleep(self, data):
+        await self._run_blocking(suspend_system)
+        return {"status": "sleeping"}
+
+    async def _h_action_screenshot(self, data):
+        try:
+            path = await self._run_blocking(save_screenshot, executor=self._screenshot_pool)
+            return {"status": "captured", "path": path}
+        except:
+            return {"status": "error", "error": "Screenshot failed"}
+
+    async def _h_health(self, data):
+        return {"status": "ok", "timestamp": datetime.now().isoformat(), "platform": "windows"}
+
+    async def _h_folders_search(self, data):
+        query = data.get("query", "") if data else ""
+        if not query:
+            return {"error": "No query provided"}
+        result = await self._run_blocking(self.search_folder_with_claude, query)
+        return result
+
+    async def _h_folders_open(self, data):
+        path = data.get("path", "") if data else ""
+        if not path:
+            return {"error": "No path provided"}
+        result = await self._run_blocking(self.open_folder, path)
+        return result
+
+    def search_folder_with_claude(self, query: str) -> dict:
+        """Use Claude API to find a folder based on user description (blocking)."""
         try:
             import anthropic
 
@@ -780,7 +923,7 @@ Always use backslashes for Windows paths."""
             return {"error": str(e)}
 
     def open_folder(self, path: str) -> dict:
-        """Open a folder in Windows Explorer."""
+        """Open a folder in Windows Explorer (blocking)."""
         try:
             # Normalize the path
             path = os.path.normpath(path)
@@ -807,77 +950,222 @@ Always use backslashes for Windows paths."""
         # Stop existing stream if any
         await self.stop_stream(window_id)
 
+        if len(self.active_streams) >= MAX_STREAMS:
+            await self.send_stream_error(window_id, f"Too many active streams (max {MAX_STREAMS})")
+            return
+
         fps = options.get("fps", 8)
         quality = options.get("quality", 60)
         max_width = options.get("max_width", 800)
 
-        self.stream_options[window_id] = {"fps": fps, "quality": quality, "max_width": max_width}
-        self.active_streams[window_id] = asyncio.create_task(
-            self._capture_loop(window_id, fps, quality, max_width)
-        )
+        # Halve the new stream's FPS if the projected encode load would exceed the workers
+        budget_ms = 1000.0 * min(CAPTURE_WORKERS, os.cpu_count() or 1)
+        load_fps = sum(state["fps"] for state in self.active_streams.values())
+        requested_fps = fps
+        while fps > 1 and (load_fps + fps) * self._encode_ms_ema > budget_ms:
+            fps = max(1, fps // 2)
+        if fps != requested_fps:
+            await self.send_stream_status(window_id, "downgraded", fps=fps)
+
+        self.active_streams[window_id] = {
+            "session": WindowCaptureSession(int(window_id)),  # Reuses the DIB surface between frames
+            "hash": window_id_hash(window_id),
+            "fps": fps,
+            "quality": quality,
+            "max_width": max_width,
+            "downlink": options.get("downlink"),
+            # Works under the quality/max_width ceilings to keep captures within the frame interval
+            "encoder": AdaptiveEncoder(quality, max_width, fps, options.get("downlink")),
+            "interval": 1.0 / fps,
+            "next": asyncio.get_running_loop().time(),
+            "seq": 0,
+            "dropped": 0,
+            "last_hash": None,
+            "last_keyframe": 0.0,
+            "send_ms": 0.0,  # Duration of the last frame send, fed to the encoder
+        }
+        if self._capture_task is None or self._capture_task.done():
+            self._capture_task = asyncio.create_task(self._capture_producer())
+        else:
+            self._producer_wake.set()  # The new stream is due now, not at the next existing deadline
+        if self._writer_task is None or self._writer_task.done():
+            self._writer_task = asyncio.create_task(self._frame_writer())
+
+        log.info("Started stream for window %s at %s FPS", window_id, fps)
+
+    def schedule_adjust(self, window_id: str, options: dict):
+        """Debounce stream_adjust: merge options and apply them once input settles."""
+        pending = self._pending_adjust.get(window_id)
+        if pending is not None:
+            pending[0].cancel()
+            options = {**pending[1], **options}
+        handle = asyncio.get_running_loop().call_later(ADJUST_DEBOUNCE, self._apply_adjust, window_id)
+        self._pending_adjust[window_id] = (handle, options)
+
+    def _apply_adjust(self, window_id: str):
+        """Timer callback: apply the last merged options for a window."""
+        _, options = self._pending_adjust.pop(window_id)
+        task = asyncio.create_task(self.adjust_stream(window_id, options))
+        self._adjust_tasks.add(task)
+        task.add_done_callback(self._adjust_tasks.discard)
+
+    async def adjust_stream(self, window_id: str, options: dict):
+        """Change a running stream's settings in place (the producer reads them every tick)."""
+        state = self.active_streams.get(window_id)
+        if state is None:
+            await self.start_stream(window_id, options)
+            return
 
-        print(f"Started stream for window {window_id} at {fps} FPS")
+        for key in ("fps", "quality", "max_width"):
+            if key in options:
+                state[key] = options[key]
+        state["interval"] = 1.0 / state["fps"]
+        # A faster rate takes effect now rather than after the old, longer interval
+        state["next"] = min(state["next"], asyncio.get_running_loop().time() + state["interval"])
+        self._producer_wake.set()
+        state["encoder"] = AdaptiveEncoder(state["quality"], state["max_width"], state["fps"], state["downlink"])
+        log.info("Adjusted stream for window %s: %s FPS, q%s, %spx", window_id, state['fps'], state['quality'], state['max_width'])
 
     async def stop_stream(self, window_id: str):
         """Stop streaming a window."""
-        if window_id in self.active_streams:
-            self.active_streams[window_id].cancel()
-            try:
-                await self.active_streams[window_id]
-            except asyncio.CancelledError:
-                pass
-            del self.active_streams[window_id]
-            if window_id in self.stream_options:
-                del self.stream_options[window_id]
-            print(f"Stopped stream for window {window_id}")
-
-    async def _capture_loop(self, window_id: str, fps: int, quality: int, max_width: int):
-        """Capture and stream frames (non-blocking)."""
-        interval = 1.0 / fps
-        hwnd = int(window_id)
-        seq = 0
+        pending = self._pending_adjust.pop(window_id, None)
+        if pending is not None:
+            pending[0].cancel()
+        self._latest_frames.pop(window_id, None)
+        state = self.active_streams.pop(window_id, None)
+        if state is not None:
+            self._close_session(state)
+            # The producer exits on its own once no streams remain
+            log.info("Stopped stream for window %s (%s sent, %s dropped)", window_id, state['seq'], state['dropped'])
+
+    def _close_session(self, state: dict):
+        """Free a stream's capture surface once any capture in flight has finished."""
+        self._capture_pool.submit(state["session"].close)
+
+    async def _capture_producer(self):
+        """Capture every due stream in one batch per tick (non-blocking)."""
+        # Hot-loop locals: one lookup here instead of several per frame
+        loop = asyncio.get_running_loop()
+        clock = loop.time
+        run_in_executor = loop.run_in_executor
+        pool = self._capture_pool
+        pack_header = FRAME_HEADER.pack
+        streams = self.active_streams  # Mutated in place, never rebound
+        frame_ready = self._frame_ready
+        wake = self._producer_wake
+
+        while streams:
+            now = clock()
+            due = []
+            for window_id, state in streams.items():
+                if state["next"] > now:
+                    continue
+                if now - state["next"] > state["interval"]:
+                    # More than a whole interval late: drop this tick and resync
+                    # the deadline rather than bursting to catch up
+                    state["next"] = now + state["interval"]
+                    state["dropped"] += 1
+                    continue
+                due.append((window_id, state))
+
+            if due:
+                # Use the capture pool so encodes overlap across streams
+                batch_start = clock()
+                results = await asyncio.gather(*[
+                    run_in_executor(
+                        pool, state["session"].capture_if_changed,
+                        state["encoder"].quality, state["encoder"].max_width,
+                        # Forget the hash periodically to force a keyframe
+                        state["last_hash"] if now - state["last_keyframe"] < KEYFRAME_INTERVAL else None
+                    )
+                    for _, state in due
+                ], return_exceptions=True)
+                # Captures in a batch run in parallel, so batch time ~ per-frame time
+                batch_ms = (clock() - batch_start) * 1000
+                self._encode_ms_ema = 0.9 * self._encode_ms_ema + 0.1 * batch_ms
+
+                for (window_id, state), result in zip(due, results):
+                    if streams.get(window_id) is not state:
+                        continue  # Stopped or restarted while capturing
+
+                    if result is None or isinstance(result, Exception):
+                        del streams[window_id]
+                        self._close_session(state)
+                        if result is None:
+                            await self.send_stream_error(window_id, "Window not available")
+                        else:
+                            log.warning("Capture error: %s", result)
+                            await self.send_stream_error(window_id, str(result))
+                        continue
+
+                    jpeg_bytes, width, height, frame_hash = result
+                    state["next"] += state["interval"]
+                    if jpeg_bytes is None:
+                        continue  # Window unchanged since the last frame; nothing to send
+
+                    state["encoder"].update(state["session"].last_ms, state["send_ms"])
+                    state["last_hash"] = frame_hash
+                    state["last_keyframe"] = now
+                    state["seq"] += 1
+
+                    # Binary frame: 12-byte header + raw JPEG. Overwriting keeps only
+                    # the newest frame per window if the writer falls behind.
+                    # (_latest_frames is swapped by the writer, so it isn't hoisted.)
+                    header = pack_header(state["hash"], width, height, state["seq"] & 0xFFFFFFFF)
+                    self._latest_frames[window_id] = header + jpeg_bytes
+                    frame_ready.set()
+
+            if streams:
+                next_due = min(state["next"] for state in streams.values())
+                # Sleep until the earliest deadline, or until start/adjust_stream moves one earlier
+                wake.clear()
+                try:
+                    await asyncio.wait_for(wake.wait(), max(0.0, next_due - clock()))
+                except asyncio.TimeoutError:
+                    pass
 
+    async def _frame_writer(self):
+        """Send the latest captured frame of each window, dropping stale ones."""
         while True:
-            try:
-                # Use thread pool for non-blocking window capture
-                loop = asyncio.get_event_loop()
-                result = await loop.run_in_executor(
-                    None,  # Default executor
-                    WindowCapture.capture_window,
-                    hwnd, quality, max_width
-                )
+            await self._frame_ready.wait()
+            self._frame_ready.clear()
+            frames, self._latest_frames = self._latest_frames, {}
 
-                if result is None:
-                    await self.send_stream_error(window_id, "Window not available")
+            for window_id, frame in frames.items():
+                if not self.ws:
+                    break
+                try:
+                    start = time.perf_counter()
+                    await self.ws.send_bytes(frame)
+                    state = self.active_streams.get(window_id)
+                    if state is not None:
+                        state["send_ms"] = (time.perf_counter() - start) * 1000
+                except Exception as e:
+                    log.warning("Frame send error: %s", e)
                     break
 
-                b64_data, width, height, jpeg_bytes = result
-                seq += 1
-
-                # Send binary frame: 12-byte header + raw JPEG
-                if self.ws:
-                    window_id_hash = hash(window_id) & 0xFFFFFFFF
-                    header = struct.pack('<IHHI', window_id_hash, width, height, seq & 0xFFFFFFFF)
-                    await self.ws.send_bytes(header + jpeg_bytes)
-
-                await asyncio.sleep(interval)
-
-            except asyncio.CancelledError:
-                break
-            except Exception as e:
-                print(f"Capture error: {e}")
-                await self.send_stream_error(window_id, str(e))
-                break
+    async def send_stream_status(self, window_id: str, status: str, **extra):
+        """Send stream status to relay."""
+        if self.ws:
+            try:
+                await self.ws.send_str(_json_dumps({
+                    "type": "stream_status",
+                    "window_id": window_id,
+                    "status": status,
+                    **extra
+                }))
+            except:
+                pass
 
     async def send_stream_error(self, window_id: str, error: str):
         """Send stream error to relay."""
         if self.ws:
             try:
-                await self.ws.send_json({
+                await self.ws.send_str(_json_dumps({
                     "type": "stream_error",
                     "window_id": window_id,
                     "error": error
-                })
+                }))
             except:
                 pass
 
@@ -889,21 +1177,36 @@ Always use backslashes for Windows paths."""
 
         if self.ws:
             try:
-                await self.ws.send_json({
+                await self.ws.send_str(_json_dumps({
                     "type": "health_pong",
                     "ping_id": ping_id,
                     "server_timestamp": server_timestamp,
                     "client_timestamp": current_time,
                     "latency": (current_time - server_timestamp) * 1000
-                })
-                print(f"[HEALTH] Responded to ping {ping_id}")
+                }))
+                log.debug("[HEALTH] Responded to ping %s", ping_id)
             except Exception as e:
-                print(f"[HEALTH] Failed to respond to ping: {e}")
+                log.warning("[HEALTH] Failed to respond to ping: %s", e)
 
     async def stop_all_streams(self):
         """Stop all active streams."""
-        for window_id in list(self.active_streams.keys()):
-            await self.stop_stream(window_id)
+        if self.active_streams:
+            log.info("Stopping %s stream(s)", len(self.active_streams))
+        for state in self.active_streams.values():
+            self._close_session(state)
+        self.active_streams.clear()
+        self._latest_frames.clear()
+        for handle, _ in self._pending_adjust.values():
+            handle.cancel()
+        self._pending_adjust.clear()
+
+        # Cancel the producer and writer together, then wait for both at once
+        tasks = [t for t in (self._capture_task, self._writer_task) if t is not None and not t.done()]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._capture_task = None
+        self._writer_task = None
 
     # ========== TERMINAL SESSION METHODS ==========
 
@@ -917,7 +1220,7 @@ Always use backslashes for Windows paths."""
         session.start()
         self.terminal_sessions[session_id] = session
 
-        print(f"Started terminal session: {session_id}")
+        log.info("Started terminal session: %s", session_id)
 
         # Send initial output
         await self._flush_terminal_output(session_id)
@@ -962,20 +1265,20 @@ Always use backslashes for Windows paths."""
         """Send terminal output to the relay."""
         if self.ws:
             try:
-                await self.ws.send_json({
+                await self.ws.send_str(_json_dumps({
                     "type": "terminal_output",
                     "session_id": session_id,
                     **output
-                })
+                }))
             except Exception as e:
-                print(f"Error sending terminal output: {e}")
+                log.warning("Error sending terminal output: %s", e)
 
     async def stop_terminal(self, session_id: str):
         """Stop a terminal session."""
         session = self.terminal_sessions.pop(session_id, None)
         if session:
             session.stop()
-            print(f"Stopped terminal session: {session_id}")
+            log.info("Stopped terminal session: %s", session_id)
 
     async def stop_all_terminals(self):
         """Stop all terminal sessions."""
@@ -985,67 +1288,48 @@ Always use backslashes for Windows paths."""
     # ========== KEYSTROKE FORWARDING ==========
 
     async def send_keystroke_to_window(self, window_id: str, key: str, modifiers: dict):
-        """Send a keystroke to an actual window using PostMessage."""
+        """Send a keystroke to an actual window using one batched SendInput."""
         if not HAS_WIN32:
-            print("[KEYSTROKE] pywin32 not available")
+            log.warning("[KEYSTROKE] pywin32 not available")
+            return
+        if send_key_batch is None:
+            log.warning("[KEYSTROKE] window_capture not available, cannot send input")
             return
 
         try:
-            import win32api
-            import time
-
             # Parse window ID (hex string to int)
             if window_id.startswith("0x"):
                 hwnd = int(window_id, 16)
             else:
                 hwnd = int(window_id)
 
-            # Focus the window first
-            try:
-                win32gui.SetForegroundWindow(hwnd)
-                time.sleep(0.05)
-            except Exception as e:
-                print(f"[KEYSTROKE] Could not focus window: {e}")
-
-            # Get modifier states
-            ctrl = modifiers.get("ctrl", False)
-            alt = modifiers.get("alt", False)
-            shift = modifiers.get("shift", False)
-
             # Convert key to virtual key code
             vk_code = self._key_to_vk(key)
             if vk_code is None:
-                print(f"[KEYSTROKE] Unknown key: {key}")
+                log.warning("[KEYSTROKE] Unknown key: %s", key)
                 return
 
-            # Press modifiers
-            if ctrl:
-                win32gui.PostMessage(hwnd, win32con.WM_KEYDOWN, win32con.VK_CONTROL, 0)
-            if alt:
-                win32gui.PostMessage(hwnd, win32con.WM_KEYDOWN, win32con.VK_MENU, 0)
-            if shift:
-                win32gui.PostMessage(hwnd, win32con.WM_KEYDOWN, win32con.VK_SHIFT, 0)
-
-            time.sleep(0.01)
-
-            # Send key press and release
-            win32gui.PostMessage(hwnd, win32con.WM_KEYDOWN, vk_code, 0)
-            win32gui.PostMessage(hwnd, win32con.WM_KEYUP, vk_code, 0)
-
-            time.sleep(0.01)
-
-            # Release modifiers
-            if shift:
-                win32gui.PostMessage(hwnd, win32con.WM_KEYUP, win32con.VK_SHIFT, 0)
-            if alt:
-                win32gui.PostMessage(hwnd, win32con.WM_KEYUP, win32con.VK_MENU, 0)
-            if ctrl:
-                win32gui.PostMessage(hwnd, win32con.WM_KEYUP, win32con.VK_CONTROL, 0)
+            # Get modifier states
+            modifier_vks = []
+            if modifiers.get("ctrl", False):
+                modifier_vks.append(win32con.VK_CONTROL)
+            if modifiers.get("alt", False):
+                modifier_vks.append(win32con.VK_MENU)
+            if modifiers.get("shift", False):
+                modifier_vks.append(win32con.VK_SHIFT)
+
+            # Focus and send off the loop, in order with other injected input
+            sent = await self._run_blocking(
+                _sync_keystroke, hwnd, vk_code, modifier_vks, executor=self._input_pool
+            )
+            if not sent:
+                log.warning("[KEYSTROKE] SendInput was blocked for '%s'", key)
+                return
 
-            print(f"[KEYSTROKE] Sent '{key}' to window {window_id}")
+            log.debug("[KEYSTROKE] Sent '%s' to window %s", key, window_id)
 
         except Exception as e:
-            print(f"[KEYSTROKE] Error: {e}")
+            log.warning("[KEYSTROKE] Error: %s", e)
 
     def _key_to_vk(self, key: str) -> int:
         """Convert a key name to Windows virtual key code."""
@@ -1101,28 +1385,28 @@ Always use backslashes for Windows paths."""
                     win32gui.SetForegroundWindow(hwnd)
                     time.sleep(0.1)
                     if win32gui.GetForegroundWindow() == hwnd:
-                        print(f"[FOCUS] Window {hwnd} focused on attempt {attempt + 1}")
+                        log.debug("[FOCUS] Window %s focused on attempt %s", hwnd, attempt + 1)
                         return True
                     time.sleep(0.1)
 
-                print(f"[FOCUS] Warning: Could not verify focus after {max_retries} attempts")
+                log.warning("[FOCUS] Warning: Could not verify focus after %s attempts", max_retries)
                 return False
             finally:
                 if attached:
                     ctypes.windll.user32.AttachThreadInput(current_thread, target_thread, False)
 
         except Exception as e:
-            print(f"[FOCUS] Error focusing window: {e}")
+            log.warning("[FOCUS] Error focusing window: %s", e)
             return False
 
     async def send_terminal_command(self, window_id: str, command: str):
         """Type a command into the terminal window using pyautogui."""
         if not HAS_PYAUTOGUI:
-            print("[COMMAND] pyautogui not available")
+            log.warning("[COMMAND] pyautogui not available")
             return
 
         if not HAS_WIN32:
-            print("[COMMAND] pywin32 not available")
+            log.warning("[COMMAND] pywin32 not available")
             return
 
         try:
@@ -1132,33 +1416,37 @@ Always use backslashes for Windows paths."""
             else:
                 hwnd = int(window_id)
 
-            print(f"[COMMAND] Focusing window {hwnd}...")
+            # Focus waits and per-character typing take a while; keep them off the loop
+            await self._run_blocking(self._type_terminal_command, hwnd, command)
+            log.debug("[COMMAND] Sent command to window %s: %s", hwnd, command)
 
-            # Reliable focus with retry and thread attachment
-            self._reliable_focus(hwnd)
-            time.sleep(0.25)  # Increased post-focus delay for stability
+        except Exception as e:
+            log.warning("[COMMAND] Error: %s", e)
 
-            # Type the command using pyautogui (more reliable than PostMessage)
-            print(f"[COMMAND] Typing: {command}")
-            pyautogui.typewrite(command, interval=0.02)
+    def _type_terminal_command(self, hwnd: int, command: str):
+        """Focus a terminal and type a command plus Enter (blocking)."""
+        log.debug("[COMMAND] Focusing window %s...", hwnd)
 
-            # Press Enter to execute
-            time.sleep(0.05)
-            pyautogui.press('enter')
+        # Reliable focus with retry and thread attachment
+        self._reliable_focus(hwnd)
+        time.sleep(0.25)  # Increased post-focus delay for stability
 
-            print(f"[COMMAND] Sent command to window {hwnd}: {command}")
+        # Type the command using pyautogui (more reliable than PostMessage)
+        log.debug("[COMMAND] Typing: %s", command)
+        pyautogui.typewrite(command, interval=0.02)
 
-        except Exception as e:
-            print(f"[COMMAND] Error: {e}")
+        # Press Enter to execute
+        time.sleep(0.05)
+        pyautogui.press('enter')
 
     async def send_terminal_key(self, window_id: str, key: str, modifiers: dict):
         """Send a special key (Ctrl+C, arrows, etc) to terminal using pyautogui."""
         if not HAS_PYAUTOGUI:
-            print("[KEY] pyautogui not available")
+            log.warning("[KEY] pyautogui not available")
             return
 
         if not HAS_WIN32:
-            print("[KEY] pywin32 not available")
+            log.warning("[KEY] pywin32 not available")
             return
 
         try:
@@ -1168,52 +1456,161 @@ Always use backslashes for Windows paths."""
             else:
                 hwnd = int(window_id)
 
-            print(f"[KEY] Focusing window {hwnd}...")
-
-            # Reliable focus with retry and thread attachment
-            self._reliable_focus(hwnd)
-            time.sleep(0.15)
-
-            # Map key names to pyautogui key names
-            key_map = {
-                "ArrowUp": "up",
-                "ArrowDown": "down",
-                "ArrowLeft": "left",
-                "ArrowRight": "right",
-                "Enter": "enter",
-                "Tab": "tab",
-                "Escape": "escape",
-                "Backspace": "backspace",
-                "Delete": "delete",
-                "Home": "home",
-                "End": "end",
-                "PageUp": "pageup",
-                "PageDown": "pagedown",
-            }
-
-            pyautogui_key = key_map.get(key, key.lower())
+            await self._run_blocking(self._press_terminal_key, hwnd, key, modifiers)
+            log.debug("[KEY] Sent key %s to window %s", key, hwnd)
 
-            # Build modifier list
-            mods = []
-            if modifiers.get("ctrl"):
-                mods.append("ctrl")
-            if modifiers.get("alt"):
-                mods.append("alt")
-            if modifiers.get("shift"):
-                mods.append("shift")
-
-            print(f"[KEY] Sending key: {pyautogui_key} with modifiers: {mods}")
+        except Exception as e:
+            log.warning("[KEY] Error: %s", e)
+
+    def _press_terminal_key(self, hwnd: int, key: str, modifiers: dict):
+        """Focus a terminal and press a key with modifiers (blocking)."""
+        log.debug("[KEY] Focusing window %s...", hwnd)
+
+        # Reliable focus with retry and thread attachment
+        self._reliable_focus(hwnd)
+        time.sleep(0.15)
+
+        # Map key names to pyautogui key names
+        key_map = {
+            "ArrowUp": "up",
+            "ArrowDown": "down",
+            "ArrowLeft": "left",
+            "ArrowRight": "right",
+            "Enter": "enter",
+            "Tab": "tab",
+            "Escape": "escape",
+            "Backspace": "backspace",
+            "Delete": "delete",
+            "Home": "home",
+            "End": "end",
+            "PageUp": "pageup",
+            "PageDown": "pagedown",
+        }
 
-            # Send key with modifiers using hotkey
-            if mods:
-                pyautogui.hotkey(*mods, pyautogui_key)
-            else:
-                pyautogui.press(pyautogui_key)
+        pyautogui_key = key_map.get(key, key.lower())
+
+        # Build modifier list
+        mods = []
+        if modifiers.get("ctrl"):
+            mods.append("ctrl")
+        if modifiers.get("alt"):
+            mods.append("alt")
+        if modifiers.get("shift"):
+            mods.append("shift")
+
+        log.debug("[KEY] Sending key: %s with modifiers: %s", pyautogui_key, mods)
+
+        # Send key with modifiers using hotkey
+        if mods:
+            pyautogui.hotkey(*mods, pyautogui_key)
+        else:
+            pyautogui.press(pyautogui_key)
+
+    async def remote_click(self, data: dict):
+        """Click at position in browser window."""
+        window_id = data.get("window_id")
+        x = data.get("x", 0)
+        y = data.get("y", 0)
+        log.debug("[CLICK] Received: window=%s, x=%s, y=%s", window_id, x, y)
+        if window_id and HAS_WIN32:
+            try:
+                hwnd = int(window_id)
+                # Focus and click off the loop (pyautogui pauses after each call)
+                abs_x, abs_y = await self._run_blocking(
+                    _sync_click, hwnd, x, y, executor=self._input_pool
+                )
+                log.debug("[CLICK] Clicked at (%s, %s)", abs_x, abs_y)
+            except Exception as e:
+                log.warning("[CLICK] Error: %s", e)
+
+    async def remote_scroll(self, data: dict):
+        """Scroll in browser window."""
+        window_id = data.get("window_id")
+        delta_y = data.get("delta_y", 0)
+        log.debug("[SCROLL] Received: window=%s, delta_y=%s", window_id, delta_y)
+        if window_id and HAS_WIN32:
+            try:
+                hwnd = int(window_id)
+                # Convert delta to scroll clicks (negative = scroll down)
+                scroll_clicks = int(delta_y / 30)
+                if scroll_clicks != 0:
+                    await self._run_blocking(
+                        _sync_scroll, hwnd, -scroll_clicks, executor=self._input_pool
+                    )
+                    log.debug("[SCROLL] Scrolled %s clicks", -scroll_clicks)
+            except Exception as e:
+                log.warning("[SCROLL] Error: %s", e)
+
+    async def remote_mouse(self, data: dict):
+        """Mouse operations for text selection (long press to select)."""
+        window_id = data.get("window_id")
+        action = data.get("action")  # 'down', 'move', 'up'
+        x = data.get("x", 0)
+        y = data.get("y", 0)
+        log.debug("[MOUSE] %s at (%s, %s) on window %s", action, x, y, window_id)
+        if window_id and HAS_WIN32 and HAS_PYAUTOGUI:
+            try:
+                hwnd = int(window_id)
+                # Focus and execute the mouse action off the loop
+                if action in ("down", "move", "up"):
+                    abs_x, abs_y = await self._run_blocking(
+                        _sync_mouse, hwnd, action, x, y, executor=self._input_pool
+                    )
+                    log.debug("[MOUSE] Mouse %s at (%s, %s)", action, abs_x, abs_y)
+            except Exception as e:
+                log.warning("[MOUSE] Error: %s", e)
+
+    async def handle_input_batch(self, events: list):
+        """Replay a batch of coalesced input events in order."""
+        handlers = {
+            "remote_click": self.remote_click,
+            "remote_scroll": self.remote_scroll,
+            "remote_mouse": self.remote_mouse,
+        }
+        for event in events:
+            handler = handlers.get(event.get("type"))
+            if handler is not None:
+                await handler(event)
+
+    async def _heartbeat(self, ws):
+        """Close the socket if the relay has gone silent, forcing a reconnect.
+
+        aiohttp's protocol-level heartbeat can be answered by intermediaries
+        that have already lost the upstream, so also watch for real traffic.
+        """
+        while not ws.closed:
+            await asyncio.sleep(HEARTBEAT_CHECK_INTERVAL)
+            silence = time.monotonic() - self._last_rx
+            if silence > HEARTBEAT_TIMEOUT:
+                log.warning("[HEALTH] No traffic from relay for %.0fs, reconnecting", silence)
+                await ws.close(code=1011)
+                break
 
-            print(f"[KEY] Sent key {key} to window {hwnd}")
+    def _warmup_sync(self):
+        """Load the JPEG encoder once so the first streamed frame isn't slowed by it."""
+        if HAS_CAPTURE:
+            import io
+            from PIL import Image
+            Image.new("RGB", (64, 64)).save(io.BytesIO(), format="JPEG", quality=60)
 
+    async def _warmup(self):
+        """Warm lazily-initialised native paths before accepting requests."""
+        try:
+            if HAS_PYCAW:
+                # First pycaw call resolves the COM audio endpoint on the thread requests use
+                await run_com(get_volume)
+            await asyncio.get_running_loop().run_in_executor(None, self._warmup_sync)
         except Exception as e:
-            print(f"[KEY] Error: {e}")
+            log.warning("[WARMUP] Skipped: %s", e)
+
+    def _ensure_session(self) -> aiohttp.ClientSession:
+        """Return the long-lived HTTP session, creating it on first use."""
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=4, ttl_dns_cache=300, keepalive_timeout=60, enable_cleanup_closed=True
+            )
+            self._session = aiohttp.ClientSession(connector=connector)
+        return self._session
 
     async def connect(self):
         """Connect to the relay server."""
@@ -1221,242 +1618,187 @@ Always use backslashes for Windows paths."""
         # Include host_id in the URL for multi-host support
         ws_url = f"{ws_url}/ws/pc?token={self.auth_token}&host_id={self.host_id}"
 
-        print(f"Connecting to relay: {ws_url.replace(self.auth_token, '***')}")
-        print(f"Host ID: {self.host_id}")
-        print(f"Host Name: {self.host_name}")
+        log.info("Connecting to relay: %s", ws_url.replace(self.auth_token, '***'))
+        log.info("Host ID: %s", self.host_id)
+        log.info("Host Name: %s", self.host_name)
 
-        async with aiohttp.ClientSession() as session:
-            while self.running:
-                delay = 5  # Default delay in case of unexpected control flow
-                try:
-                    async with session.ws_connect(ws_url, heartbeat=30) as ws:
-                        self.ws = ws
-                        print("Connected to relay server!")
-
-                        # Reset reconnection backoff on successful connection
-                        self.reconnection_manager.on_connection_success()
-
-                        # Send host registration
-                        await ws.send_json({
-                            "type": "host_register",
-                            "host_id": self.host_id,
-                            "host_name": self.host_name,
-                            "platform": self.platform,
-                            "platform_version": self.platform_version,
-                            "capabilities": {
-                                "window_capture": HAS_CAPTURE,
-                                "volume_control": HAS_PYCAW,
-                                "brightness_control": HAS_SBC,
-                                "keyboard_control": HAS_PYAUTOGUI
-                            }
-                        })
-
-                        async for msg in ws:
-                            if msg.type == aiohttp.WSMsgType.TEXT:
-                                data = json.loads(msg.data)
-                                msg_type = data.get("type", "")
-
-                                if msg_type == "request":
-                                    # Handle API request
-                                    request_id = data.get("request_id")
-                                    endpoint = data.get("endpoint")
-                                    method = data.get("method", "GET")
-                                    req_data = data.get("data")
-
-                                    print(f"Request: {method} {endpoint}")
-
-                                    result = await self.handle_request(
-                                        request_id, endpoint, method, req_data
-                                    )
-
-                                    # Send response
-                                    await ws.send_json({
-                                        "type": "response",
-                                        "request_id": request_id,
-                                        "data": result
-                                    })
-
-                                elif msg_type == "health_ping":
-                                    # Respond to health check ping from relay server
-                                    await self.handle_health_ping(data)
-
-                                elif msg_type == "stream_start":
-                                    # Start streaming a window
-                                    window_id = data.get("window_id")
-                                    options = data.get("options", {})
-                                    if window_id:
-                                        await self.start_stream(window_id, options)
-
-                                elif msg_type == "stream_stop":
-                                    # Stop streaming a window
-                                    window_id = data.get("window_id")
-                                    if window_id:
-                                        await self.stop_stream(window_id)
-
-                                elif msg_type == "stream_adjust":
-                                    # Adjust stream settings
-                                    window_id = data.get("window_id")
-                                    options = data.get("options", {})
-                                    if window_id:
-                                        await self.stop_stream(window_id)
-                                        await self.start_stream(window_id, options)
-
-                                # Terminal session handlers
-                                elif msg_type == "terminal_start":
-                                    session_id = data.get("session_id", "default")
-                                    print(f"[TERMINAL] Starting session: {session_id}")
-                                    await self.start_terminal(session_id)
-
-                                elif msg_type == "terminal_input":
-                                    session_id = data.get("session_id", "default")
-                                    print(f"[TERMINAL] Input for {session_id}: {data.get('command', '')}")
-                                    command = data.get("command", "")
-                                    await self.terminal_execute(session_id, command)
-
-                                elif msg_type == "terminal_stop":
-                                    session_id = data.get("session_id", "default")
-                                    await self.stop_terminal(session_id)
-
-                                elif msg_type == "terminal_keystroke":
-                                    # Send keystroke to actual terminal window (legacy)
-                                    window_id = data.get("window_id")
-                                    key = data.get("key", "")
-                                    modifiers = data.get("modifiers", {})
-                                    print(f"[KEYSTROKE] Received: window={window_id}, key={key}, mods={modifiers}")
-                                    if window_id and key:
-                                        await self.send_keystroke_to_window(window_id, key, modifiers)
-                                    else:
-                                        print(f"[KEYSTROKE] Missing window_id or key")
-
-                                elif msg_type == "terminal_command":
-                                    # Type full command to terminal window using pyautogui
-                                    window_id = data.get("window_id")
-                                    command = data.get("command", "")
-                                    print(f"[COMMAND] Received: window={window_id}, command={command}")
-                                    if window_id and command:
-                                        await self.send_terminal_command(window_id, command)
-                                    else:
-                                        print(f"[COMMAND] Missing window_id or command")
-
-                                elif msg_type == "terminal_key":
-                                    # Send special key to terminal using pyautogui
-                                    window_id = data.get("window_id")
-                                    key = data.get("key", "")
-                                    modifiers = data.get("modifiers", {})
-                                    print(f"[KEY] Received: window={window_id}, key={key}, mods={modifiers}")
-                                    if window_id and key:
-                                        await self.send_terminal_key(window_id, key, modifiers)
-                                    else:
-                                        print(f"[KEY] Missing window_id or key")
-
-                                elif msg_type == "remote_click":
-                                    # Click at position in browser window
-                                    window_id = data.get("window_id")
-                                    x = data.get("x", 0)
-                                    y = data.get("y", 0)
-                                    print(f"[CLICK] Received: window={window_id}, x={x}, y={y}")
-                                    if window_id and HAS_WIN32:
-                                        try:
-                                            hwnd = int(window_id)
-                                            # Get window position
-                                            rect = win32gui.GetWindowRect(hwnd)
-                                            # Calculate absolute position
-                                            abs_x = rect[0] + x
-                                            abs_y = rect[1] + y
-                                            # Focus window first
-                                            if win32gui.IsIconic(hwnd):
-                                                win32gui.ShowWindow(hwnd, win32con.SW_RESTORE)
-                                            win32gui.SetForegroundWindow(hwnd)
-                                            await asyncio.sleep(0.1)
-                                            # Click at position
-                                            pyautogui.click(abs_x, abs_y)
-                                            print(f"[CLICK] Clicked at ({abs_x}, {abs_y})")
-                                        except Exception as e:
-                                            print(f"[CLICK] Error: {e}")
-
-                                elif msg_type == "remote_scroll":
-                                    # Scroll in browser window
-                                    window_id = data.get("window_id")
-                                    delta_y = data.get("delta_y", 0)
-                                    print(f"[SCROLL] Received: window={window_id}, delta_y={delta_y}")
-                                    if window_id and HAS_WIN32:
-                                        try:
-                                            hwnd = int(window_id)
-                                            # Focus window
-                                            if win32gui.IsIconic(hwnd):
-                                                win32gui.ShowWindow(hwnd, win32con.SW_RESTORE)
-                                            win32gui.SetForegroundWindow(hwnd)
-                                            await asyncio.sleep(0.05)
-                                            # Convert delta to scroll clicks (negative = scroll down)
-                                            scroll_clicks = int(delta_y / 30)
-                                            if scroll_clicks != 0:
-                                                pyautogui.scroll(-scroll_clicks)
-                                                print(f"[SCROLL] Scrolled {-scroll_clicks} clicks")
-                                        except Exception as e:
-                                            print(f"[SCROLL] Error: {e}")
-
-                                elif msg_type == "remote_mouse":
-                                    # Mouse operations for text selection (long press to select)
-                                    window_id = data.get("window_id")
-                                    action = data.get("action")  # 'down', 'move', 'up'
-                                    x = data.get("x", 0)
-                                    y = data.get("y", 0)
-                                    print(f"[MOUSE] {action} at ({x}, {y}) on window {window_id}")
-                                    if window_id and HAS_WIN32 and HAS_PYAUTOGUI:
-                                        try:
-                                            hwnd = int(window_id)
-                                            # Get window position
-                                            rect = win32gui.GetWindowRect(hwnd)
-                                            abs_x = rect[0] + x
-                                            abs_y = rect[1] + y
-
-                                            # Focus window first
-                                            if win32gui.IsIconic(hwnd):
-                                                win32gui.ShowWindow(hwnd, win32con.SW_RESTORE)
-                                            try:
-                                                win32gui.SetForegroundWindow(hwnd)
-                                            except:
-                                                pass
-                                            await asyncio.sleep(0.02)
-
-                                            # Execute mouse action
-                                            if action == "down":
-                                                pyautogui.moveTo(abs_x, abs_y)
-                                                pyautogui.mouseDown()
-                                                print(f"[MOUSE] Mouse down at ({abs_x}, {abs_y})")
-                                            elif action == "move":
-                                                pyautogui.moveTo(abs_x, abs_y)
-                                            elif action == "up":
-                                                pyautogui.moveTo(abs_x, abs_y)
-                                                pyautogui.mouseUp()
-                                                print(f"[MOUSE] Mouse up at ({abs_x}, {abs_y})")
-                                        except Exception as e:
-                                            print(f"[MOUSE] Error: {e}")
-
-                            elif msg.type == aiohttp.WSMsgType.ERROR:
-                                print(f"WebSocket error: {ws.exception()}")
-                                break
-
-                except aiohttp.ClientError as e:
-                    # Connection successful initially, then failed
-                    delay = self.reconnection_manager.on_connection_failure(f"Connection error: {e}")
-                except Exception as e:
-                    # Connection failed with general error
-                    delay = self.reconnection_manager.on_connection_failure(f"General error: {e}")
-                else:
-                    # Connection closed normally (not through exception)
-                    delay = self.reconnection_manager.on_connection_failure("Connection closed")
+        await self._warmup()
+
+        session = self._ensure_session()
+        while self.running:
+            delay = 5  # Default delay in case of unexpected control flow
+            try:
+                # JPEG frames are already compressed, so skip permessage-deflate.
+                # Outgoing frames keep the link busy, so a tighter heartbeat is cheap.
+                async with session.ws_connect(
+                    ws_url, autoping=True, heartbeat=15, compress=0,
+                    max_msg_size=16 * 1024 * 1024
+                ) as ws:
+                    self.ws = ws
+                    log.info("Connected to relay server!")
+
+                    # Reset reconnection backoff on successful connection
+                    self.reconnection_manager.on_connection_success()
+
+                    # Send host registration
+                    await ws.send_str(_json_dumps({
+                        "type": "host_register",
+                        "host_id": self.host_id,
+                        "host_name": self.host_name,
+                        "platform": self.platform,
+                        "platform_version": self.platform_version,
+                        "capabilities": {
+                            "window_capture": HAS_CAPTURE,
+                            "volume_control": HAS_PYCAW,
+                            "brightness_control": HAS_SBC,
+                            "keyboard_control": HAS_PYAUTOGUI,
+                            "input_batch": True
+                        }
+                    }))
+
+                    self._last_rx = time.monotonic()
+                    self._hb_task = asyncio.create_task(self._heartbeat(ws))
+
+                    async for msg in ws:
+                        self._last_rx = time.monotonic()
+                        if msg.type == aiohttp.WSMsgType.TEXT:
+                            data = orjson.loads(msg.data)
+                            msg_type = data.get("type", "")
+
+                            if msg_type == "request":
+                                # Handle API request
+                                request_id = data.get("request_id")
+                                endpoint = data.get("endpoint")
+                                method = data.get("method", "GET")
+                                req_data = data.get("data")
+
+                                if log.isEnabledFor(logging.DEBUG):
+                                    log.debug("Request: %s %s", method, endpoint)
+
+                                result = await self.handle_request(
+                                    request_id, endpoint, method, req_data
+                                )
+
+                                # Send response
+                                await ws.send_str(_json_dumps({
+                                    "type": "response",
+                                    "request_id": request_id,
+                                    "data": result
+                                }))
+
+                            elif msg_type == "health_ping":
+                                # Respond to health check ping from relay server
+                                await self.handle_health_ping(data)
+
+                            elif msg_type == "stream_start":
+                                # Start streaming a window
+                                window_id = data.get("window_id")
+                                options = data.get("options", {})
+                                if window_id:
+                                    await self.start_stream(window_id, options)
+
+                            elif msg_type == "stream_stop":
+                                # Stop streaming a window
+                                window_id = data.get("window_id")
+                                if window_id:
+                                    await self.stop_stream(window_id)
+
+                            elif msg_type == "stream_adjust":
+                                # Adjust stream settings
+                                window_id = data.get("window_id")
+                                options = data.get("options", {})
+                                if window_id:
+                                    self.schedule_adjust(window_id, options)
+
+                            # Terminal session handlers
+                            elif msg_type == "terminal_start":
+                                session_id = data.get("session_id", "default")
+                                log.debug("[TERMINAL] Starting session: %s", session_id)
+                                await self.start_terminal(session_id)
+
+                            elif msg_type == "terminal_input":
+                                session_id = data.get("session_id", "default")
+                                log.debug("[TERMINAL] Input for %s: %s", session_id, data.get('command', ''))
+                                command = data.get("command", "")
+                                await self.terminal_execute(session_id, command)
+
+                            elif msg_type == "terminal_stop":
+                                session_id = data.get("session_id", "default")
+                                await self.stop_terminal(session_id)
+
+                            elif msg_type == "terminal_keystroke":
+                                # Send keystroke to actual terminal window (legacy)
+                                window_id = data.get("window_id")
+                                key = data.get("key", "")
+                                modifiers = data.get("modifiers", {})
+                                log.debug("[KEYSTROKE] Received: window=%s, key=%s, mods=%s", window_id, key, modifiers)
+                                if window_id and key:
+                                    await self.send_keystroke_to_window(window_id, key, modifiers)
+                                else:
+                                    log.warning("[KEYSTROKE] Missing window_id or key")
+
+                            elif msg_type == "terminal_command":
+                                # Type full command to terminal window using pyautogui
+                                window_id = data.get("window_id")
+                                command = data.get("command", "")
+                                log.debug("[COMMAND] Received: window=%s, command=%s", window_id, command)
+                                if window_id and command:
+                                    await self.send_terminal_command(window_id, command)
+                                else:
+                                    log.warning("[COMMAND] Missing window_id or command")
+
+                            elif msg_type == "terminal_key":
+                                # Send special key to terminal using pyautogui
+                                window_id = data.get("window_id")
+                                key = data.get("key", "")
+                                modifiers = data.get("modifiers", {})
+                                log.debug("[KEY] Received: window=%s, key=%s, mods=%s", window_id, key, modifiers)
+                                if window_id and key:
+                                    await self.send_terminal_key(window_id, key, modifiers)
+                                else:
+                                    log.warning("[KEY] Missing window_id or key")
+
+                            elif msg_type == "remote_click":
+                                await self.remote_click(data)
+
+                            elif msg_type == "remote_scroll":
+                                await self.remote_scroll(data)
+
+                            elif msg_type == "remote_mouse":
+                                await self.remote_mouse(data)
+
+                            elif msg_type == "input_batch":
+                                # Coalesced remote_mouse/remote_scroll events from the relay
+                                await self.handle_input_batch(data.get("events", []))
+
+                        elif msg.type == aiohttp.WSMsgType.ERROR:
+                            log.warning("WebSocket error: %s", ws.exception())
+                            break
 
-                # Stop all streams and terminals on disconnect
-                await self.stop_all_streams()
-                await self.stop_all_terminals()
+            except aiohttp.ClientError as e:
+                # Connection successful initially, then failed
+                delay = self.reconnection_manager.on_connection_failure(f"Connection error: {e}")
+            except Exception as e:
+                # Connection failed with general error
+                delay = self.reconnection_manager.on_connection_failure(f"General error: {e}")
+            else:
+                # Connection closed normally (not through exception)
+                delay = self.reconnection_manager.on_connection_failure("Connection closed")
 
-                if self.running:
-                    await asyncio.sleep(delay)
+            # Stop the watchdog, streams and terminals on disconnect
+            if self._hb_task is not None:
+                self._hb_task.cancel()
+                self._hb_task = None
+            await self.stop_all_streams()
+            await self.stop_all_terminals()
+
+            if self.running:
+                await asyncio.sleep(delay)
 
     async def run(self):
         """Run the relay client."""
         self.running = True
+        setup_logging(log.level or logging.INFO)
         print("=" * 50)
         print("RustDesk Mobile UI - Relay Client")
         print("=" * 50)
@@ -1476,6 +1818,9 @@ Always use backslashes for Windows paths."""
         except KeyboardInterrupt:
             print("\nStopping...")
             self.running = False
+        finally:
+            if self._session is not None and not self._session.closed:
+                await self._session.close()
 
 
 def main():
@@ -1487,8 +1832,12 @@ def main():
                         help="Custom host ID (default: computer name)")
     parser.add_argument("--host-name", "-n", default=None,
                         help="Display name for this host (default: computer name)")
+    parser.add_argument("--verbose", "-v", action="store_true",
+                        help="Log every request and input event")
     args = parser.parse_args()
 
+    setup_logging(logging.DEBUG if args.verbose else logging.INFO)
+
     client = RelayClient(args.relay_url, args.token, args.host_id, args.host_name)
     asyncio.run(client.run())
 
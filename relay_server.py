@@ -5,23 +5,53 @@ Relays commands between the web frontend and your local PC.
 """
 
 import asyncio
-import json
+import logging
+import logging.handlers
 import os
+import queue
 import secrets
 import hashlib
+import hmac
+import itertools
 import time
+from collections import OrderedDict
 from datetime import datetime
-from typing import Optional, Dict
+from typing import Optional, Dict, Set
 
 from fastapi import FastAPI, WebSocket, WebSocketDisconnect, HTTPException, Request, Response, Cookie, Form, Depends
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import HTMLResponse, FileResponse, RedirectResponse
+from fastapi.responses import HTMLResponse, FileResponse, RedirectResponse, ORJSONResponse
 from fastapi.staticfiles import StaticFiles
 from starlette.middleware.base import BaseHTTPMiddleware
 from starlette.responses import JSONResponse as StarletteJSONResponse
-from pydantic import BaseModel
+import orjson
 
-app = FastAPI(title="RustDesk Mobile UI Relay", version="1.0.0")
+
+log = logging.getLogger("relay_server")
+
+
+def setup_logging(level: int = logging.INFO):
+    """Route relay_server logging through a QueueHandler/QueueListener pair (idempotent)."""
+    log.setLevel(level)
+    if any(isinstance(h, logging.handlers.QueueHandler) for h in log.handlers):
+        return
+    log_queue = queue.Queue(-1)
+    stream_handler = logging.StreamHandler()
+    stream_handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(message)s", "%H:%M:%S"))
+    log.addHandler(logging.handlers.QueueHandler(log_queue))
+    log.propagate = False
+    logging.handlers.QueueListener(log_queue, stream_handler).start()
+
+
+setup_logging(getattr(logging, os.environ.get("LOG_LEVEL", "INFO").upper(), logging.INFO))
+
+
+def _dumps(obj) -> str:
+    """Encode a JSON message for a WebSocket text frame."""
+    return orjson.dumps(obj).decode()
+
+
+app = FastAPI(title="RustDesk Mobile UI Relay", version="1.0.0", default_response_class=ORJSONResponse)
 
 ALLOWED_ORIGINS = os.environ.get(
     "ALLOWED_ORIGINS",
@@ -47,31 +77,101 @@ class HostConnection:
         self.platform_version = ""
         self.capabilities = {}
         self.connected_at = datetime.now()
+        self.registered = False  # Set once the host has sent host_register
+        self._connected_at_iso = self.connected_at.isoformat()
+        self.refresh()
 
-    def to_dict(self):
-        return {
+    def refresh(self):
+        """Rebuild the cached to_dict() view; call after changing host info."""
+        self._dict = {
             "host_id": self.host_id,
             "host_name": self.host_name,
             "platform": self.platform,
             "platform_version": self.platform_version,
             "capabilities": self.capabilities,
-            "connected_at": self.connected_at.isoformat()
+            "connected_at": self._connected_at_iso
         }
 
+    def to_dict(self):
+        return self._dict
+
 
 # Dictionary of connected hosts: host_id -> HostConnection
 pc_connections: dict[str, HostConnection] = {}
 # Currently selected host for each web client (session_id -> host_id)
 selected_host: dict[str, str] = {}
-# Legacy: single connection reference for backwards compatibility
-pc_connection: Optional[WebSocket] = None
-web_connections: list[WebSocket] = []
-pending_requests: dict[str, asyncio.Future] = {}
+
+
+class RelayState:
+    """Owns the mutable relay state shared between the HTTP and WebSocket handlers."""
+
+    def __init__(self):
+        # Active PC socket that proxied requests go to (legacy single-host reference)
+        self.pc: Optional[WebSocket] = None
+        # host_id of the active PC, kept in step with pc by set_active_host()
+        self.active_host_id: Optional[str] = None
+        # request_id -> future resolved by the PC's response
+        self.pending: dict[str, asyncio.Future] = {}
+        # Encoded pc_status snapshot sent to newly connected web clients
+        self.pc_status_text: Optional[str] = None
+        # PC socket -> input batcher, for hosts that advertise "input_batch"
+        self.input_batchers: dict[WebSocket, "InputBatcher"] = {}
+        # Connected web clients -> their outbound queue/writer
+        self.webs: dict[WebSocket, "WebClient"] = {}
+        # host_connected/updated/disconnected events awaiting the next coalesced broadcast
+        self.host_events: list[dict] = []
+        self.host_events_flush: Optional[asyncio.TimerHandle] = None
+
+
+state = RelayState()
+
+
+def invalidate_pc_status():
+    """Drop the cached pc_status snapshot; call whenever pc_connections or host info changes."""
+    state.pc_status_text = None
+
+
+def pc_status_text() -> str:
+    """Encoded pc_status message for a new web client, rebuilt only after hosts change."""
+    if state.pc_status_text is None:
+        state.pc_status_text = _dumps({
+            "type": "pc_status",
+            "connected": len(pc_connections) > 0,
+            "hosts": [host.to_dict() for host in pc_connections.values()],
+            "hosts_count": len(pc_connections)
+        })
+    return state.pc_status_text
+
+
+def set_active_host(host: Optional[HostConnection]):
+    """Make host the target for proxied requests and web input (None: no active PC)."""
+    state.pc = host.ws if host else None
+    state.active_host_id = host.host_id if host else None
+
+
+def release_active_host(ws: WebSocket):
+    """After a host has left pc_connections, fail over to the oldest remaining host if it was active."""
+    if state.pc is ws:
+        fallback = next(iter(pc_connections.values()), None)
+        set_active_host(fallback)
+        if fallback:
+            log.info("Switched to host: %s", fallback.host_id)
+
+
+_req_counter = itertools.count()  # Correlates relayed requests with PC responses
+MAX_OUTSTANDING_REQUESTS = 256
+_relay_slots = asyncio.Semaphore(MAX_OUTSTANDING_REQUESTS)  # Bounds state.pending
 
 # Message deduplication tracking (prevents double-sends)
-recent_requests: Dict[str, float] = {}  # request_hash -> timestamp
+# request_hash -> (timestamp, upstream task); inserted in time order, so expiry only pops from the front
+recent_requests: "OrderedDict[str, tuple[float, asyncio.Task]]" = OrderedDict()
 DEDUP_WINDOW = 2.0  # 2-second deduplication window
 
+# Per-message size caps. Web clients only send small control messages; the PC
+# also sends screenshots and stream frames, so it gets the transport limit.
+MAX_WEB_MESSAGE = 64 * 1024
+MAX_PC_MESSAGE = 16 * 1024 * 1024
+
 # Shared password for both site access and relay authentication
 SITE_PASSWORD = os.environ.get("SITE_PASSWORD")
 if not SITE_PASSWORD:
@@ -80,15 +180,9 @@ if not SITE_PASSWORD:
     import sys
     sys.exit(1)
 AUTH_TOKEN = SITE_PASSWORD  # Use same password for relay auth
-valid_sessions: set[str] = set()
-
-
-class RelayMessage(BaseModel):
-    type: str  # "request", "response", "broadcast"
-    request_id: Optional[str] = None
-    endpoint: Optional[str] = None
-    method: Optional[str] = None
-    data: Optional[dict] = None
+SESSION_TTL = 86400  # Matches the session cookie max_age
+MAX_SESSIONS = 10_000
+valid_sessions: "OrderedDict[str, float]" = OrderedDict()  # session_id -> expiry (monotonic)
 
 
 class ConnectionHealthMonitor:
@@ -98,13 +192,13 @@ class ConnectionHealthMonitor:
         self.health_checks = {}
         self.check_interval = 10.0  # 10-second health checks
         self.monitoring_task = None
-        self.pending_pongs = {}  # ping_id -> timestamp
+        self.pending_pongs = {}  # ping_id -> (timestamp, future resolved by the pong)
 
     async def start_monitoring(self):
         """Start continuous health monitoring"""
         if self.monitoring_task is None:
             self.monitoring_task = asyncio.create_task(self._monitor_loop())
-            print("[HEALTH] Started connection health monitoring")
+            log.info("[HEALTH] Started connection health monitoring")
 
     async def stop_monitoring(self):
         """Stop health monitoring"""
@@ -125,88 +219,90 @@ class ConnectionHealthMonitor:
             except asyncio.CancelledError:
                 break
             except Exception as e:
-                print(f"[HEALTH] Monitor loop error: {e}")
+                log.error("[HEALTH] Monitor loop error: %s", e)
                 await asyncio.sleep(5)
 
     async def _check_all_connections(self):
         """Check health of all PC connections"""
-        global pc_connections
         current_time = time.time()
-
-        # Clean up old pending pongs
-        expired_pongs = [ping_id for ping_id, timestamp in self.pending_pongs.items()
-                        if current_time - timestamp > 10.0]
-        for ping_id in expired_pongs:
-            self.pending_pongs.pop(ping_id, None)
+        loop = asyncio.get_running_loop()
 
         for host_id, host_conn in list(pc_connections.items()):
+            ping_id = str(next(_req_counter))
             try:
                 # Send health ping
-                ping_id = secrets.token_hex(4)
-                self.pending_pongs[ping_id] = current_time
+                pong = loop.create_future()
+                self.pending_pongs[ping_id] = (current_time, pong)
 
-                await host_conn.ws.send_json({
+                await host_conn.ws.send_text(_dumps({
                     "type": "health_ping",
                     "ping_id": ping_id,
                     "timestamp": current_time
-                })
+                }))
 
                 # Wait for pong (with timeout)
                 try:
-                    await asyncio.wait_for(
-                        self._wait_for_pong(ping_id),
-                        timeout=5.0
-                    )
-                    print(f"[HEALTH] Host {host_id} healthy")
+                    async with asyncio.timeout(5.0):
+                        await pong
+                    log.debug("[HEALTH] Host %s healthy", host_id)
 
                 except asyncio.TimeoutError:
-                    print(f"[HEALTH] Host {host_id} unresponsive - removing")
+                    log.warning("[HEALTH] Host %s unresponsive - removing", host_id)
                     await self._remove_dead_connection(host_id)
 
             except Exception as e:
-                print(f"[HEALTH] Health check failed for {host_id}: {e}")
+                log.warning("[HEALTH] Health check failed for %s: %s", host_id, e)
                 await self._remove_dead_connection(host_id)
-
-    async def _wait_for_pong(self, ping_id: str):
-        """Wait for a specific pong response"""
-        start_time = time.time()
-        while ping_id in self.pending_pongs:
-            if time.time() - start_time > 5.0:
-                raise asyncio.TimeoutError()
-            await asyncio.sleep(0.1)
+            finally:
+                self.pending_pongs.pop(ping_id, None)
 
     async def handle_health_pong(self, data: dict):
         """Handle received health pong"""
         ping_id = data.get("ping_id")
-        if ping_id and ping_id in self.pending_pongs:
-            server_timestamp = self.pending_pongs.pop(ping_id)
-            latency = (time.time() - server_timestamp) * 1000
-            print(f"[HEALTH] Received pong for {ping_id} (latency: {latency:.2f}ms)")
+        entry = self.pending_pongs.pop(ping_id, None) if ping_id else None
+        if entry is None:
+            return
+        server_timestamp, pong = entry
+        if not pong.done():
+            pong.set_result(None)
+        latency = (time.time() - server_timestamp) * 1000
+        log.debug("[HEALTH] Received pong for %s (latency: %.2fms)", ping_id, latency)
 
     async def _remove_dead_connection(self, host_id: str):
         """Remove a dead connection"""
-        global pc_connections, pc_connection
 
         if host_id in pc_connections:
+            dead_ws = pc_connections[host_id].ws
             try:
-                await pc_connections[host_id].ws.close()
-            except:
+                await dead_ws.close()
+            except Exception:
                 pass
             pc_connections.pop(host_id, None)
+            invalidate_pc_status()
 
-            # Update legacy reference if needed
-            if pc_connection and getattr(pc_connection, 'host_id', None) == host_id:
-                pc_connection = None
+            release_active_host(dead_ws)
 
-            print(f"[HEALTH] Removed dead connection: {host_id}")
+            log.info("[HEALTH] Removed dead connection: %s", host_id)
 
 # Global health monitor
 health_monitor = ConnectionHealthMonitor()
 
 
+def token_matches(candidate: Optional[str]) -> bool:
+    """Constant-time comparison against the shared password."""
+    return hmac.compare_digest((candidate or "").encode(), AUTH_TOKEN.encode())
+
+
 def is_authenticated(session_id: str) -> bool:
     """Check if session is authenticated."""
-    return session_id in valid_sessions
+    expiry = valid_sessions.get(session_id)
+    if expiry is None:
+        return False
+    if time.monotonic() >= expiry:
+        valid_sessions.pop(session_id, None)
+        return False
+    valid_sessions.move_to_end(session_id)
+    return True
 
 
 async def require_auth(request: Request):
@@ -215,7 +311,7 @@ async def require_auth(request: Request):
     if is_authenticated(session):
         return session
     auth_header = request.headers.get("authorization", "")
-    if auth_header.startswith("Bearer ") and auth_header[7:] == AUTH_TOKEN:
+    if auth_header.startswith("Bearer ") and token_matches(auth_header[7:]):
         return auth_header[7:]
     raise HTTPException(status_code=401, detail="Authentication required")
 
@@ -232,7 +328,7 @@ class APIAuthMiddleware(BaseHTTPMiddleware):
         if path.startswith("/api/") and path not in AUTH_EXEMPT_PATHS:
             session = request.cookies.get("session")
             auth_header = request.headers.get("authorization", "")
-            bearer_ok = auth_header.startswith("Bearer ") and auth_header[7:] == AUTH_TOKEN
+            bearer_ok = auth_header.startswith("Bearer ") and token_matches(auth_header[7:])
             if not (is_authenticated(session) or bearer_ok):
                 return StarletteJSONResponse(
                     status_code=401,
@@ -251,22 +347,45 @@ class RateLimiter:
         self.max_requests = max_requests
         self.window = window_seconds
         self.requests: Dict[str, list] = {}  # ip -> [timestamps]
+        self.last_sweep = time.time()
 
     def is_allowed(self, ip: str) -> bool:
         now = time.time()
         cutoff = now - self.window
-        if ip not in self.requests:
-            self.requests[ip] = []
+        if now - self.last_sweep > self.window:
+            self._sweep(cutoff)
+            self.last_sweep = now
         # Prune old entries
-        self.requests[ip] = [t for t in self.requests[ip] if t > cutoff]
-        if len(self.requests[ip]) >= self.max_requests:
+        recent = [t for t in self.requests.get(ip, ()) if t > cutoff]
+        if len(recent) >= self.max_requests:
+            self.requests[ip] = recent
             return False
-        self.requests[ip].append(now)
+        recent.append(now)
+        self.requests[ip] = recent
         return True
 
+    def _sweep(self, cutoff: float):
+        """Forget IPs with no requests inside the window, so the dict stays bounded."""
+        for ip in [ip for ip, stamps in self.requests.items() if not stamps or stamps[-1] <= cutoff]:
+            del self.requests[ip]
+
 
 rate_limiter = RateLimiter()
 
+# Number of proxies in front of the relay that append to X-Forwarded-For (1 on Render).
+# The client is the entry that many hops from the right; entries further left are
+# whatever the caller sent and must not be trusted.
+TRUSTED_PROXY_HOPS = int(os.environ.get("TRUSTED_PROXY_HOPS", "0"))
+
+
+def client_ip(request: Request) -> str:
+    """Rate-limiting identity for a request: the address our own proxy saw, if any."""
+    if TRUSTED_PROXY_HOPS:
+        hops = [h.strip() for h in request.headers.get("x-forwarded-for", "").split(",") if h.strip()]
+        if len(hops) >= TRUSTED_PROXY_HOPS:
+            return hops[-TRUSTED_PROXY_HOPS]
+    return request.client.host if request.client else "unknown"
+
 RATE_LIMIT_EXEMPT_PATHS = {"/api/health", "/ws", "/ws/pc", "/"}
 
 
@@ -276,8 +395,7 @@ class RateLimitMiddleware(BaseHTTPMiddleware):
     async def dispatch(self, request: Request, call_next):
         path = request.url.path
         if (path.startswith("/api/") or path == "/login") and path not in RATE_LIMIT_EXEMPT_PATHS:
-            client_ip = request.client.host if request.client else "unknown"
-            if not rate_limiter.is_allowed(client_ip):
+            if not rate_limiter.is_allowed(client_ip(request)):
                 return StarletteJSONResponse(
                     status_code=429,
                     content={"detail": "Too many requests"}
@@ -399,23 +517,33 @@ LOGIN_PAGE = """
 </body>
 </html>
 """
+LOGIN_PRE, LOGIN_POST = LOGIN_PAGE.split("{error}")
+LOGIN_PAGE_PLAIN = (LOGIN_PRE + LOGIN_POST).encode()  # Common case: no error banner, pre-encoded
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+INDEX_PATH = os.path.join(SCRIPT_DIR, "index.html")
+# Stat once so FileResponse can build ETag/Last-Modified without touching the disk
+INDEX_STAT = os.stat(INDEX_PATH) if os.path.exists(INDEX_PATH) else None
 
 
 @app.get("/login", response_class=HTMLResponse)
 async def login_page(error: str = ""):
     """Show login page."""
-    error_html = f'<div class="error">{error}</div>' if error else ""
-    return LOGIN_PAGE.replace("{error}", error_html)
+    if not error:
+        return HTMLResponse(LOGIN_PAGE_PLAIN)
+    return f'{LOGIN_PRE}<div class="error">{error}</div>{LOGIN_POST}'
 
 
 @app.post("/login")
 async def login(response: Response, password: str = Form(...)):
     """Handle login."""
-    if password == SITE_PASSWORD:
+    if token_matches(password):
         session_id = secrets.token_hex(32)
-        valid_sessions.add(session_id)
+        if len(valid_sessions) >= MAX_SESSIONS:
+            valid_sessions.popitem(last=False)
+        valid_sessions[session_id] = time.monotonic() + SESSION_TTL
         resp = RedirectResponse(url="/", status_code=303)
-        resp.set_cookie(key="session", value=session_id, httponly=True, max_age=86400)
+        resp.set_cookie(key="session", value=session_id, httponly=True, max_age=SESSION_TTL)
         return resp
     return RedirectResponse(url="/login?error=Invalid+password", status_code=303)
 
@@ -423,8 +551,7 @@ async def login(response: Response, password: str = Form(...)):
 @app.get("/logout")
 async def logout(response: Response, session: str = Cookie(None)):
     """Handle logout."""
-    if session in valid_sessions:
-        valid_sessions.discard(session)
+    valid_sessions.pop(session, None)
     resp = RedirectResponse(url="/login", status_code=303)
     resp.delete_cookie(key="session")
     return resp
@@ -438,7 +565,7 @@ async def health_check():
         "timestamp": datetime.now().isoformat(),
         "pc_connected": len(pc_connections) > 0,
         "hosts_count": len(pc_connections),
-        "web_clients": len(web_connections)
+        "web_clients": len(state.webs)
     }
 
 
@@ -447,7 +574,7 @@ async def relay_status():
     """Get relay connection status."""
     return {
         "pc_connected": len(pc_connections) > 0,
-        "web_clients": len(web_connections),
+        "web_clients": len(state.webs),
         "hosts_count": len(pc_connections)
     }
 
@@ -496,14 +623,14 @@ async def deployment_info():
 async def list_hosts():
     """List all connected host PCs."""
     return {
-        "hosts": [host.to_dict() for host in pc_connections.values()]
+        "hosts": [host.to_dict() for host in pc_connections.values()],
+        "active_host_id": state.active_host_id
     }
 
 
 @app.post("/api/hosts/cleanup")
 async def cleanup_hosts():
     """Remove all stale/zombie host connections."""
-    global pc_connection, pc_connections
 
     # Find hosts without capabilities (zombie connections)
     zombie_ids = [
@@ -514,16 +641,10 @@ async def cleanup_hosts():
     # Remove zombies
     for host_id in zombie_ids:
         pc_connections.pop(host_id, None)
+        invalidate_pc_status()
 
-    # Reset pc_connection to a valid host if needed
-    if pc_connections:
-        # Select the first host with capabilities
-        for host in pc_connections.values():
-            if host.capabilities:
-                pc_connection = host.ws
-                break
-    else:
-        pc_connection = None
+    # Reset the active PC to the first host with capabilities, if any
+    set_active_host(next((host for host in pc_connections.values() if host.capabilities), None))
 
     return {
         "removed": len(zombie_ids),
@@ -544,660 +665,673 @@ async def select_host(request: Request):
         raise HTTPException(status_code=404, detail="Host not connected")
 
     # For now, use a global selected host (can be per-session later)
-    global pc_connection
-    pc_connection = pc_connections[host_id].ws
+    set_active_host(pc_connections[host_id])
 
     return {"status": "selected", "host_id": host_id}
 
 
-def generate_request_hash(endpoint: str, method: str, data: dict) -> str:
-    """Generate deterministic hash for request deduplication"""
-    content = f"{endpoint}:{method}:{json.dumps(data, sort_keys=True) if data else 'null'}"
-    return hashlib.md5(content.encode()).hexdigest()
-
-async def relay_to_pc_deduplicated(endpoint: str, method: str = "GET", data: dict = None) -> dict:
-    """Relay a request to the connected PC with deduplication to prevent double-sends"""
-    global recent_requests
-
-    # Check for duplicate request
-    req_hash = generate_request_hash(endpoint, method, data)
-    current_time = time.time()
-
-    # Clean expired entries
-    expired = [h for h, t in recent_requests.items() if current_time - t > DEDUP_WINDOW]
-    for h in expired:
-        recent_requests.pop(h, None)
-
-    # Check for recent duplicate
-    if req_hash in recent_requests:
-        print(f"[DEDUP] Ignoring duplicate request: {endpoint}")
-        return {"status": "deduplicated", "original_time": recent_requests[req_hash]}
+WEB_QUEUE_SIZE = 32  # Per-client outbound backlog before the oldest message is dropped
+MAX_PENDING_FRAMES = 3  # Drop new frames for a client with this many already queued
+WRITER_BATCH = 16  # Messages a writer drains per wakeup
 
-    # Record request and proceed
-    recent_requests[req_hash] = current_time
-    return await relay_to_pc_reliable(endpoint, method, data)
 
-async def relay_to_pc_reliable(endpoint: str, method: str = "GET", data: dict = None) -> dict:
-    """Relay a request to the connected PC with retry logic for reliability"""
-    max_retries = 3
-    base_delay = 1.0
+class WebClient:
+    """Outbound side of a web client: a bounded queue drained by one writer task."""
 
-    for attempt in range(max_retries):
+    def __init__(self, ws: WebSocket):
+        self.ws = ws
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=WEB_QUEUE_SIZE)
+        self.pending_frames = 0
+        self.writer: Optional[asyncio.Task] = None
+
+    def enqueue(self, payload, is_frame: bool = False):
+        """Queue a message, dropping the oldest if the client has fallen behind."""
+        if self.queue.full():
+            _, dropped_frame = self.queue.get_nowait()
+            if dropped_frame:
+                self.pending_frames -= 1
+        if is_frame:
+            self.pending_frames += 1
+        self.queue.put_nowait((payload, is_frame))
+
+    async def run_writer(self):
+        """Drain the queue onto the socket until it fails or is cancelled.
+
+        Takes whatever is queued (up to WRITER_BATCH) per wakeup. Within a batch
+        only the newest binary frame per window is sent, since it supersedes
+        the older ones; the first 4 header bytes identify the window.
+        """
+        ws = self.ws
+        outbox = self.queue
         try:
-            return await relay_to_pc(endpoint, method, data)
-        except (asyncio.TimeoutError, ConnectionError) as e:
-            if attempt == max_retries - 1:
-                raise HTTPException(status_code=504, detail=f"Request failed after {max_retries} attempts")
-
-            delay = base_delay * (2 ** attempt)  # 1s, 2s, 4s
-            print(f"[RETRY] Attempt {attempt + 1} failed for {endpoint}, retrying in {delay}s")
-            await asyncio.sleep(delay)
-
-async def relay_to_pc(endpoint: str, method: str = "GET", data: dict = None) -> dict:
-    """Relay a request to the connected PC."""
-    global pc_connection, pending_requests
-
-    if pc_connection is None:
-        raise HTTPException(status_code=503, detail="PC not connected")
-
-    request_id = secrets.token_hex(8)
-    future = asyncio.get_event_loop().create_future()
-    pending_requests[request_id] = future
-
-    try:
-        await pc_connection.send_json({
-            "type": "request",
-            "request_id": request_id,
-            "endpoint": endpoint,
-            "method": method,
-            "data": data
-        })
-
-        # Wait for response with timeout
-        response = await asyncio.wait_for(future, timeout=30.0)
-        return response
-    except asyncio.TimeoutError:
-        raise HTTPException(status_code=504, detail="Request timed out")
-    finally:
-        pending_requests.pop(request_id, None)
-
-
-# Proxy all API endpoints to the PC
-@app.get("/api/apps")
-async def get_apps():
-    return await relay_to_pc_deduplicated("/api/apps", "GET")
-
-
-@app.post("/api/apps")
-async def save_apps(request: Request):
-    data = await request.json()
-    return await relay_to_pc_deduplicated("/api/apps", "POST", data)
-
-
-@app.post("/api/launch/{app_id}")
-async def launch_app(app_id: str):
-    return await relay_to_pc_deduplicated(f"/api/launch/{app_id}", "POST")
-
-
-@app.post("/api/launch-custom")
-async def launch_custom(request: Request):
-    data = await request.json()
-    return await relay_to_pc_deduplicated("/api/launch-custom", "POST", data)
-
-
-@app.get("/api/windows")
-async def get_windows():
-    return await relay_to_pc_deduplicated("/api/windows", "GET")
-
-
-@app.post("/api/windows/{window_id}/focus")
-async def focus_window(window_id: str):
-    return await relay_to_pc_deduplicated(f"/api/windows/{window_id}/focus", "POST")
-
-
-@app.post("/api/windows/{window_id}/close")
-async def close_window(window_id: str):
-    return await relay_to_pc_deduplicated(f"/api/windows/{window_id}/close", "POST")
+            while True:
+                batch = [await outbox.get()]
+                while len(batch) < WRITER_BATCH and not outbox.empty():
+                    batch.append(outbox.get_nowait())
+
+                newest = {}
+                for i, (payload, is_frame) in enumerate(batch):
+                    if is_frame:
+                        self.pending_frames -= 1
+                        if isinstance(payload, bytes):
+                            newest[payload[:4]] = i
+
+                for i, (payload, is_frame) in enumerate(batch):
+                    if isinstance(payload, bytes):
+                        if newest[payload[:4]] == i:
+                            await ws.send_bytes(payload)
+                    else:
+                        await ws.send_text(payload)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            await prune_web_connections([ws])
+
+
+def broadcast_web(payload):
+    """Queue one JSON message for every web client, encoding it only once.
+
+    payload is a dict, or already-encoded JSON text for messages forwarded
+    verbatim from the PC. Never awaits, so the PC receive loop is not held up
+    by slow web clients.
+    """
+    if not state.webs:
+        return
+    text = payload if isinstance(payload, str) else _dumps(payload)
+    for client in state.webs.values():
+        client.enqueue(text)
 
 
-@app.post("/api/windows/{window_id}/minimize")
-async def minimize_window(window_id: str):
-    return await relay_to_pc_deduplicated(f"/api/windows/{window_id}/minimize", "POST")
+HOST_EVENT_WINDOW = 0.02  # seconds a burst of host membership changes is coalesced
 
 
-@app.post("/api/windows/{window_id}/maximize")
-async def maximize_window(window_id: str):
-    return await relay_to_pc_deduplicated(f"/api/windows/{window_id}/maximize", "POST")
+def broadcast_host_event(event: dict):
+    """Queue a host membership event; a burst within HOST_EVENT_WINDOW goes out as one message."""
+    state.host_events.append(event)
+    if state.host_events_flush is None:
+        state.host_events_flush = asyncio.get_running_loop().call_later(HOST_EVENT_WINDOW, _flush_host_events)
 
 
-@app.get("/api/system/volume")
-async def get_volume():
-    return await relay_to_pc_deduplicated("/api/system/volume", "GET")
+def _flush_host_events():
+    state.host_events_flush = None
+    events, state.host_events = state.host_events, []
+    if len(events) == 1:
+        broadcast_web(events[0])
+    else:
+        broadcast_web({"type": "host_events", "events": events})
 
 
-@app.post("/api/system/volume")
-async def set_volume(request: Request):
-    data = await request.json()
-    return await relay_to_pc_deduplicated("/api/system/volume", "POST", data)
+def forward_frame(frame):
+    """Queue a stream frame (raw bytes or JSON text) for every web client that isn't backed up."""
+    for client in state.webs.values():
+        if client.pending_frames < MAX_PENDING_FRAMES:
+            client.enqueue(frame, is_frame=True)
 
 
-@app.post("/api/system/volume/mute")
-async def toggle_mute():
-    return await relay_to_pc_deduplicated("/api/system/volume/mute", "POST")
+async def prune_web_connections(dead: list[WebSocket]):
+    """Forget web clients whose sends failed and close their sockets."""
+    for wc in dead:
+        state.webs.pop(wc, None)
+    for wc in dead:
+        try:
+            await asyncio.shield(asyncio.wait_for(wc.close(), timeout=1.0))
+        except Exception:
+            pass
+    log.info("[WS] Pruned %d dead web client(s), %d remaining", len(dead), len(state.webs))
 
 
-@app.get("/api/system/brightness")
-async def get_brightness():
-    return await relay_to_pc_deduplicated("/api/system/brightness", "GET")
+OFFLOAD_THRESHOLD = 32 * 1024  # Bodies larger than this are (de)serialized off the event loop
 
 
-@app.post("/api/system/brightness")
-async def set_brightness(request: Request):
-    data = await request.json()
-    return await relay_to_pc_deduplicated("/api/system/brightness", "POST", data)
+async def run_json_work(func, *args, size: int = 0):
+    """Run JSON encode/decode work inline, or in the default executor for large bodies."""
+    if size > OFFLOAD_THRESHOLD:
+        return await asyncio.get_running_loop().run_in_executor(None, func, *args)
+    return func(*args)
 
 
-@app.get("/api/clipboard")
-async def get_clipboard():
-    return await relay_to_pc_deduplicated("/api/clipboard", "GET")
+def generate_request_hash(endpoint: str, method: str, data: dict, raw_body: bytes = b"") -> str:
+    """Generate deterministic hash for request deduplication.
 
+    Hashes the raw request body when there is one; otherwise falls back to a
+    key-sorted encoding of data.
+    """
+    if raw_body:
+        payload = raw_body
+    elif data:
+        payload = orjson.dumps(data, option=orjson.OPT_SORT_KEYS)
+    else:
+        payload = b"null"
+    return hashlib.blake2b(f"{endpoint}:{method}:".encode() + payload, digest_size=16).hexdigest()
 
-@app.post("/api/clipboard")
-async def set_clipboard(request: Request):
-    data = await request.json()
-    return await relay_to_pc_deduplicated("/api/clipboard", "POST", data)
 
+async def relay_to_pc_deduplicated(endpoint: str, method: str = "GET", data: dict = None,
+                                   raw_body: bytes = b"") -> dict:
+    """Relay a request to the connected PC with deduplication to prevent double-sends.
 
-@app.post("/api/paste-image")
-async def paste_image(request: Request):
-    """Paste an image to the desktop clipboard and simulate Ctrl+V."""
-    data = await request.json()
-    return await relay_to_pc_deduplicated("/api/paste-image", "POST", data)
+    Duplicates within DEDUP_WINDOW share the first request's result (awaiting
+    it if still in flight) rather than reaching the PC a second time. The upstream
+    call runs in its own task, so a caller that disconnects doesn't cancel it for the
+    others; every caller (the first included) only awaits a shield of it.
+    """
+    body_size = len(raw_body)
 
+    # Hash, look up and register with no await in between, so two concurrent
+    # duplicates can't both miss the entry (blake2b is fast enough to run inline)
+    req_hash = generate_request_hash(endpoint, method, data, raw_body)
+    current_time = time.time()
 
-@app.get("/api/rustdesk/status")
-async def get_rustdesk_status():
-    return await relay_to_pc_deduplicated("/api/rustdesk/status", "GET")
+    # Clean expired entries
+    while recent_requests:
+        oldest_time, _ = next(iter(recent_requests.values()))
+        if current_time - oldest_time <= DEDUP_WINDOW:
+            break
+        recent_requests.popitem(last=False)
+
+    # Coalesce onto a recent duplicate
+    entry = recent_requests.get(req_hash)
+    if entry is not None:
+        log.info("[DEDUP] Coalescing duplicate request: %s", endpoint)
+        return await asyncio.shield(entry[1])
 
+    # Record request and proceed
+    task = asyncio.create_task(relay_to_pc_reliable(endpoint, method, data, body_size))
+    recent_requests[req_hash] = (current_time, task)
+    _dedup_tasks.add(task)
+    task.add_done_callback(lambda t: _dedup_done(req_hash, t))
+    return await asyncio.shield(task)
 
-@app.get("/api/rustdesk/devices")
-async def get_rustdesk_devices():
-    """Get saved RustDesk devices."""
-    return await relay_to_pc_deduplicated("/api/rustdesk/devices", "GET")
 
+_dedup_tasks: Set[asyncio.Task] = set()  # Strong refs to upstream calls that outlive their entry
 
-@app.post("/api/rustdesk/connect")
-async def rustdesk_connect(request: Request):
-    """Connect to a RustDesk device."""
-    data = await request.json()
-    return await relay_to_pc_deduplicated("/api/rustdesk/connect", "POST", data)
 
+def _dedup_done(req_hash: str, task: asyncio.Task):
+    """Drop a failed request's entry so it can be retried straight away."""
+    _dedup_tasks.discard(task)
+    if task.cancelled() or task.exception() is not None:  # exception() also marks it retrieved
+        entry = recent_requests.get(req_hash)
+        if entry is not None and entry[1] is task:
+            del recent_requests[req_hash]
 
-@app.get("/api/system/info")
-async def get_system_info():
-    return await relay_to_pc_deduplicated("/api/system/info", "GET")
 
+async def relay_to_pc_reliable(endpoint: str, method: str = "GET", data: dict = None,
+                               body_size: int = 0) -> dict:
+    """Relay a request to the connected PC with retry logic for reliability"""
+    max_retries = 3
+    base_delay = 1.0
 
-@app.post("/api/action/lock")
-async def action_lock():
-    return await relay_to_pc_deduplicated("/api/action/lock", "POST")
+    for attempt in range(max_retries):
+        try:
+            return await relay_to_pc(endpoint, method, data, body_size)
+        except (asyncio.TimeoutError, ConnectionError) as e:
+            if attempt == max_retries - 1:
+                raise HTTPException(status_code=504, detail=f"Request failed after {max_retries} attempts")
 
+            delay = base_delay * (2 ** attempt)  # 1s, 2s, 4s
+            log.warning("[RETRY] Attempt %d failed for %s, retrying in %ss", attempt + 1, endpoint, delay)
+            await asyncio.sleep(delay)
 
-@app.post("/api/action/sleep")
-async def action_sleep():
-    return await relay_to_pc_deduplicated("/api/action/sleep", "POST")
 
+async def relay_to_pc(endpoint: str, method: str = "GET", data: dict = None,
+                      body_size: int = 0) -> dict:
+    """Relay a request to the connected PC."""
+    async with _relay_slots:
+        # Read the active PC once so a concurrent host switch can't swap it mid-request
+        pc = state.pc
+        if pc is None:
+            raise HTTPException(status_code=503, detail="PC not connected")
+
+        request_id = str(next(_req_counter))
+        message = await run_json_work(_dumps, {
+            "type": "request",
+            "request_id": request_id,
+            "endpoint": endpoint,
+            "method": method,
+            "data": data
+        }, size=body_size)
 
-@app.post("/api/action/screenshot")
-async def action_screenshot():
-    return await relay_to_pc_deduplicated("/api/action/screenshot", "POST")
+        # The future unregisters itself however it completes (result, timeout, cancel)
+        pending = state.pending
+        future = asyncio.get_running_loop().create_future()
+        pending[request_id] = future
+        future.add_done_callback(lambda _f: pending.pop(request_id, None))
 
+        try:
+            await flush_input(pc)
+            await pc.send_text(message)
+        except Exception:
+            future.cancel()
+            raise
 
-# Window streaming endpoints
-@app.get("/api/windows/{window_id}/info")
-async def get_window_info(window_id: str):
-    return await relay_to_pc_deduplicated(f"/api/windows/{window_id}/info", "GET")
+        # Wait for response with timeout
+        try:
+            async with asyncio.timeout(30.0):
+                return await future
+        except asyncio.TimeoutError:
+            raise HTTPException(status_code=504, detail="Request timed out")
 
 
+# Window snapshot takes typed query params, so it stays an explicit route
 @app.get("/api/windows/{window_id}/snapshot")
 async def get_window_snapshot(window_id: str, quality: int = 60, max_width: int = 800):
     return await relay_to_pc_deduplicated(f"/api/windows/{window_id}/snapshot", "GET", {"quality": quality, "max_width": max_width})
 
 
-# Chrome control endpoints
-@app.post("/api/windows/{window_id}/chrome/navigate")
-async def chrome_navigate(window_id: str, request: Request):
-    data = await request.json()
-    return await relay_to_pc_deduplicated(f"/api/windows/{window_id}/chrome/navigate", "POST", data)
-
-
-@app.post("/api/windows/{window_id}/chrome/back")
-async def chrome_back(window_id: str):
-    return await relay_to_pc_deduplicated(f"/api/windows/{window_id}/chrome/back", "POST")
-
-
-@app.post("/api/windows/{window_id}/chrome/forward")
-async def chrome_forward(window_id: str):
-    return await relay_to_pc_deduplicated(f"/api/windows/{window_id}/chrome/forward", "POST")
-
-
-@app.post("/api/windows/{window_id}/chrome/refresh")
-async def chrome_refresh(window_id: str):
-    return await relay_to_pc_deduplicated(f"/api/windows/{window_id}/chrome/refresh", "POST")
+# Proxy every other API endpoint to the PC. Must be registered after the
+# local /api routes above so those are matched first.
+@app.api_route("/api/{path:path}", methods=["GET", "POST"])
+async def proxy_to_pc(path: str, request: Request):
+    data = None
+    body = b""
+    if request.method == "POST":
+        body = await request.body()
+        if body:
+            try:
+                data = await run_json_work(orjson.loads, body, size=len(body))
+            except orjson.JSONDecodeError:
+                raise HTTPException(status_code=400, detail="Invalid JSON body")
+    return await relay_to_pc_deduplicated(f"/api/{path}", request.method, data, body)
 
 
-@app.post("/api/windows/{window_id}/chrome/new-tab")
-async def chrome_new_tab(window_id: str):
-    return await relay_to_pc_deduplicated(f"/api/windows/{window_id}/chrome/new-tab", "POST")
+INPUT_BATCH_WINDOW = 0.01  # Seconds of mouse/scroll input coalesced into one frame to the PC
 
 
-@app.post("/api/windows/{window_id}/chrome/close-tab")
-async def chrome_close_tab(window_id: str):
-    return await relay_to_pc_deduplicated(f"/api/windows/{window_id}/chrome/close-tab", "POST")
+class InputBatcher:
+    """Coalesces high-rate remote_mouse/remote_scroll messages into one input_batch frame.
 
+    Consecutive mouse moves on the same window keep only the latest position, and
+    consecutive scrolls on the same window sum their deltas. Anything that must keep its
+    place relative to other PC-bound traffic (button down/up, terminal keys, API calls)
+    is preceded by flush(), so the batch never reorders input.
+    """
 
-@app.post("/api/windows/{window_id}/chrome/next-tab")
-async def chrome_next_tab(window_id: str):
-    return await relay_to_pc_deduplicated(f"/api/windows/{window_id}/chrome/next-tab", "POST")
+    def __init__(self, ws: WebSocket):
+        self.ws = ws
+        self.events: list[dict] = []
+        self._flush_task: Optional[asyncio.Task] = None
+
+    def add(self, event: dict):
+        events = self.events
+        if events:
+            last = events[-1]
+            if event["type"] == last["type"] and event.get("window_id") == last.get("window_id"):
+                if event["type"] == "remote_scroll":
+                    last["delta_x"] = last.get("delta_x", 0) + event.get("delta_x", 0)
+                    last["delta_y"] = last.get("delta_y", 0) + event.get("delta_y", 0)
+                    return
+                if event.get("action") == "move" and last.get("action") == "move":
+                    events[-1] = event
+                    return
+        events.append(event)
+        if self._flush_task is None:
+            self._flush_task = asyncio.create_task(self._flush_later())
+
+    async def _flush_later(self):
+        await asyncio.sleep(INPUT_BATCH_WINDOW)
+        self._flush_task = None
+        await self._send()
+
+    async def flush(self):
+        """Send any pending events now, ahead of a message that must follow them."""
+        self.cancel()
+        if self.events:
+            await self._send()
+
+    async def _send(self):
+        events, self.events = self.events, []
+        try:
+            await self.ws.send_text(_dumps({"type": "input_batch", "events": events}))
+        except Exception as e:
+            log.warning("[RELAY] Failed to forward input batch: %s", e)
 
+    def cancel(self):
+        if self._flush_task is not None:
+            self._flush_task.cancel()
+            self._flush_task = None
 
-@app.post("/api/windows/{window_id}/chrome/prev-tab")
-async def chrome_prev_tab(window_id: str):
-    return await relay_to_pc_deduplicated(f"/api/windows/{window_id}/chrome/prev-tab", "POST")
 
+async def flush_input(pc: WebSocket):
+    """Send a PC's pending batched input before some other message goes to it."""
+    batcher = state.input_batchers.get(pc)
+    if batcher is not None:
+        await batcher.flush()
 
-# Window snap/split endpoints
-@app.post("/api/windows/{window_id}/restore")
-async def window_restore(window_id: str):
-    return await relay_to_pc_deduplicated(f"/api/windows/{window_id}/restore", "POST")
 
+async def _sync_input_batcher(host: HostConnection):
+    """Create or drop a host's input batcher to match its advertised capabilities."""
+    if host.capabilities.get("input_batch"):
+        if host.ws not in state.input_batchers:
+            state.input_batchers[host.ws] = InputBatcher(host.ws)
+    else:
+        batcher = state.input_batchers.pop(host.ws, None)
+        if batcher is not None:
+            await batcher.flush()
+
+
+async def _on_host_register(host: HostConnection, data: dict, text: str):
+    """Handle host registration message - this officially adds the host."""
+    host.host_name = data.get("host_name", host.host_id)
+    host.platform = data.get("platform", "Unknown")
+    host.platform_version = data.get("platform_version", "")
+    host.capabilities = data.get("capabilities", {})
+    host.refresh()
+    invalidate_pc_status()
+
+    if host.registered:
+        # Host already registered, just update info
+        await _sync_input_batcher(host)
+        log.info("Host updated: %s (%s)", host.host_name, host.platform)
+        broadcast_host_event({
+            "type": "host_updated",
+            "host": host.to_dict()
+        })
+        return
 
-@app.post("/api/windows/{window_id}/snap/left")
-async def window_snap_left(window_id: str):
-    return await relay_to_pc_deduplicated(f"/api/windows/{window_id}/snap/left", "POST")
+    # Now officially register the host
+    pc_connections[host.host_id] = host
+    host.registered = True
+    await _sync_input_batcher(host)
 
+    # Set as active connection if no other hosts connected
+    if state.pc is None:
+        set_active_host(host)
 
-@app.post("/api/windows/{window_id}/snap/right")
-async def window_snap_right(window_id: str):
-    return await relay_to_pc_deduplicated(f"/api/windows/{window_id}/snap/right", "POST")
+    log.info("Host registered: %s (%s)", host.host_name, host.platform)
+    log.info("Total hosts connected: %d", len(pc_connections))
 
+    # Start health monitoring if this is the first host
+    if len(pc_connections) == 1:
+        await health_monitor.start_monitoring()
 
-@app.post("/api/windows/{window_id}/snap/top-left")
-async def window_snap_top_left(window_id: str):
-    return await relay_to_pc_deduplicated(f"/api/windows/{window_id}/snap/top-left", "POST")
+    # Notify web clients about new host (only after registration)
+    broadcast_host_event({
+        "type": "host_connected",
+        "host": host.to_dict(),
+        "hosts_count": len(pc_connections)
+    })
 
 
-@app.post("/api/windows/{window_id}/snap/top-right")
-async def window_snap_top_right(window_id: str):
-    return await relay_to_pc_deduplicated(f"/api/windows/{window_id}/snap/top-right", "POST")
+async def _on_health_pong(host: HostConnection, data: dict, text: str):
+    """Handle health check response."""
+    await health_monitor.handle_health_pong(data)
 
 
-@app.post("/api/windows/{window_id}/snap/bottom-left")
-async def window_snap_bottom_left(window_id: str):
-    return await relay_to_pc_deduplicated(f"/api/windows/{window_id}/snap/bottom-left", "POST")
+async def _on_response(host: HostConnection, data: dict, text: str):
+    """Resolve the pending request this response answers."""
+    future = state.pending.get(data.get("request_id"))
+    if future is not None and not future.done():
+        future.set_result(data.get("data", {}))
 
 
-@app.post("/api/windows/{window_id}/snap/bottom-right")
-async def window_snap_bottom_right(window_id: str):
-    return await relay_to_pc_deduplicated(f"/api/windows/{window_id}/snap/bottom-right", "POST")
+async def _on_forward(host: HostConnection, data: dict, text: str):
+    """Forward the message verbatim to all web clients."""
+    broadcast_web(text)
 
 
-# Folders API endpoints
-@app.post("/api/folders/search")
-async def folders_search(request: Request):
-    data = await request.json()
-    return await relay_to_pc_deduplicated("/api/folders/search", "POST", data)
+async def _on_stream_frame(host: HostConnection, data: dict, text: str):
+    """Forward a legacy JSON stream frame to all web clients with frame dropping."""
+    forward_frame(text)
 
 
-@app.post("/api/folders/open")
-async def folders_open(request: Request):
-    data = await request.json()
-    return await relay_to_pc_deduplicated("/api/folders/open", "POST", data)
+# PC message type -> handler(host, data, text)
+PC_MESSAGE_HANDLERS = {
+    "host_register": _on_host_register,
+    "health_pong": _on_health_pong,
+    "response": _on_response,
+    "broadcast": _on_forward,
+    "stream_frame": _on_stream_frame,
+    "stream_error": _on_forward,
+    "stream_status": _on_forward,
+    "terminal_output": _on_forward,
+}
 
 
 @app.websocket("/ws/pc")
 async def pc_websocket(websocket: WebSocket):
     """WebSocket endpoint for the PC client."""
-    global pc_connection
-
-    # Accept connection first (required by FastAPI before any interaction)
-    await websocket.accept()
 
-    # Check auth token
+    # Validate before accept() so rejected probes never complete the handshake
+    # (closing an unaccepted socket answers the upgrade with HTTP 403)
     token = websocket.query_params.get("token")
-    if token != AUTH_TOKEN:
+    if not token_matches(token):
         await websocket.close(code=4001, reason="Invalid token")
         return
 
     # Require explicit host_id - no random fallback to prevent ghost connections
     host_id = websocket.query_params.get("host_id")
     if not host_id:
-        print("PC connection rejected: missing host_id")
+        log.warning("PC connection rejected: missing host_id")
         await websocket.close(code=4002, reason="host_id required")
         return
 
+    await websocket.accept()
+
     # Deduplication: Close old connection if same host_id reconnects
     if host_id in pc_connections:
         old_host = pc_connections[host_id]
-        print(f"Host {host_id} reconnecting - closing old connection")
+        log.info("Host %s reconnecting - closing old connection", host_id)
         try:
             await old_host.ws.close(code=4003, reason="Reconnected from another session")
-        except:
+        except Exception:
             pass
         pc_connections.pop(host_id, None)
-        # Clear pc_connection if it was the old one
-        if pc_connection == old_host.ws:
-            pc_connection = None
+        invalidate_pc_status()
+        # Clear the active PC if it was the old one
+        if state.pc is old_host.ws:
+            set_active_host(None)
 
     # Create host connection (but don't announce yet - wait for host_register)
     host = HostConnection(websocket, host_id)
-    host_registered = False  # Track if host has sent registration
 
-    print(f"PC connected: {host_id} from {websocket.client.host} (awaiting registration)")
+    log.info("PC connected: %s from %s (awaiting registration)", host_id, websocket.client.host)
 
     try:
         while True:
             message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                raise WebSocketDisconnect(message.get("code", 1000))
+            payload = message.get("bytes") or message.get("text")
+            if payload and len(payload) > MAX_PC_MESSAGE:
+                log.warning("[WS] PC %s sent oversized message (%d bytes), closing", host_id, len(payload))
+                await websocket.close(code=1009)
+                raise WebSocketDisconnect(code=1009)
 
             # Binary message — forward stream frame directly to web clients
             if "bytes" in message and message["bytes"]:
-                raw_bytes = message["bytes"]
-                MAX_PENDING_FRAMES = 3
-                for wc in web_connections:
-                    try:
-                        if hasattr(wc, '_pending_frames'):
-                            if wc._pending_frames >= MAX_PENDING_FRAMES:
-                                continue
-                        else:
-                            wc._pending_frames = 0
-                        wc._pending_frames += 1
-                        await wc.send_bytes(raw_bytes)
-                        wc._pending_frames = max(0, wc._pending_frames - 1)
-                    except:
-                        if hasattr(wc, '_pending_frames'):
-                            wc._pending_frames = 0
-                continue
-
-            # Text message — parse as JSON
-            data = json.loads(message.get("text", "{}"))
-            msg_type = data.get("type", "")
-
-            # Handle host registration message - this officially adds the host
-            if msg_type == "host_register":
-                host.host_name = data.get("host_name", host_id)
-                host.platform = data.get("platform", "Unknown")
-                host.platform_version = data.get("platform_version", "")
-                host.capabilities = data.get("capabilities", {})
-
-                # Now officially register the host
-                if not host_registered:
-                    pc_connections[host_id] = host
-                    host_registered = True
-
-                    # Set as active connection if no other hosts connected
-                    if pc_connection is None:
-                        pc_connection = websocket
-
-                    print(f"Host registered: {host.host_name} ({host.platform})")
-                    print(f"Total hosts connected: {len(pc_connections)}")
-
-                    # Start health monitoring if this is the first host
-                    if len(pc_connections) == 1:
-                        await health_monitor.start_monitoring()
-
-                    # Notify web clients about new host (only after registration)
-                    for wc in web_connections:
-                        try:
-                            await wc.send_json({
-                                "type": "host_connected",
-                                "host": host.to_dict(),
-                                "hosts_count": len(pc_connections)
-                            })
-                        except:
-                            pass
-                else:
-                    # Host already registered, just update info
-                    print(f"Host updated: {host.host_name} ({host.platform})")
-                    for wc in web_connections:
-                        try:
-                            await wc.send_json({
-                                "type": "host_updated",
-                                "host": host.to_dict()
-                            })
-                        except:
-                            pass
-                continue
-
-            if msg_type == "health_pong":
-                # Handle health check response
-                await health_monitor.handle_health_pong(data)
+                forward_frame(message["bytes"])
                 continue
 
-            if msg_type == "response":
-                # Handle response to a pending request
-                request_id = data.get("request_id")
-                if request_id in pending_requests:
-                    pending_requests[request_id].set_result(data.get("data", {}))
-
-            elif msg_type == "broadcast":
-                # Broadcast to all web clients
-                for wc in web_connections:
-                    try:
-                        await wc.send_json(data)
-                    except:
-                        pass
-
-            elif msg_type == "stream_frame":
-                # Forward stream frame to all web clients with frame dropping
-                MAX_PENDING_FRAMES = 3  # Drop frames if client queue > 3
-
-                for wc in web_connections:
-                    try:
-                        # Check if client has too many pending frames
-                        if hasattr(wc, '_pending_frames'):
-                            if wc._pending_frames >= MAX_PENDING_FRAMES:
-                                print(f"[FRAME-DROP] Client queue full ({wc._pending_frames} frames), dropping frame")
-                                continue  # Skip this frame for this client
-                        else:
-                            wc._pending_frames = 0
-
-                        # Track pending frame
-                        wc._pending_frames += 1
-                        await wc.send_json(data)
-                        # Frame sent successfully, decrement counter
-                        wc._pending_frames = max(0, wc._pending_frames - 1)
-                    except:
-                        # Reset counter on error
-                        if hasattr(wc, '_pending_frames'):
-                            wc._pending_frames = 0
-
-            elif msg_type == "stream_error":
-                # Forward stream error to all web clients
-                for wc in web_connections:
-                    try:
-                        await wc.send_json(data)
-                    except:
-                        pass
-
-            elif msg_type == "stream_status":
-                # Forward stream status to all web clients
-                for wc in web_connections:
-                    try:
-                        await wc.send_json(data)
-                    except:
-                        pass
-
-            elif msg_type == "terminal_output":
-                # Forward terminal output to all web clients
-                for wc in web_connections:
-                    try:
-                        await wc.send_json(data)
-                    except:
-                        pass
+            # Text message — parse as JSON and dispatch on type
+            text = message.get("text") or "{}"
+            data = orjson.loads(text)
+            handler = PC_MESSAGE_HANDLERS.get(data.get("type", ""))
+            if handler is not None:
+                await handler(host, data, text)
 
     except WebSocketDisconnect:
-        print(f"PC disconnected: {host_id} (was registered: {host_registered})")
+        log.info("PC disconnected: %s (was registered: %s)", host_id, host.registered)
+        batcher = state.input_batchers.pop(websocket, None)
+        if batcher is not None:
+            batcher.cancel()
 
         # Only cleanup if host was actually registered
-        if host_registered:
+        if host.registered:
             # Remove from connections
             pc_connections.pop(host_id, None)
+            invalidate_pc_status()
 
             # If this was the active connection, switch to another or None
-            if pc_connection == websocket:
-                if pc_connections:
-                    # Switch to first available host
-                    first_host = next(iter(pc_connections.values()))
-                    pc_connection = first_host.ws
-                    print(f"Switched to host: {first_host.host_id}")
-                else:
-                    pc_connection = None
+            release_active_host(websocket)
 
-            print(f"Remaining hosts: {len(pc_connections)}")
+            log.info("Remaining hosts: %d", len(pc_connections))
 
             # Notify web clients about disconnected host
-            for wc in web_connections:
-                try:
-                    await wc.send_json({
-                        "type": "host_disconnected",
-                        "host_id": host_id,
-                        "hosts_count": len(pc_connections)
-                    })
-                except:
-                    pass
+            broadcast_host_event({
+                "type": "host_disconnected",
+                "host_id": host_id,
+                "hosts_count": len(pc_connections)
+            })
         else:
-            print(f"Unregistered connection closed (no cleanup needed)")
+            log.info("Unregistered connection closed (no cleanup needed)")
+
+
+# Fixed replies, pre-encoded around the echoed field (text frames:
+# binary messages are reserved for JPEG stream frames)
+STREAM_ERR_PREFIX = '{"type":"stream_error","window_id":'
+STREAM_ERR_SUFFIX = ',"error":"PC not connected"}'
+TERMINAL_ERR_PREFIX = '{"type":"terminal_output","session_id":'
+TERMINAL_ERR_SUFFIX = ',"text":"PC not connected\\n"}'
+PONG_PREFIX = '{"type":"pong","t":'
+
+
+async def _on_web_ping(client: WebClient, data: dict, raw: str):
+    """Answer a latency ping, echoing the client timestamp."""
+    client.enqueue(PONG_PREFIX + _dumps(data.get("t")) + "}")
+
+
+async def _on_web_stream(client: WebClient, data: dict, raw: str):
+    """Forward stream control messages to PC."""
+    if state.pc:
+        try:
+            await flush_input(state.pc)
+            await state.pc.send_text(raw)
+            return
+        except Exception:
+            pass
+    client.enqueue(STREAM_ERR_PREFIX + _dumps(data.get("window_id")) + STREAM_ERR_SUFFIX)
+
+
+async def _on_web_terminal(client: WebClient, data: dict, raw: str):
+    """Forward terminal control messages to PC."""
+    if log.isEnabledFor(logging.DEBUG):
+        log.debug("[RELAY] Terminal message: %s, window: %s, cmd: %s", data.get("type"), data.get('window_id', 'N/A'), data.get('command', data.get('key', 'N/A')))
+    if state.pc:
+        try:
+            await flush_input(state.pc)
+            await state.pc.send_text(raw)
+            log.debug("[RELAY] Forwarded to PC successfully")
+        except Exception as e:
+            log.warning("[RELAY] Failed to forward: %s", e)
+            client.enqueue(_dumps({
+                "type": "terminal_output",
+                "session_id": data.get("session_id", "default"),
+                "text": f"Failed to send to PC: {e}\n"
+            }))
+    else:
+        log.warning("[RELAY] PC not connected, cannot forward terminal message")
+        client.enqueue(TERMINAL_ERR_PREFIX + _dumps(data.get("session_id", "default")) + TERMINAL_ERR_SUFFIX)
+
+
+async def _on_web_input(client: WebClient, data: dict, raw: str):
+    """Forward mouse/scroll input to PC, batched when the PC supports it."""
+    pc = state.pc
+    if pc:
+        batcher = state.input_batchers.get(pc)
+        if batcher is not None:
+            batcher.add(data)
+            if data.get("type") == "remote_mouse" and data.get("action") != "move":
+                # Button changes go out at once (with anything queued ahead of them)
+                await batcher.flush()
+        else:
+            try:
+                await pc.send_text(raw)
+            except Exception as e:
+                log.warning("[RELAY] Failed to forward %s: %s", data.get("type"), e)
+
+
+# Web message type -> handler(client, data, raw)
+WEB_MESSAGE_HANDLERS = {
+    "ping": _on_web_ping,
+    "stream_start": _on_web_stream,
+    "stream_stop": _on_web_stream,
+    "stream_adjust": _on_web_stream,
+    "terminal_start": _on_web_terminal,
+    "terminal_input": _on_web_terminal,
+    "terminal_stop": _on_web_terminal,
+    "terminal_keystroke": _on_web_terminal,
+    "terminal_command": _on_web_terminal,
+    "terminal_key": _on_web_terminal,
+    "remote_mouse": _on_web_input,
+    "remote_scroll": _on_web_input,
+}
 
 
 @app.websocket("/ws")
 async def web_websocket(websocket: WebSocket):
     """WebSocket endpoint for web clients (authenticated)."""
-    await websocket.accept()
-
-    # Auth: check session cookie or ?token= query param
+    # Auth: check session cookie or ?token= query param before the handshake
     session_cookie = websocket.cookies.get("session")
     token_param = websocket.query_params.get("token")
-    if not (is_authenticated(session_cookie) or token_param == AUTH_TOKEN):
+    if not (is_authenticated(session_cookie) or token_matches(token_param)):
         await websocket.close(code=4001, reason="Authentication required")
         return
 
-    web_connections.append(websocket)
+    await websocket.accept()
 
-    # Send initial status with list of hosts
-    await websocket.send_json({
-        "type": "pc_status",
-        "connected": len(pc_connections) > 0,
-        "hosts": [host.to_dict() for host in pc_connections.values()],
-        "hosts_count": len(pc_connections)
-    })
+    # Initial status goes first in the queue so it precedes any broadcast
+    client = WebClient(websocket)
+    client.enqueue(pc_status_text())
+    state.webs[websocket] = client
+    client.writer = asyncio.create_task(client.run_writer())
+    debug_enabled = log.isEnabledFor(logging.DEBUG)
 
     try:
-        while True:
-            data = await websocket.receive_json()
+        async for raw in websocket.iter_text():
+            if len(raw) > MAX_WEB_MESSAGE:
+                await websocket.close(code=1009)
+                break
+            data = orjson.loads(raw)
             msg_type = data.get("type", "")
 
-            # Log all non-ping messages
-            if msg_type != "ping":
-                print(f"[WS] Received from web: {msg_type} - {data}")
-
-            if msg_type == "ping":
-                await websocket.send_json({"type": "pong", "t": data.get("t")})
-
-            elif msg_type in ("stream_start", "stream_stop", "stream_adjust"):
-                # Forward stream control messages to PC
-                if pc_connection:
-                    try:
-                        await pc_connection.send_json(data)
-                    except:
-                        await websocket.send_json({
-                            "type": "stream_error",
-                            "window_id": data.get("window_id"),
-                            "error": "PC not connected"
-                        })
-                else:
-                    await websocket.send_json({
-                        "type": "stream_error",
-                        "window_id": data.get("window_id"),
-                        "error": "PC not connected"
-                    })
-
-            elif msg_type in ("terminal_start", "terminal_input", "terminal_stop", "terminal_keystroke", "terminal_command", "terminal_key"):
-                # Forward terminal control messages to PC
-                print(f"[RELAY] Terminal message: {msg_type}, window: {data.get('window_id', 'N/A')}, cmd: {data.get('command', data.get('key', 'N/A'))}")
-                if pc_connection:
-                    try:
-                        await pc_connection.send_json(data)
-                        print(f"[RELAY] Forwarded to PC successfully")
-                    except Exception as e:
-                        print(f"[RELAY] Failed to forward: {e}")
-                        await websocket.send_json({
-                            "type": "terminal_output",
-                            "session_id": data.get("session_id", "default"),
-                            "text": f"Failed to send to PC: {e}\n"
-                        })
-                else:
-                    print(f"[RELAY] PC not connected, cannot forward terminal message")
-                    await websocket.send_json({
-                        "type": "terminal_output",
-                        "session_id": data.get("session_id", "default"),
-                        "text": "PC not connected\n"
-                    })
-
-            elif msg_type == "remote_mouse":
-                # Forward mouse operations for text selection
-                print(f"[RELAY] Mouse: {data.get('action')} at ({data.get('x')}, {data.get('y')})")
-                if pc_connection:
-                    try:
-                        await pc_connection.send_json(data)
-                    except Exception as e:
-                        print(f"[RELAY] Failed to forward mouse: {e}")
-
-            elif msg_type == "remote_scroll":
-                # Forward scroll operations to PC
-                print(f"[RELAY] Scroll: delta_y={data.get('delta_y')}")
-                if pc_connection:
-                    try:
-                        await pc_connection.send_json(data)
-                    except Exception as e:
-                        print(f"[RELAY] Failed to forward scroll: {e}")
+            # Log all non-ping messages (skipped entirely unless DEBUG is on)
+            if debug_enabled and msg_type != "ping":
+                log.debug("[WS] Received from web: %s - %s", msg_type, data)
 
-    except WebSocketDisconnect:
-        if websocket in web_connections:
-            web_connections.remove(websocket)
+            handler = WEB_MESSAGE_HANDLERS.get(msg_type)
+            if handler is not None:
+                await handler(client, data, raw)
 
+    except WebSocketDisconnect:
+        pass
+    finally:
+        state.webs.pop(websocket, None)
+        client.writer.cancel()
 
-# Serve frontend
-@app.get("/", response_class=HTMLResponse)
-async def serve_frontend(session: str = Cookie(None)):
-    """Serve the frontend (requires authentication)."""
-    # Check authentication
-    if not is_authenticated(session):
-        return RedirectResponse(url="/login", status_code=303)
-
-    # Try to find index.html in the same directory
-    import os
-    script_dir = os.path.dirname(os.path.abspath(__file__))
-    index_path = os.path.join(script_dir, "index.html")
 
-    if os.path.exists(index_path):
-        return FileResponse(index_path)
+# Authenticated page: browser-only caching, short enough that deploys show up quickly
+INDEX_HEADERS = {"Cache-Control": "private, max-age=60"}
 
-    # Return a simple status page if no frontend
-    return HTMLResponse(f"""
+STATUS_PAGE = """
     <!DOCTYPE html>
     <html>
     <head><title>RustDesk Mobile UI Relay</title></head>
     <body style="font-family: sans-serif; padding: 40px; text-align: center;">
         <h1>RustDesk Mobile UI Relay</h1>
-        <p>PC Connected: <strong>{"Yes" if pc_connection else "No"}</strong></p>
-        <p>Web Clients: <strong>{len(web_connections)}</strong></p>
+        <p>PC Connected: <strong>{pc_connected}</strong></p>
+        <p>Web Clients: <strong>{web_clients}</strong></p>
         <p style="color: #666; margin-top: 40px;">
             Place index.html in the same directory to serve the mobile UI.
         </p>
         <p><a href="/logout">Logout</a></p>
     </body>
     </html>
-    """)
+    """
+
+
+# Serve frontend
+@app.get("/", response_class=HTMLResponse)
+async def serve_frontend(session: str = Cookie(None)):
+    """Serve the frontend (requires authentication)."""
+    # Check authentication
+    if not is_authenticated(session):
+        return RedirectResponse(url="/login", status_code=303)
+
+    if INDEX_STAT is not None:
+        return FileResponse(INDEX_PATH, stat_result=INDEX_STAT, headers=INDEX_HEADERS)
+
+    # Return a simple status page if no frontend
+    return HTMLResponse(STATUS_PAGE.format(pc_connected="Yes" if state.pc else "No",
+                                           web_clients=len(state.webs)))
 
 
 if __name__ == "__main__":
@@ -1205,4 +1339,14 @@ if __name__ == "__main__":
     port = int(os.environ.get("PORT", 8765))
     print(f"Starting relay server on port {port}")
     print(f"Auth token: {AUTH_TOKEN}")
-    uvicorn.run(app, host="0.0.0.0", port=port)
+    try:
+        import uvloop  # noqa: F401  (not available on Windows)
+        loop_impl = "uvloop"
+    except ImportError:
+        loop_impl = "asyncio"
+    # Plain HTTP/WS only: TLS is terminated by the front proxy (Render, nginx, ...),
+    # whose X-Forwarded-* headers are trusted so logs see the real client address
+    uvicorn.run(app, host="0.0.0.0", port=port, loop=loop_impl, http="httptools", ws="websockets",
+                ws_max_size=MAX_PC_MESSAGE, ws_ping_interval=20, ws_ping_timeout=20,
+                ws_per_message_deflate=False,  # Traffic is mostly JPEG frames
+                proxy_headers=True, forwarded_allow_ips=os.environ.get("FORWARDED_ALLOW_IPS", "127.0.0.1"))
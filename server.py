@@ -5,26 +5,34 @@ Provides APIs for window management, system controls, app launching, and window
 """
 
 import asyncio
+import base64
+import functools
+import gzip
 import json
 import os
+import struct
 import subprocess
+import time
+import zlib
 import ctypes
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-from typing import Optional, Dict, Set
+from typing import Optional, Dict, Set, Tuple
 from pathlib import Path
 
-from fastapi import FastAPI, WebSocket, WebSocketDisconnect, HTTPException
+from fastapi import FastAPI, Request, WebSocket, WebSocketDisconnect, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse
+from fastapi.responses import Response
 from pydantic import BaseModel
 
+import orjson
 import pyperclip
 import psutil
 
 # Import window capture module
 try:
-    from window_capture import WindowCapture, ChromeController
+    from window_capture import WindowCapture, WindowCaptureSession, AdaptiveEncoder, ChromeController
     HAS_CAPTURE = WindowCapture.is_available()
 except ImportError:
     HAS_CAPTURE = False
@@ -59,136 +67,251 @@ except ImportError:
     print("Warning: screen_brightness_control not installed. Brightness control disabled.")
 
 
+def _json_dumps(obj) -> str:
+    """Encode a message with orjson as str, so it goes out as a text frame."""
+    return orjson.dumps(obj).decode()
+
+
+# Binary stream frame header: window id hash, width, height, seq (little-endian)
+FRAME_HEADER = struct.Struct('<IHHI')
+
+
+def window_id_hash(window_id: str) -> int:
+    """Frame header id for a window: stable across processes, unlike hash(str)."""
+    return zlib.crc32(window_id.encode())
+
+# Resend an unchanged window at least this often (seconds); doubles as a keepalive
+KEYFRAME_INTERVAL = 5.0
+
+# Stream captures get their own threads so they neither queue behind nor starve the
+# default executor (clipboard, psutil, launches); GDI and libjpeg release the GIL
+CAPTURE_WORKERS = 4
+CAPTURE_POOL = ThreadPoolExecutor(max_workers=CAPTURE_WORKERS, thread_name_prefix="capture")
+
+# A capture loop is shared by viewers with identical settings: (window_id, fps, quality, max_width)
+StreamKey = Tuple[str, int, int, int]
+
+
+class FrameWriter:
+    """Sends stream frames to one client from its own task, newest frame per window only.
+
+    A frame that has not been sent by the time the next one for the same window is
+    captured is replaced, so a slow client skips frames instead of holding up the
+    capture loop (and every other viewer) or building a backlog of stale ones.
+    """
+
+    def __init__(self, websocket: WebSocket, on_dead):
+        self.websocket = websocket
+        self.on_dead = on_dead  # Called with the websocket once a send fails
+        self.latest: Dict[str, bytes] = {}  # window_id -> newest unsent frame
+        self.send_ms = 0.0  # Duration of the last send (grows when the socket backs up)
+        self.ready = asyncio.Event()
+        self.task = asyncio.create_task(self._run())
+
+    def put(self, window_id: str, frame: bytes):
+        """Queue a frame, replacing any unsent one for the same window."""
+        self.latest[window_id] = frame
+        self.ready.set()
+
+    async def _run(self):
+        try:
+            while True:
+                await self.ready.wait()
+                self.ready.clear()
+                frames, self.latest = self.latest, {}
+                for frame in frames.values():
+                    start = time.perf_counter()
+                    await self.websocket.send_bytes(frame)
+                    self.send_ms = (time.perf_counter() - start) * 1000
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            self.on_dead(self.websocket)
+
+    def close(self):
+        self.task.cancel()
+
+
 class StreamManager:
-    """Manages window streaming sessions."""
+    """Manages window streaming sessions.
+
+    Viewers of the same window with the same settings share one capture loop, keyed by
+    (window_id, fps, quality, max_width); the loop stops when its last viewer leaves.
+    """
 
     def __init__(self):
-        self.active_streams: Dict[str, asyncio.Task] = {}  # window_id -> task
-        self.stream_clients: Dict[str, Set[WebSocket]] = {}  # window_id -> set of websockets
-        self.frame_seq: Dict[str, int] = {}  # window_id -> sequence number
+        self.active_streams: Dict[StreamKey, asyncio.Task] = {}  # stream key -> task
+        self.stream_clients: Dict[StreamKey, Set[WebSocket]] = {}  # stream key -> set of websockets
+        self.frame_seq: Dict[StreamKey, int] = {}  # stream key -> sequence number
+        self.last_hash: Dict[StreamKey, Optional[int]] = {}  # stream key -> hash of the last frame sent
+        self.client_streams: Dict[WebSocket, Set[StreamKey]] = {}  # websocket -> stream keys it watches
+        self.writers: Dict[WebSocket, FrameWriter] = {}  # websocket -> its frame writer
 
     async def start_stream(self, window_id: str, websocket: WebSocket,
-                          fps: int = 8, quality: int = 60, max_width: int = 800):
-        """Start streaming a window to a websocket client."""
+                          fps: int = 8, quality: int = 60, max_width: int = 800,
+                          downlink: Optional[float] = None):
+        """Start streaming a window to a websocket client.
+
+        quality and max_width are ceilings; the capture loop lowers them while
+        frames take too long. downlink (Mbps, from the browser) seeds a new loop.
+        """
         if not HAS_CAPTURE:
-            await websocket.send_json({
+            await websocket.send_text(_json_dumps({
                 "type": "stream_error",
                 "window_id": window_id,
                 "error": "Window capture not available"
-            })
+            }))
             return
 
+        # A client watches a window with one set of settings at a time
+        key = (window_id, fps, quality, max_width)
+        self._leave_window(window_id, websocket, keep=key)
+
         # Add client to stream
-        if window_id not in self.stream_clients:
-            self.stream_clients[window_id] = set()
-            self.frame_seq[window_id] = 0
+        if key not in self.stream_clients:
+            self.stream_clients[key] = set()
+            self.frame_seq[key] = 0
 
-        self.stream_clients[window_id].add(websocket)
+        self.stream_clients[key].add(websocket)
+        self.client_streams.setdefault(websocket, set()).add(key)
+        self.last_hash[key] = None  # Send the next frame even if unchanged, so the new viewer gets one
+        if websocket not in self.writers:
+            self.writers[websocket] = FrameWriter(websocket, self.remove_client)
 
         # Start capture loop if not already running
-        if window_id not in self.active_streams or self.active_streams[window_id].done():
-            self.active_streams[window_id] = asyncio.create_task(
-                self._capture_loop(window_id, fps, quality, max_width)
-            )
+        if key not in self.active_streams or self.active_streams[key].done():
+            self.active_streams[key] = asyncio.create_task(self._capture_loop(key, downlink))
 
         # Send status
-        await websocket.send_json({
+        await websocket.send_text(_json_dumps({
             "type": "stream_status",
             "window_id": window_id,
             "status": "active"
-        })
+        }))
 
     async def stop_stream(self, window_id: str, websocket: WebSocket):
         """Stop streaming a window for a client."""
-        if window_id in self.stream_clients:
-            self.stream_clients[window_id].discard(websocket)
-
-            # If no more clients, stop the capture loop
-            if not self.stream_clients[window_id]:
-                if window_id in self.active_streams:
-                    self.active_streams[window_id].cancel()
-                    del self.active_streams[window_id]
-                del self.stream_clients[window_id]
-                del self.frame_seq[window_id]
-
-        await websocket.send_json({
+        self._leave_window(window_id, websocket)
+
+        await websocket.send_text(_json_dumps({
             "type": "stream_status",
             "window_id": window_id,
             "status": "stopped"
-        })
-
-    async def _capture_loop(self, window_id: str, fps: int, quality: int, max_width: int):
+        }))
+
+    def _leave_window(self, window_id: str, websocket: WebSocket, keep: Optional[StreamKey] = None):
+        """Remove a client from every stream of a window except keep."""
+        for key in [key for key in self.client_streams.get(websocket, ()) if key[0] == window_id and key != keep]:
+            self._leave(key, websocket)
+
+    def _leave(self, key: StreamKey, websocket: WebSocket):
+        """Remove a client from one stream, stopping its capture loop if it was the last viewer."""
+        keys = self.client_streams.get(websocket)
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self.client_streams[websocket]
+                writer = self.writers.pop(websocket, None)
+                if writer is not None:
+                    writer.close()
+
+        clients = self.stream_clients.get(key)
+        if clients is None:
+            return
+        clients.discard(websocket)
+
+        # If no more clients, stop the capture loop
+        if not clients:
+            task = self.active_streams.pop(key, None)
+            if task is not None:
+                task.cancel()
+            del self.stream_clients[key]
+            self.frame_seq.pop(key, None)
+            self.last_hash.pop(key, None)
+
+    async def _capture_loop(self, key: StreamKey, downlink: Optional[float] = None):
         """Capture frames and broadcast to clients."""
+        window_id, fps, quality, max_width = key
         interval = 1.0 / fps
         hwnd = int(window_id)
+        window_hash = window_id_hash(window_id)
+        session = WindowCaptureSession(hwnd)  # Keeps the DIB surface between frames
+        encoder = AdaptiveEncoder(quality, max_width, fps, downlink)
 
-        while window_id in self.stream_clients and self.stream_clients[window_id]:
+        try:
+            await self._stream_frames(key, session, encoder, interval, window_hash)
+        finally:
+            # close() waits out a capture still running in its thread; don't block the loop on it
+            CAPTURE_POOL.submit(session.close)
+
+    async def _stream_frames(self, key: StreamKey, session: "WindowCaptureSession", encoder: "AdaptiveEncoder",
+                             interval: float, window_hash: int):
+        window_id = key[0]
+        loop = asyncio.get_running_loop()
+        last_keyframe = 0.0
+        while self.stream_clients.get(key):
             try:
-                # Capture frame
-                result = WindowCapture.capture_window(hwnd, quality=quality, max_width=max_width)
+                # Capture frame, skipping the encode if the pixels haven't changed;
+                # forget the hash periodically to force a keyframe
+                now = loop.time()
+                last_hash = self.last_hash.get(key) if now - last_keyframe < KEYFRAME_INTERVAL else None
+                result = await loop.run_in_executor(
+                    CAPTURE_POOL, session.capture_if_changed, encoder.quality, encoder.max_width, last_hash)
 
                 if result is None:
                     # Window might be closed or minimized
-                    await self._broadcast_error(window_id, "Window not available")
+                    await self._broadcast_error(key, "Window not available")
                     break
 
-                b64_data, width, height = result
-                self.frame_seq[window_id] += 1
-
-                # Broadcast to all clients
-                frame_msg = {
-                    "type": "stream_frame",
-                    "window_id": window_id,
-                    "frame": b64_data,
-                    "width": width,
-                    "height": height,
-                    "seq": self.frame_seq[window_id]
-                }
-
-                dead_clients = set()
-                for client in self.stream_clients.get(window_id, set()):
-                    try:
-                        await client.send_json(frame_msg)
-                    except:
-                        dead_clients.add(client)
-
-                # Remove dead clients
-                if dead_clients and window_id in self.stream_clients:
-                    self.stream_clients[window_id] -= dead_clients
+                jpeg_bytes, width, height, pixels_hash = result
+                if jpeg_bytes is None:
+                    # Unchanged since the last frame; nothing to send
+                    await asyncio.sleep(interval)
+                    continue
+
+                # Pace to the slowest viewer's recent send time as well as the capture
+                clients = self.stream_clients.get(key, ())
+                send_ms = max((self.writers[client].send_ms for client in clients), default=0.0)
+                encoder.update(session.last_ms, send_ms)
+                self.last_hash[key] = pixels_hash
+                last_keyframe = now
+                self.frame_seq[key] += 1
+
+                # Hand the binary frame (12-byte header + raw JPEG) to each viewer's writer
+                frame = FRAME_HEADER.pack(window_hash, width, height, self.frame_seq[key] & 0xFFFFFFFF) + jpeg_bytes
+                for client in self.stream_clients.get(key, ()):
+                    self.writers[client].put(window_id, frame)
 
                 await asyncio.sleep(interval)
 
             except asyncio.CancelledError:
                 break
             except Exception as e:
-                await self._broadcast_error(window_id, str(e))
+                await self._broadcast_error(key, str(e))
                 break
 
-    async def _broadcast_error(self, window_id: str, error: str):
-        """Broadcast error to all clients watching a window."""
+    async def _broadcast_error(self, key: StreamKey, error: str):
+        """Broadcast error to all clients watching a stream."""
         error_msg = {
             "type": "stream_error",
-            "window_id": window_id,
+            "window_id": key[0],
             "error": error
         }
-        for client in self.stream_clients.get(window_id, set()):
-            try:
-                await client.send_json(error_msg)
-            except:
-                pass
+        await self._send_to_clients(key, _json_dumps(error_msg))
+
+    async def _send_to_clients(self, key: StreamKey, message: str):
+        """Send one encoded message to all clients of a stream concurrently, dropping dead ones."""
+        clients = tuple(self.stream_clients.get(key, ()))
+        results = await asyncio.gather(*[client.send_text(message) for client in clients],
+                                       return_exceptions=True)
+        for client, result in zip(clients, results):
+            if isinstance(result, Exception):
+                self._leave(key, client)
 
     def remove_client(self, websocket: WebSocket):
         """Remove a client from all streams."""
-        for window_id in list(self.stream_clients.keys()):
-            if websocket in self.stream_clients[window_id]:
-                self.stream_clients[window_id].discard(websocket)
-                if not self.stream_clients[window_id]:
-                    if window_id in self.active_streams:
-                        self.active_streams[window_id].cancel()
-                        del self.active_streams[window_id]
-                    del self.stream_clients[window_id]
-                    if window_id in self.frame_seq:
-                        del self.frame_seq[window_id]
+        for key in list(self.client_streams.get(websocket, ())):
+            self._leave(key, websocket)
 
 
 # Global stream manager
@@ -305,8 +428,20 @@ CONFIG_FILE = CONFIG_DIR / "apps.json"
 LOCAL_CONFIG = Path(__file__).parent / "apps.json"
 
 
-def load_app_config():
-    """Load app configuration from file or return defaults."""
+# Parsed app config, reused until either config file's mtime changes
+_app_config_cache = {"key": None, "apps": None, "sorted": None, "by_id": None, "body": None}
+
+
+def _config_mtime(path: Path):
+    """Return the file's mtime in ns, or None if it doesn't exist."""
+    try:
+        return path.stat().st_mtime_ns
+    except OSError:
+        return None
+
+
+def _read_app_config():
+    """Read app configuration from file or return defaults."""
     # First check local apps.json
     if LOCAL_CONFIG.exists():
         try:
@@ -326,11 +461,64 @@ def load_app_config():
     return DEFAULT_APPS
 
 
+def _get_app_config_cache() -> dict:
+    """Return the cached config, re-reading it only when a config file changed."""
+    key = (_config_mtime(LOCAL_CONFIG), _config_mtime(CONFIG_FILE))
+    if key != _app_config_cache["key"]:
+        apps = _read_app_config()
+        sorted_apps = sorted(apps, key=lambda x: x.get("priority", 99))
+        _app_config_cache.update(
+            key=key,
+            apps=apps,
+            sorted=sorted_apps,
+            by_id={a.get("id"): a for a in apps},
+            body=orjson.dumps({"apps": sorted_apps}),  # Encoded GET /api/apps response
+        )
+    return _app_config_cache
+
+
+def load_app_config():
+    """Load app configuration from file or return defaults."""
+    return _get_app_config_cache()["apps"]
+
+
+def get_sorted_apps():
+    """Return the app configuration sorted by priority."""
+    return _get_app_config_cache()["sorted"]
+
+
+def get_app_by_id(app_id: str):
+    """Look up a configured app by its ID."""
+    return _get_app_config_cache()["by_id"].get(app_id)
+
+
 def save_app_config(apps):
     """Save app configuration to file."""
     CONFIG_DIR.mkdir(parents=True, exist_ok=True)
     with open(CONFIG_FILE, 'w') as f:
         json.dump(apps, f, indent=2)
+    _app_config_cache["key"] = None
+
+
+# pid -> lowercase process name (without .exe), rebuilt at most once per PROCESS_NAMES_TTL
+PROCESS_NAMES_TTL = 1.0
+_process_names = {"expires": 0.0, "names": {}}
+
+
+def get_process_names() -> Dict[int, str]:
+    """Return a pid -> process name map from one process_iter pass, cached briefly."""
+    now = time.monotonic()
+    if now >= _process_names["expires"]:
+        _process_names["names"] = {
+            p.info["pid"]: (p.info["name"] or "unknown").lower().replace('.exe', '')
+            for p in psutil.process_iter(["pid", "name"])
+        }
+        _process_names["expires"] = now + PROCESS_NAMES_TTL
+    return _process_names["names"]
+
+
+# Shell/system windows that are visible and titled but never useful to control
+SKIP_TITLES = frozenset({"Program Manager", "Settings", "Microsoft Text Input Application"})
 
 
 # Window management functions
@@ -340,26 +528,28 @@ def get_window_list():
         return []
 
     windows = []
+    process_names = get_process_names()
 
     def enum_callback(hwnd, _):
         if win32gui.IsWindowVisible(hwnd):
             title = win32gui.GetWindowText(hwnd)
-            if title and len(title) > 0:
-                # Skip system windows
-                if title in ["Program Manager", "Settings", "Microsoft Text Input Application"]:
+            if title:
+                # Skip system windows and tool windows (floating toolbars, palettes)
+                if title in SKIP_TITLES:
+                    return True
+                if win32gui.GetWindowLong(hwnd, win32con.GWL_EXSTYLE) & win32con.WS_EX_TOOLWINDOW:
                     return True
 
                 try:
                     _, pid = win32process.GetWindowThreadProcessId(hwnd)
-                    process = psutil.Process(pid)
-                    process_name = process.name().lower().replace('.exe', '')
-                except:
-                    process_name = "unknown"
+                except Exception:
+                    pid = 0
+                process_name = process_names.get(pid, "unknown")
 
                 windows.append({
                     "id": str(hwnd),
                     "title": title[:50],  # Truncate long titles
-                    "pid": str(pid) if 'pid' in dir() else "0",
+                    "pid": str(pid),
                     "class": process_name,
                     "icon": get_icon_for_process(process_name)
                 })
@@ -373,46 +563,88 @@ def get_window_list():
     return windows
 
 
+# Substring of a process name -> icon; the first matching entry wins
+ICON_MAP = {
+    "code": "code",
+    "chrome": "chrome",
+    "msedge": "globe",
+    "firefox": "firefox",
+    "windowsterminal": "terminal",
+    "cmd": "terminal",
+    "powershell": "terminal",
+    "pwsh": "terminal",
+    "explorer": "folder",
+    "slack": "message-square",
+    "discord": "message-circle",
+    "spotify": "music",
+    "notepad": "file-text",
+    "winword": "file-text",
+    "excel": "table",
+    "outlook": "mail",
+    "teams": "users",
+}
+
+
+@functools.lru_cache(maxsize=256)
 def get_icon_for_process(process_name: str) -> str:
-    """Map process name to icon name."""
-    icon_map = {
-        "code": "code",
-        "chrome": "chrome",
-        "msedge": "globe",
-        "firefox": "firefox",
-        "windowsterminal": "terminal",
-        "cmd": "terminal",
-        "powershell": "terminal",
-        "pwsh": "terminal",
-        "explorer": "folder",
-        "slack": "message-square",
-        "discord": "message-circle",
-        "spotify": "music",
-        "notepad": "file-text",
-        "winword": "file-text",
-        "excel": "table",
-        "outlook": "mail",
-        "teams": "users",
-    }
-
-    for key, icon in icon_map.items():
+    """Map process name to icon name (memoized: the same few processes own most windows)."""
+    icon = ICON_MAP.get(process_name)
+    if icon is not None:
+        return icon
+    for key, icon in ICON_MAP.items():
         if key in process_name:
             return icon
     return "window"
 
 
+def _init_com_thread():
+    """Enter a COM apartment once for the thread that owns the pycaw/WMI objects."""
+    try:
+        import pythoncom
+        pythoncom.CoInitialize()
+    except ImportError:
+        pass
+
+
+# pycaw's endpoint interface and screen_brightness_control's WMI queries are COM objects
+# tied to the apartment that created them, so every volume/brightness call runs on this
+# one thread instead of the event loop (the WMI brightness calls take hundreds of ms)
+COM_POOL = ThreadPoolExecutor(max_workers=1, thread_name_prefix="com", initializer=_init_com_thread)
+
+
+async def run_com(func, *args):
+    """Run a volume/brightness function on the COM thread."""
+    return await asyncio.get_running_loop().run_in_executor(COM_POOL, func, *args)
+
+
 # Volume control functions
+_endpoint_volume = None  # Speakers' IAudioEndpointVolume, resolved on first use (on the COM thread)
+
+
+def get_endpoint_volume():
+    """Return the speakers' endpoint volume interface, creating it once."""
+    global _endpoint_volume
+    if _endpoint_volume is None:
+        _endpoint_volume = AudioUtilities.GetSpeakers().EndpointVolume
+    return _endpoint_volume
+
+
+def reset_endpoint_volume():
+    """Forget the cached interface (e.g. the default device changed) so the next call re-resolves it."""
+    global _endpoint_volume
+    _endpoint_volume = None
+
+
 def get_volume():
     """Get current system volume level."""
     if not HAS_PYCAW:
         return {"volume": 50, "error": "pycaw not installed"}
 
     try:
-        speakers = AudioUtilities.GetSpeakers()
-        volume = speakers.EndpointVolume
-        current = volume.GetMasterVolumeLevelScalar()
+        current = get_endpoint_volume().GetMasterVolumeLevelScalar()
         return {"volume": int(current * 100)}
     except Exception as e:
+        reset_endpoint_volume()
         return {"volume": 50, "error": str(e)}
 
 
@@ -423,14 +655,25 @@ def set_volume(level: int):
 
     try:
         level = max(0, min(100, level))
-        speakers = AudioUtilities.GetSpeakers()
-        volume = speakers.EndpointVolume
-        volume.SetMasterVolumeLevelScalar(level / 100, None)
+        get_endpoint_volume().SetMasterVolumeLevelScalar(level / 100, None)
         return {"volume": level}
     except Exception as e:
+        reset_endpoint_volume()
         return {"volume": level, "error": str(e)}
 
 
+def toggle_endpoint_mute() -> bool:
+    """Flip the speakers' mute state and return the new state."""
+    try:
+        volume = get_endpoint_volume()
+        muted = not volume.GetMute()
+        volume.SetMute(muted, None)
+        return muted
+    except Exception:
+        reset_endpoint_volume()
+        raise
+
+
 # Brightness control functions
 def get_brightness():
     """Get current display brightness."""
@@ -460,16 +703,35 @@ def set_brightness(level: int):
 
 
 # System info functions
+# Last CPU reading; psutil measures it over the time since the previous sample
+CPU_SAMPLE_INTERVAL = 1.0
+_cpu_sample = {"time": time.monotonic(), "percent": psutil.cpu_percent(interval=None)}
+
+
+def get_cpu_percent() -> float:
+    """CPU usage without blocking: re-sampled at most once per CPU_SAMPLE_INTERVAL."""
+    now = time.monotonic()
+    if now - _cpu_sample["time"] >= CPU_SAMPLE_INTERVAL:
+        _cpu_sample["percent"] = psutil.cpu_percent(interval=None)
+        _cpu_sample["time"] = now
+    return _cpu_sample["percent"]
+
+
+# Facts that don't change while the server runs
+HOSTNAME = os.environ.get("COMPUTERNAME", "Windows PC")
+BOOT_TIME = psutil.boot_time()
+TOTAL_MEMORY = f"{psutil.virtual_memory().total / (1024**3):.1f}GB"
+
+
 def get_system_info():
     """Get system information."""
     info = {}
 
     # Hostname
-    info["hostname"] = os.environ.get("COMPUTERNAME", "Windows PC")
+    info["hostname"] = HOSTNAME
 
     # Uptime
-    boot_time = psutil.boot_time()
-    uptime_seconds = datetime.now().timestamp() - boot_time
+    uptime_seconds = time.time() - BOOT_TIME
     hours, remainder = divmod(int(uptime_seconds), 3600)
     minutes, _ = divmod(remainder, 60)
     info["uptime"] = f"{hours}h {minutes}m"
@@ -477,12 +739,12 @@ def get_system_info():
     # Memory usage
     mem = psutil.virtual_memory()
     info["memory"] = {
-        "total": f"{mem.total / (1024**3):.1f}GB",
+        "total": TOTAL_MEMORY,
         "used": f"{mem.used / (1024**3):.1f}GB"
     }
 
     # CPU usage
-    cpu_percent = psutil.cpu_percent(interval=0.1)
+    cpu_percent = get_cpu_percent()
     info["cpu_usage"] = f"{cpu_percent:.1f}%"
 
     return info
@@ -493,17 +755,18 @@ def get_rustdesk_status():
     rustdesk_running = False
     has_connection = False
 
-    for proc in psutil.process_iter(['name', 'cmdline']):
+    # Names come from the shared pid map; only RustDesk processes get the (costly) cmdline read
+    for pid, name in get_process_names().items():
+        if 'rustdesk' not in name:
+            continue
+        rustdesk_running = True
         try:
-            name = proc.info['name'].lower()
-            if 'rustdesk' in name:
-                rustdesk_running = True
-                cmdline = proc.info.get('cmdline', [])
-                if cmdline and any('--cm' in arg for arg in cmdline):
-                    has_connection = True
-                    break
+            cmdline = psutil.Process(pid).cmdline()
         except (psutil.NoSuchProcess, psutil.AccessDenied):
             continue
+        if any('--cm' in arg for arg in cmdline):
+            has_connection = True
+            break
 
     return {
         "rustdesk_running": rustdesk_running,
@@ -522,8 +785,7 @@ async def health_check():
 @app.get("/api/apps")
 async def get_apps():
     """Get configured applications."""
-    apps = load_app_config()
-    return {"apps": sorted(apps, key=lambda x: x.get("priority", 99))}
+    return Response(content=_get_app_config_cache()["body"], media_type="application/json")
 
 
 @app.post("/api/apps")
@@ -536,8 +798,7 @@ async def save_apps(apps: list[dict]):
 @app.post("/api/launch/{app_id}")
 async def launch_app(app_id: str):
     """Launch an application by ID."""
-    apps = load_app_config()
-    app_config = next((a for a in apps if a["id"] == app_id), None)
+    app_config = get_app_by_id(app_id)
 
     if not app_config:
         raise HTTPException(status_code=404, detail="App not found")
@@ -545,7 +806,8 @@ async def launch_app(app_id: str):
     # Launch in background
     command = app_config["command"]
     try:
-        subprocess.Popen(
+        await asyncio.to_thread(
+            subprocess.Popen,
             command,
             shell=True,
             stdout=subprocess.DEVNULL,
@@ -565,7 +827,8 @@ async def launch_custom(data: dict):
         raise HTTPException(status_code=400, detail="No command provided")
 
     try:
-        subprocess.Popen(
+        await asyncio.to_thread(
+            subprocess.Popen,
             command,
             shell=True,
             stdout=subprocess.DEVNULL,
@@ -580,10 +843,17 @@ async def launch_custom(data: dict):
 @app.get("/api/windows")
 async def get_windows():
     """Get list of open windows."""
-    windows = get_window_list()
+    windows = await asyncio.to_thread(get_window_list)
     return {"windows": windows}
 
 
+def _restore_and_foreground(hwnd: int):
+    """Restore a window if minimized and bring it to the foreground (blocking)."""
+    if win32gui.IsIconic(hwnd):
+        win32gui.ShowWindow(hwnd, win32con.SW_RESTORE)
+    win32gui.SetForegroundWindow(hwnd)
+
+
 @app.post("/api/windows/{window_id}/focus")
 async def focus_window(window_id: str):
     """Focus/activate a window."""
@@ -592,11 +862,7 @@ async def focus_window(window_id: str):
 
     try:
         hwnd = int(window_id)
-        # Restore if minimized
-        if win32gui.IsIconic(hwnd):
-            win32gui.ShowWindow(hwnd, win32con.SW_RESTORE)
-        # Bring to foreground
-        win32gui.SetForegroundWindow(hwnd)
+        await asyncio.to_thread(_restore_and_foreground, hwnd)
         return {"status": "focused"}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -610,7 +876,7 @@ async def close_window(window_id: str):
 
     try:
         hwnd = int(window_id)
-        win32gui.PostMessage(hwnd, win32con.WM_CLOSE, 0, 0)
+        await asyncio.to_thread(win32gui.PostMessage, hwnd, win32con.WM_CLOSE, 0, 0)
         return {"status": "closed"}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -624,7 +890,7 @@ async def minimize_window(window_id: str):
 
     try:
         hwnd = int(window_id)
-        win32gui.ShowWindow(hwnd, win32con.SW_MINIMIZE)
+        await asyncio.to_thread(win32gui.ShowWindow, hwnd, win32con.SW_MINIMIZE)
         return {"status": "minimized"}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -638,7 +904,7 @@ async def maximize_window(window_id: str):
 
     try:
         hwnd = int(window_id)
-        win32gui.ShowWindow(hwnd, win32con.SW_MAXIMIZE)
+        await asyncio.to_thread(win32gui.ShowWindow, hwnd, win32con.SW_MAXIMIZE)
         return {"status": "maximized"}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -653,7 +919,7 @@ async def get_window_info(window_id: str):
 
     try:
         hwnd = int(window_id)
-        info = WindowCapture.get_window_info(hwnd)
+        info = await asyncio.to_thread(WindowCapture.get_window_info, hwnd)
         if "error" in info:
             raise HTTPException(status_code=404, detail=info["error"])
         return info
@@ -673,14 +939,14 @@ async def get_window_snapshot(window_id: str, quality: int = 60, max_width: int
 
     try:
         hwnd = int(window_id)
-        result = WindowCapture.capture_window(hwnd, quality=quality, max_width=max_width)
+        result = await asyncio.to_thread(WindowCapture.capture_window, hwnd, quality, max_width)
 
         if result is None:
             raise HTTPException(status_code=404, detail="Window not available or minimized")
 
-        b64_data, width, height = result
+        jpeg_bytes, width, height = result
         return {
-            "frame": b64_data,
+            "frame": base64.b64encode(jpeg_bytes).decode('ascii'),
             "width": width,
             "height": height,
             "window_id": window_id
@@ -706,7 +972,7 @@ async def chrome_navigate(window_id: str, data: dict):
 
     try:
         hwnd = int(window_id)
-        success = ChromeController.navigate_to_url(hwnd, url)
+        success = await asyncio.to_thread(ChromeController.navigate_to_url, hwnd, url)
         return {"status": "navigated" if success else "failed"}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -720,7 +986,7 @@ async def chrome_back(window_id: str):
 
     try:
         hwnd = int(window_id)
-        success = ChromeController.go_back(hwnd)
+        success = await asyncio.to_thread(ChromeController.go_back, hwnd)
         return {"status": "success" if success else "failed"}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -734,7 +1000,7 @@ async def chrome_forward(window_id: str):
 
     try:
         hwnd = int(window_id)
-        success = ChromeController.go_forward(hwnd)
+        success = await asyncio.to_thread(ChromeController.go_forward, hwnd)
         return {"status": "success" if success else "failed"}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -748,7 +1014,7 @@ async def chrome_refresh(window_id: str):
 
     try:
         hwnd = int(window_id)
-        success = ChromeController.refresh(hwnd)
+        success = await asyncio.to_thread(ChromeController.refresh, hwnd)
         return {"status": "success" if success else "failed"}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -762,7 +1028,7 @@ async def chrome_new_tab(window_id: str):
 
     try:
         hwnd = int(window_id)
-        success = ChromeController.new_tab(hwnd)
+        success = await asyncio.to_thread(ChromeController.new_tab, hwnd)
         return {"status": "success" if success else "failed"}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -776,7 +1042,7 @@ async def chrome_close_tab(window_id: str):
 
     try:
         hwnd = int(window_id)
-        success = ChromeController.close_tab(hwnd)
+        success = await asyncio.to_thread(ChromeController.close_tab, hwnd)
         return {"status": "success" if success else "failed"}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -790,7 +1056,7 @@ async def chrome_next_tab(window_id: str):
 
     try:
         hwnd = int(window_id)
-        success = ChromeController.next_tab(hwnd)
+        success = await asyncio.to_thread(ChromeController.next_tab, hwnd)
         return {"status": "success" if success else "failed"}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -804,7 +1070,7 @@ async def chrome_prev_tab(window_id: str):
 
     try:
         hwnd = int(window_id)
-        success = ChromeController.prev_tab(hwnd)
+        success = await asyncio.to_thread(ChromeController.prev_tab, hwnd)
         return {"status": "success" if success else "failed"}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -813,13 +1079,13 @@ async def chrome_prev_tab(window_id: str):
 @app.get("/api/system/volume")
 async def api_get_volume():
     """Get current volume level."""
-    return get_volume()
+    return await run_com(get_volume)
 
 
 @app.post("/api/system/volume")
 async def api_set_volume(data: VolumeData):
     """Set volume level."""
-    result = set_volume(data.level)
+    result = await run_com(set_volume, data.level)
     await broadcast_update("volume", result)
     return result
 
@@ -831,11 +1097,8 @@ async def toggle_mute():
         raise HTTPException(status_code=500, detail="pycaw not installed")
 
     try:
-        speakers = AudioUtilities.GetSpeakers()
-        volume = speakers.EndpointVolume
-        current_mute = volume.GetMute()
-        volume.SetMute(not current_mute, None)
-        return {"status": "toggled", "muted": not current_mute}
+        muted = await run_com(toggle_endpoint_mute)
+        return {"status": "toggled", "muted": muted}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -843,13 +1106,13 @@ async def toggle_mute():
 @app.get("/api/system/brightness")
 async def api_get_brightness():
     """Get current brightness level."""
-    return get_brightness()
+    return await run_com(get_brightness)
 
 
 @app.post("/api/system/brightness")
 async def api_set_brightness(data: BrightnessData):
     """Set brightness level."""
-    result = set_brightness(data.level)
+    result = await run_com(set_brightness, data.level)
     await broadcast_update("brightness", result)
     return result
 
@@ -858,7 +1121,7 @@ async def api_set_brightness(data: BrightnessData):
 async def api_get_clipboard():
     """Get clipboard content."""
     try:
-        content = pyperclip.paste()
+        content = await asyncio.to_thread(pyperclip.paste)
         return {"content": content[:1000]}  # Limit size
     except Exception as e:
         return {"content": "", "error": str(e)}
@@ -868,7 +1131,7 @@ async def api_get_clipboard():
 async def api_set_clipboard(data: ClipboardData):
     """Set clipboard content."""
     try:
-        pyperclip.copy(data.content)
+        await asyncio.to_thread(pyperclip.copy, data.content)
         await broadcast_update("clipboard", {"content": data.content[:100]})
         return {"status": "copied"}
     except Exception as e:
@@ -878,23 +1141,88 @@ async def api_set_clipboard(data: ClipboardData):
 @app.get("/api/rustdesk/status")
 async def api_get_rustdesk_status():
     """Check if RustDesk session is active."""
-    return get_rustdesk_status()
+    return await asyncio.to_thread(get_rustdesk_status)
 
 
 @app.get("/api/system/info")
 async def api_get_system_info():
     """Get system information."""
-    return get_system_info()
+    return await asyncio.to_thread(get_system_info)
 
 
 async def broadcast_update(event_type: str, data: dict):
     """Broadcast update to all connected WebSocket clients."""
-    message = json.dumps({"type": event_type, "data": data})
-    for connection in active_connections:
-        try:
-            await connection.send_text(message)
-        except:
-            pass
+    message = _json_dumps({"type": event_type, "data": data})
+    connections = tuple(active_connections)
+    results = await asyncio.gather(*[connection.send_text(message) for connection in connections],
+                                   return_exceptions=True)
+    for connection, result in zip(connections, results):
+        if isinstance(result, Exception) and connection in active_connections:
+            active_connections.remove(connection)
+
+
+PONG = _json_dumps({"type": "pong"})
+
+
+def _stream_options(message: dict) -> dict:
+    """fps/quality/max_width/downlink for start_stream from a stream_start/stream_adjust message."""
+    options = message.get("options", {})
+    return {
+        "fps": options.get("fps", 8),
+        "quality": options.get("quality", 60),
+        "max_width": options.get("max_width", 800),
+        "downlink": options.get("downlink"),
+    }
+
+
+async def _ws_ping(websocket: WebSocket, message: dict):
+    await websocket.send_text(PONG)
+
+
+async def _ws_get_windows(websocket: WebSocket, message: dict):
+    windows = await asyncio.to_thread(get_window_list)
+    await websocket.send_text(_json_dumps({"type": "windows", "data": windows}))
+
+
+async def _ws_stream_start(websocket: WebSocket, message: dict):
+    # Start streaming a window
+    window_id = message.get("window_id")
+    if window_id:
+        await stream_manager.start_stream(window_id, websocket, **_stream_options(message))
+
+
+async def _ws_stream_stop(websocket: WebSocket, message: dict):
+    # Stop streaming a window
+    window_id = message.get("window_id")
+    if window_id:
+        await stream_manager.stop_stream(window_id, websocket)
+
+
+async def _ws_stream_adjust(websocket: WebSocket, message: dict):
+    # Adjust stream settings (restart with new settings)
+    window_id = message.get("window_id")
+    if window_id:
+        await stream_manager.stop_stream(window_id, websocket)
+        await stream_manager.start_stream(window_id, websocket, **_stream_options(message))
+
+
+async def _ws_get_window_info(websocket: WebSocket, message: dict):
+    # Get window info via WebSocket
+    window_id = message.get("window_id")
+    if window_id and HAS_CAPTURE:
+        info = await asyncio.to_thread(WindowCapture.get_window_info, int(window_id))
+        await websocket.send_text(_json_dumps({"type": "window_info", "data": info}))
+
+
+# WebSocket message type -> handler(websocket, message)
+WS_HANDLERS = {
+    "ping": _ws_ping,
+    "get_windows": _ws_get_windows,
+    "stream_start": _ws_stream_start,
+    "stream_stop": _ws_stream_stop,
+    "stream_adjust": _ws_stream_adjust,
+    "get_window_info": _ws_get_window_info,
+}
 
 
 @app.websocket("/ws")
@@ -905,55 +1233,10 @@ async def websocket_endpoint(websocket: WebSocket):
 
     try:
         while True:
-            data = await websocket.receive_text()
-            message = json.loads(data)
-            msg_type = message.get("type", "")
-
-            if msg_type == "ping":
-                await websocket.send_text(json.dumps({"type": "pong"}))
-
-            elif msg_type == "get_windows":
-                windows = get_window_list()
-                await websocket.send_text(json.dumps({"type": "windows", "data": windows}))
-
-            elif msg_type == "stream_start":
-                # Start streaming a window
-                window_id = message.get("window_id")
-                options = message.get("options", {})
-                fps = options.get("fps", 8)
-                quality = options.get("quality", 60)
-                max_width = options.get("max_width", 800)
-
-                if window_id:
-                    await stream_manager.start_stream(
-                        window_id, websocket, fps=fps, quality=quality, max_width=max_width
-                    )
-
-            elif msg_type == "stream_stop":
-                # Stop streaming a window
-                window_id = message.get("window_id")
-                if window_id:
-                    await stream_manager.stop_stream(window_id, websocket)
-
-            elif msg_type == "stream_adjust":
-                # Adjust stream settings (restart with new settings)
-                window_id = message.get("window_id")
-                options = message.get("options", {})
-                if window_id:
-                    await stream_manager.stop_stream(window_id, websocket)
-                    fps = options.get("fps", 8)
-                    quality = options.get("quality", 60)
-                    max_width = options.get("max_width", 800)
-                    await stream_manager.start_stream(
-                        window_id, websocket, fps=fps, quality=quality, max_width=max_width
-                    )
-
-            elif msg_type == "get_window_info":
-                # Get window info via WebSocket
-                window_id = message.get("window_id")
-                if window_id and HAS_CAPTURE:
-                    info = WindowCapture.get_window_info(int(window_id))
-                    await websocket.send_json({"type": "window_info", "data": info})
+            message = orjson.loads(await websocket.receive_text())
+            handler = WS_HANDLERS.get(message.get("type", ""))
+            if handler is not None:
+                await handler(websocket, message)
 
     except WebSocketDisconnect:
         # Clean up stream subscriptions
@@ -973,33 +1256,45 @@ async def action_lock():
         raise HTTPException(status_code=500, detail=str(e))
 
 
+def suspend_system():
+    """Put the system to sleep (blocks until it resumes)."""
+    # Sleep rather than hibernate, force, keep wake events enabled
+    if not ctypes.windll.powrprof.SetSuspendState(False, True, False):
+        raise ctypes.WinError()
+
+
 @app.post("/api/action/sleep")
 async def action_sleep():
     """Put the system to sleep."""
     try:
-        subprocess.run(
-            ["rundll32.exe", "powrprof.dll,SetSuspendState", "0", "1", "0"],
-            check=True
-        )
+        await asyncio.to_thread(suspend_system)
         return {"status": "sleeping"}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
+def save_screenshot() -> str:
+    """Capture the screen to ~/Pictures and return the file path (blocking)."""
+    jpeg_bytes = WindowCapture.capture_desktop() if HAS_CAPTURE else None
+    if jpeg_bytes is None:
+        raise RuntimeError("Screen capture not available")
+    screenshot_path = Path.home() / "Pictures" / f"screenshot_{datetime.now().strftime('%Y%m%d_%H%M%S')}.jpg"
+    screenshot_path.parent.mkdir(parents=True, exist_ok=True)
+    screenshot_path.write_bytes(jpeg_bytes)
+    return str(screenshot_path)
+
+
 @app.post("/api/action/screenshot")
 async def action_screenshot():
     """Take a screenshot."""
-    try:
-        import pyautogui
-        screenshot_path = Path.home() / "Pictures" / f"screenshot_{datetime.now().strftime('%Y%m%d_%H%M%S')}.png"
-        screenshot_path.parent.mkdir(parents=True, exist_ok=True)
-        screenshot = pyautogui.screenshot()
-        screenshot.save(str(screenshot_path))
-        return {"status": "captured", "path": str(screenshot_path)}
-    except ImportError:
+    if not HAS_CAPTURE:
         # Fallback to Windows Snipping Tool
         subprocess.Popen(["snippingtool", "/clip"])
         return {"status": "launched snipping tool"}
+
+    try:
+        path = await asyncio.to_thread(save_screenshot)
+        return {"status": "captured", "path": path}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -1009,16 +1304,23 @@ SCRIPT_DIR = Path(__file__).parent
 INDEX_FILE = SCRIPT_DIR / "index.html"
 PREVIEW_FILE = SCRIPT_DIR / "mobile-ui-preview.html"
 
+# Pick the page once at startup (index.html first, then mobile-ui-preview.html) and
+# keep it in memory along with a gzipped copy, so a request touches neither the disk nor zlib
+FRONTEND_FILE = INDEX_FILE if INDEX_FILE.exists() else PREVIEW_FILE if PREVIEW_FILE.exists() else None
+FRONTEND_HTML = FRONTEND_FILE.read_bytes() if FRONTEND_FILE else None
+FRONTEND_GZIP = gzip.compress(FRONTEND_HTML, 9) if FRONTEND_HTML else None
+FRONTEND_HEADERS = {"Cache-Control": "public, max-age=300, stale-while-revalidate=60", "Vary": "Accept-Encoding"}
+FRONTEND_GZIP_HEADERS = {**FRONTEND_HEADERS, "Content-Encoding": "gzip"}
+
 
 @app.get("/")
-async def serve_frontend():
+async def serve_frontend(request: Request):
     """Serve the frontend."""
-    # Try index.html first, then mobile-ui-preview.html
-    if INDEX_FILE.exists():
-        return FileResponse(INDEX_FILE)
-    elif PREVIEW_FILE.exists():
-        return FileResponse(PREVIEW_FILE)
-    return {"message": "Frontend not found. Place index.html in the same directory as server.py"}
+    if FRONTEND_HTML is None:
+        return {"message": "Frontend not found. Place index.html in the same directory as server.py"}
+    if "gzip" in request.headers.get("accept-encoding", ""):
+        return Response(content=FRONTEND_GZIP, media_type="text/html", headers=FRONTEND_GZIP_HEADERS)
+    return Response(content=FRONTEND_HTML, media_type="text/html", headers=FRONTEND_HEADERS)
 
 
 if __name__ == "__main__":
@@ -1035,4 +1337,9 @@ if __name__ == "__main__":
     print("Access from your phone: http://<your-pc-ip>:8765")
     print("=" * 50)
 
-    uvicorn.run(app, host="0.0.0.0", port=8765)
+    try:
+        import uvloop  # noqa: F401  (not available on Windows)
+        loop_impl = "uvloop"
+    except ImportError:
+        loop_impl = "asyncio"
+    uvicorn.run(app, host="0.0.0.0", port=8765, loop=loop_impl)
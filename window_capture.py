@@ -5,15 +5,18 @@ Captures individual window content using Win32 APIs.
 """
 
 import io
-import base64
+import re
+import threading
+import time
+import zlib
 from typing import Optional, Tuple, Dict, Any
-from ctypes import windll, byref, c_int, sizeof, Structure, c_void_p
-from ctypes.wintypes import DWORD, HWND, RECT
+from ctypes import (windll, byref, c_int, c_long, c_size_t, c_ubyte, c_uint, c_wchar_p, create_unicode_buffer,
+                    sizeof, Structure, Union, c_void_p, POINTER)
+from ctypes.wintypes import DWORD, HWND, LONG, RECT, WORD
 
 # Try importing Windows-specific libraries
 try:
     import win32gui
-    import win32ui
     import win32con
     import win32process
     import win32api
@@ -27,6 +30,66 @@ try:
 except ImportError:
     HAS_PIL = False
 
+# CreateDIBSection returns a handle and fills a pointer; declare both so they aren't truncated on 64-bit
+if HAS_WIN32:
+    _CreateDIBSection = windll.gdi32.CreateDIBSection
+    _CreateDIBSection.restype = c_void_p
+    _CreateDIBSection.argtypes = [c_void_p, c_void_p, c_uint, POINTER(c_void_p), c_void_p, DWORD]
+    _QueryFullProcessImageNameW = windll.kernel32.QueryFullProcessImageNameW
+    _QueryFullProcessImageNameW.argtypes = [c_void_p, DWORD, c_wchar_p, POINTER(DWORD)]
+
+BI_RGB = 0
+DIB_RGB_COLORS = 0
+
+# Upper bound on streamed frame area, so tall windows don't slip past max_width
+MAX_FRAME_PIXELS = 500_000
+
+
+class BITMAPINFOHEADER(Structure):
+    _fields_ = [
+        ("biSize", DWORD),
+        ("biWidth", c_long),
+        ("biHeight", c_long),
+        ("biPlanes", WORD),
+        ("biBitCount", WORD),
+        ("biCompression", DWORD),
+        ("biSizeImage", DWORD),
+        ("biXPelsPerMeter", c_long),
+        ("biYPelsPerMeter", c_long),
+        ("biClrUsed", DWORD),
+        ("biClrImportant", DWORD),
+    ]
+
+
+class DibSurface:
+    """A top-down 32-bit DIB section selected into its own memory DC.
+
+    GDI draws straight into process memory, so `bits` can be hashed and encoded
+    in place without a GetBitmapBits copy. `bits` is only valid until release().
+    """
+
+    def __init__(self, width: int, height: int):
+        self.width = width
+        self.height = height
+        self.stride = width * 4  # 32 bpp rows are always DWORD-aligned
+
+        header = BITMAPINFOHEADER(sizeof(BITMAPINFOHEADER), width, -height, 1, 32, BI_RGB, 0, 0, 0, 0, 0)
+        bits_ptr = c_void_p()
+        self.hbitmap = _CreateDIBSection(None, byref(header), DIB_RGB_COLORS, byref(bits_ptr), None, 0)
+        if not self.hbitmap:
+            raise OSError("CreateDIBSection failed")
+
+        self.hdc = win32gui.CreateCompatibleDC(None)  # Not tied to any window or thread
+        self._old_bitmap = win32gui.SelectObject(self.hdc, self.hbitmap)
+        self.bits = memoryview((c_ubyte * (self.stride * height)).from_address(bits_ptr.value)).cast('B')
+
+    def release(self):
+        self.bits.release()
+        win32gui.SelectObject(self.hdc, self._old_bitmap)
+        win32gui.DeleteDC(self.hdc)
+        win32gui.DeleteObject(self.hbitmap)
+
+
 # Process name classifications
 TERMINAL_PROCESSES = {
     'windowsterminal.exe', 'cmd.exe', 'powershell.exe', 'pwsh.exe',
@@ -43,6 +106,22 @@ BROWSER_PROCESSES = {
     'vivaldi.exe': 'vivaldi'
 }
 
+# Exact names hit the sets; the regexes keep the old substring matching for anything else
+TERMINAL_EXACT = frozenset(TERMINAL_PROCESSES)
+BROWSER_EXACT = frozenset(BROWSER_PROCESSES)
+_TERMINAL_RE = re.compile('|'.join(map(re.escape, sorted(TERMINAL_PROCESSES))))
+_BROWSER_RE = re.compile('|'.join(map(re.escape, sorted(BROWSER_PROCESSES))))
+
+# hwnd -> (expires, (window_class, pid, process_name, window_type)); these rarely change for a
+# live window, while the TTL bounds how long a recycled hwnd can report stale values
+WINDOW_IDENTITY_TTL = 0.5
+WINDOW_IDENTITY_MAX = 512
+_window_identity: Dict[int, Tuple[float, Tuple[str, int, str, str]]] = {}
+
+# (pid, creation time) -> executable name; the creation time tells a recycled pid apart
+PROCESS_NAME_CACHE_MAX = 4096
+_process_name_cache: Dict[Tuple[int, Any], str] = {}
+
 
 class WindowCapture:
     """Handles window capture using Win32 APIs."""
@@ -61,6 +140,7 @@ class WindowCapture:
         try:
             # Check if window exists
             if not win32gui.IsWindow(hwnd):
+                _window_identity.pop(hwnd, None)
                 return {"error": "Window does not exist"}
 
             # Get window rectangle
@@ -71,15 +151,8 @@ class WindowCapture:
             # Get window title
             title = win32gui.GetWindowText(hwnd)
 
-            # Get window class
-            window_class = win32gui.GetClassName(hwnd)
-
-            # Get process info
-            _, pid = win32process.GetWindowThreadProcessId(hwnd)
-            process_name = WindowCapture._get_process_name(pid)
-
-            # Classify window type
-            window_type = WindowCapture.classify_window(hwnd, process_name)
+            # Class, process and type (cached briefly)
+            window_class, pid, process_name, window_type = WindowCapture._get_window_identity(hwnd)
 
             # Check window state
             is_minimized = win32gui.IsIconic(hwnd)
@@ -108,6 +181,25 @@ class WindowCapture:
         except Exception as e:
             return {"error": str(e)}
 
+    @staticmethod
+    def _get_window_identity(hwnd: int) -> Tuple[str, int, str, str]:
+        """Return (window_class, pid, process_name, window_type), cached for WINDOW_IDENTITY_TTL."""
+        now = time.monotonic()
+        cached = _window_identity.get(hwnd)
+        if cached is not None and cached[0] > now:
+            return cached[1]
+
+        window_class = win32gui.GetClassName(hwnd)
+        _, pid = win32process.GetWindowThreadProcessId(hwnd)
+        process_name = WindowCapture._get_process_name(pid)
+        window_type = WindowCapture.classify_window(hwnd, process_name)
+
+        if len(_window_identity) >= WINDOW_IDENTITY_MAX:
+            _window_identity.clear()
+        identity = (window_class, pid, process_name, window_type)
+        _window_identity[hwnd] = (now + WINDOW_IDENTITY_TTL, identity)
+        return identity
+
     @staticmethod
     def classify_window(hwnd: int, process_name: str = None) -> str:
         """
@@ -123,16 +215,15 @@ class WindowCapture:
                 process_name = WindowCapture._get_process_name(pid)
 
             process_lower = process_name.lower()
+            basename = process_lower.rpartition('\\')[2]
 
             # Check for terminal
-            for term_process in TERMINAL_PROCESSES:
-                if term_process in process_lower:
-                    return "terminal"
+            if basename in TERMINAL_EXACT or _TERMINAL_RE.search(process_lower):
+                return "terminal"
 
             # Check for browser
-            for browser_exe in BROWSER_PROCESSES.keys():
-                if browser_exe in process_lower:
-                    return "browser"
+            if basename in BROWSER_EXACT or _BROWSER_RE.search(process_lower):
+                return "browser"
 
             # Check window class for additional detection
             try:
@@ -149,9 +240,36 @@ class WindowCapture:
             return "generic"
 
     @staticmethod
-    def capture_window(hwnd: int, quality: int = 60, max_width: int = 800, restore_if_minimized: bool = True) -> Optional[Tuple[str, int, int]]:
+    def capture_desktop(quality: int = 90) -> Optional[bytes]:
+        """Capture the whole virtual screen (every monitor) as a full-size JPEG."""
+        if not HAS_WIN32 or not HAS_PIL:
+            return None
+
+        x = win32api.GetSystemMetrics(win32con.SM_XVIRTUALSCREEN)
+        y = win32api.GetSystemMetrics(win32con.SM_YVIRTUALSCREEN)
+        width = win32api.GetSystemMetrics(win32con.SM_CXVIRTUALSCREEN)
+        height = win32api.GetSystemMetrics(win32con.SM_CYVIRTUALSCREEN)
+
+        surface = DibSurface(width, height)
+        try:
+            screen_dc = win32gui.GetDC(0)
+            try:
+                # CAPTUREBLT includes layered windows
+                win32gui.BitBlt(surface.hdc, 0, 0, width, height, screen_dc, x, y,
+                                win32con.SRCCOPY | win32con.CAPTUREBLT)
+                windll.gdi32.GdiFlush()
+            finally:
+                win32gui.ReleaseDC(0, screen_dc)
+
+            jpeg_bytes, _, _ = WindowCapture._encode_jpeg(surface, quality, width, max_pixels=None)
+            return jpeg_bytes
+        finally:
+            surface.release()
+
+    @staticmethod
+    def capture_window(hwnd: int, quality: int = 60, max_width: int = 800, restore_if_minimized: bool = True) -> Optional[Tuple[bytes, int, int]]:
         """
-        Capture a window and return base64-encoded JPEG.
+        Capture a window and return raw JPEG bytes.
 
         Args:
             hwnd: Window handle
@@ -160,110 +278,185 @@ class WindowCapture:
             restore_if_minimized: If True, restore minimized windows before capture
 
         Returns:
-            Tuple of (base64_data, width, height) or None if capture failed
+            Tuple of (jpeg_bytes, width, height) or None if capture failed.
+            Callers that need JSON (snapshots) base64-encode it themselves.
         """
         if not HAS_WIN32 or not HAS_PIL:
             return None
 
         try:
-            # Check if window exists
-            if not win32gui.IsWindow(hwnd):
+            surface = WindowCapture._grab_bits(hwnd, restore_if_minimized)
+            if surface is None:
                 return None
+            try:
+                return WindowCapture._encode_jpeg(surface, quality, max_width)
+            finally:
+                surface.release()
 
-            # If window is minimized, restore it first
-            was_minimized = win32gui.IsIconic(hwnd)
-            if was_minimized:
-                if restore_if_minimized:
-                    win32gui.ShowWindow(hwnd, win32con.SW_RESTORE)
-                    import time
-                    time.sleep(0.15)  # Brief delay for window to restore
-                else:
-                    return None
+        except Exception as e:
+            print(f"Capture error: {e}")
+            return None
 
-            # Get window dimensions
-            rect = win32gui.GetWindowRect(hwnd)
-            width = rect[2] - rect[0]
-            height = rect[3] - rect[1]
+    @staticmethod
+    def capture_window_if_changed(hwnd: int, quality: int, max_width: int, last_hash: Optional[int]) -> Optional[Tuple[Optional[bytes], int, int, int]]:
+        """
+        Capture a window, skipping the JPEG encode when it looks unchanged.
+
+        Returns:
+            Tuple of (jpeg_bytes, width, height, frame_hash) or None if capture
+            failed. jpeg_bytes is None when frame_hash equals last_hash.
+        """
+        if not HAS_WIN32 or not HAS_PIL:
+            return None
 
-            if width <= 0 or height <= 0:
+        try:
+            surface = WindowCapture._grab_bits(hwnd, True)
+            if surface is None:
                 return None
+            try:
+                return WindowCapture._encode_if_changed(surface, quality, max_width, last_hash)
+            finally:
+                surface.release()
 
-            # Create device contexts
-            hwnd_dc = win32gui.GetWindowDC(hwnd)
-            mfc_dc = win32ui.CreateDCFromHandle(hwnd_dc)
-            save_dc = mfc_dc.CreateCompatibleDC()
+        except Exception as e:
+            print(f"Capture error: {e}")
+            return None
 
-            # Create bitmap
-            bitmap = win32ui.CreateBitmap()
-            bitmap.CreateCompatibleBitmap(mfc_dc, width, height)
-            save_dc.SelectObject(bitmap)
+    @staticmethod
+    def _encode_if_changed(surface: DibSurface, quality: int, max_width: int, last_hash: Optional[int]) -> Tuple[Optional[bytes], int, int, int]:
+        """Hash a rendered surface and encode it unless the hash equals last_hash."""
+        frame_hash = WindowCapture._frame_hash(surface.bits, surface.stride, surface.height)
+        if frame_hash == last_hash:
+            return (None, surface.width, surface.height, frame_hash)
 
-            # Use PrintWindow for better capture (works with layered windows)
-            # PW_RENDERFULLCONTENT = 2 for better capture on Win 8.1+
-            result = windll.user32.PrintWindow(hwnd, save_dc.GetSafeHdc(), 2)
+        jpeg_bytes, width, height = WindowCapture._encode_jpeg(surface, quality, max_width)
+        return (jpeg_bytes, width, height, frame_hash)
 
-            if result == 0:
-                # Fallback to BitBlt
-                save_dc.BitBlt((0, 0), (width, height), mfc_dc, (0, 0), win32con.SRCCOPY)
+    @staticmethod
+    def _frame_hash(bits: memoryview, row_bytes: int, height: int) -> int:
+        """Cheap change detector: CRC32 over every 4th scanline of the raw bitmap."""
+        view = memoryview(bits)
+        crc = 0
+        for offset in range(0, row_bytes * height, row_bytes * 4):
+            crc = zlib.crc32(view[offset:offset + row_bytes], crc)
+        return crc
 
-            # Convert to PIL Image
-            bmpinfo = bitmap.GetInfo()
-            bmpstr = bitmap.GetBitmapBits(True)
+    @staticmethod
+    def _grab_bits(hwnd: int, restore_if_minimized: bool) -> Optional[DibSurface]:
+        """Render a window into a new DIB surface; the caller must release() it."""
+        size = WindowCapture._window_size(hwnd, restore_if_minimized)
+        if size is None:
+            return None
 
-            img = Image.frombuffer(
-                'RGB',
-                (bmpinfo['bmWidth'], bmpinfo['bmHeight']),
-                bmpstr, 'raw', 'BGRX', 0, 1
-            )
+        surface = DibSurface(*size)
+        try:
+            WindowCapture._render(hwnd, surface)
+        except Exception:
+            surface.release()
+            raise
+        return surface
 
-            # Cleanup Win32 resources
-            win32gui.DeleteObject(bitmap.GetHandle())
-            save_dc.DeleteDC()
-            mfc_dc.DeleteDC()
-            win32gui.ReleaseDC(hwnd, hwnd_dc)
+    @staticmethod
+    def _window_size(hwnd: int, restore_if_minimized: bool) -> Optional[Tuple[int, int]]:
+        """Return a capturable window's (width, height), restoring it if minimized."""
+        # Check if window exists
+        if not win32gui.IsWindow(hwnd):
+            return None
 
-            # Resize for mobile if needed - use BILINEAR for speed/quality balance
-            if width > max_width:
-                ratio = max_width / width
-                new_height = int(height * ratio)
-                img = img.resize((max_width, new_height), Image.Resampling.BILINEAR)
-                width, height = max_width, new_height
+        # If window is minimized, restore it first
+        was_minimized = win32gui.IsIconic(hwnd)
+        if was_minimized:
+            if restore_if_minimized:
+                win32gui.ShowWindow(hwnd, win32con.SW_RESTORE)
+                import time
+                time.sleep(0.15)  # Brief delay for window to restore
+            else:
+                return None
 
-            # Convert to JPEG - fast encoding settings
-            buffer = io.BytesIO()
-            img.save(buffer, format='JPEG', quality=quality, subsampling=2, progressive=False)
-            jpeg_bytes = buffer.getvalue()
+        # Get window dimensions
+        rect = win32gui.GetWindowRect(hwnd)
+        width = rect[2] - rect[0]
+        height = rect[3] - rect[1]
 
-            # Encode to base64
-            b64_data = base64.b64encode(jpeg_bytes).decode('utf-8')
+        if width <= 0 or height <= 0:
+            return None
+        return (width, height)
 
-            return (b64_data, width, height, jpeg_bytes)
+    @staticmethod
+    def _render(hwnd: int, surface: DibSurface):
+        """Draw a window into a surface of its current size."""
+        # The window DC is per-thread, so it is taken and released around each frame
+        hwnd_dc = win32gui.GetWindowDC(hwnd)
+        try:
+            # Use PrintWindow for better capture (works with layered windows)
+            # PW_RENDERFULLCONTENT = 2 for better capture on Win 8.1+
+            result = windll.user32.PrintWindow(hwnd, surface.hdc, 2)
 
-        except Exception as e:
-            print(f"Capture error: {e}")
-            return None
+            if result == 0:
+                # Fallback to BitBlt
+                win32gui.BitBlt(surface.hdc, 0, 0, surface.width, surface.height, hwnd_dc, 0, 0, win32con.SRCCOPY)
+
+            # Make sure batched GDI drawing has landed in the DIB before it is read
+            windll.gdi32.GdiFlush()
+        finally:
+            win32gui.ReleaseDC(hwnd, hwnd_dc)
+
+    @staticmethod
+    def _encode_jpeg(surface: DibSurface, quality: int, max_width: int,
+                     max_pixels: Optional[int] = MAX_FRAME_PIXELS) -> Tuple[bytes, int, int]:
+        """Convert a surface's BGRX bits to a (possibly downscaled) JPEG."""
+        width, height = surface.width, surface.height
+
+        # Convert to PIL Image (reads the DIB memory directly)
+        img = Image.frombuffer('RGB', (width, height), surface.bits, 'raw', 'BGRX', 0, 1)
+
+        # Resize for mobile if needed - use BILINEAR for speed/quality balance.
+        # reducing_gap first shrinks by an integer factor with a cheap box reduce,
+        # so a 4K window doesn't pay full-resolution bilinear filtering.
+        ratio = min(1.0, max_width / width)
+        if max_pixels:
+            ratio = min(ratio, (max_pixels / (width * height)) ** 0.5)
+        if ratio < 1.0:
+            new_width = max(1, int(width * ratio))
+            new_height = max(1, int(height * ratio))
+            img = img.resize((new_width, new_height), Image.Resampling.BILINEAR, reducing_gap=2.0)
+            width, height = new_width, new_height
+
+        # Convert to JPEG - fast encoding settings
+        buffer = io.BytesIO()
+        img.save(buffer, format='JPEG', quality=quality, subsampling=2, progressive=False)
+        return (buffer.getvalue(), width, height)
 
     @staticmethod
     def _get_process_name(pid: int) -> str:
         """Get process name from PID."""
-        try:
-            import psutil
-            process = psutil.Process(pid)
-            return process.name()
-        except:
-            pass
-
-        # Fallback using win32
         try:
             handle = win32api.OpenProcess(
                 win32con.PROCESS_QUERY_LIMITED_INFORMATION,
                 False, pid
             )
             try:
-                exe_path = win32process.GetModuleFileNameEx(handle, 0)
-                return exe_path.split('\\')[-1]
+                key = (pid, win32process.GetProcessTimes(handle)["CreationTime"])
+                name = _process_name_cache.get(key)
+                if name is None:
+                    buffer = create_unicode_buffer(1024)
+                    size = DWORD(len(buffer))
+                    if not _QueryFullProcessImageNameW(int(handle), 0, buffer, byref(size)):
+                        raise OSError("QueryFullProcessImageNameW failed")
+                    name = buffer.value.rpartition('\\')[2]
+                    if len(_process_name_cache) >= PROCESS_NAME_CACHE_MAX:
+                        _process_name_cache.clear()
+                    _process_name_cache[key] = name
+                return name
             finally:
                 win32api.CloseHandle(handle)
+        except:
+            pass
+
+        # Fallback using psutil
+        try:
+            import psutil
+            return psutil.Process(pid).name()
         except:
             return "unknown"
 
@@ -277,6 +470,142 @@ class WindowCapture:
             return False
 
 
+class WindowCaptureSession:
+    """Captures one window repeatedly, reusing its DIB surface and memory DC between frames.
+
+    The surface is only reallocated when the window is resized. Captures may run on
+    any thread, one at a time; close() waits for an in-flight capture to finish.
+    last_ms is the duration of the most recent capture (grab + hash/encode).
+    """
+
+    def __init__(self, hwnd: int):
+        self.hwnd = hwnd
+        self.surface: Optional[DibSurface] = None
+        self.last_ms = 0.0
+        self.resized = False  # Set when the surface is reallocated; a hash from the old size is meaningless
+        self._lock = threading.Lock()
+
+    def _grab(self) -> Optional[DibSurface]:
+        size = WindowCapture._window_size(self.hwnd, True)
+        if size is None:
+            return None
+        if self.surface is None or (self.surface.width, self.surface.height) != size:
+            self._release()
+            self.surface = DibSurface(*size)
+            self.resized = True
+        WindowCapture._render(self.hwnd, self.surface)
+        return self.surface
+
+    def capture(self, quality: int = 60, max_width: int = 800) -> Optional[Tuple[bytes, int, int]]:
+        """Same result as WindowCapture.capture_window."""
+        if not HAS_WIN32 or not HAS_PIL:
+            return None
+
+        with self._lock:
+            start = time.perf_counter()
+            try:
+                surface = self._grab()
+                if surface is None:
+                    return None
+                return WindowCapture._encode_jpeg(surface, quality, max_width)
+            except Exception as e:
+                print(f"Capture error: {e}")
+                return None
+            finally:
+                self.last_ms = (time.perf_counter() - start) * 1000
+
+    def capture_if_changed(self, quality: int, max_width: int, last_hash: Optional[int]) -> Optional[Tuple[Optional[bytes], int, int, int]]:
+        """Same result as WindowCapture.capture_window_if_changed."""
+        if not HAS_WIN32 or not HAS_PIL:
+            return None
+
+        with self._lock:
+            start = time.perf_counter()
+            try:
+                surface = self._grab()
+                if surface is None:
+                    return None
+                if self.resized:
+                    self.resized = False
+                    last_hash = None
+                return WindowCapture._encode_if_changed(surface, quality, max_width, last_hash)
+            except Exception as e:
+                print(f"Capture error: {e}")
+                return None
+            finally:
+                self.last_ms = (time.perf_counter() - start) * 1000
+
+    def _release(self):
+        if self.surface is not None:
+            surface, self.surface = self.surface, None
+            surface.release()
+
+    def close(self):
+        """Free the GDI resources (blocks while a capture is running)."""
+        with self._lock:
+            self._release()
+
+
+class AdaptiveEncoder:
+    """Steers a stream's JPEG quality and width so each frame's capture and send fit a time budget.
+
+    The requested quality and max_width are ceilings. When the smoothed frame time runs
+    over budget, quality drops first and then width; under budget, width recovers first.
+    After each step the controller holds for a number of frames so the average reflects the
+    new settings, and it waits longer before stepping back up than before stepping down.
+    """
+
+    BUDGET_SHARE = 0.8  # Fraction of the frame interval a capture + send may take
+    QUALITY_STEP = 5
+    WIDTH_STEP = 0.75  # Width is scaled by this going down and divided by it going up
+    MIN_QUALITY = 25
+    MIN_WIDTH = 320
+    DOWN_HOLD_FRAMES = 5
+    UP_HOLD_FRAMES = 30
+    SLOW_LINK_MBPS = 2.0  # Below this downlink hint, start 20 quality points lower
+
+    def __init__(self, quality: int, max_width: int, fps: float, downlink: Optional[float] = None):
+        self.max_quality = quality
+        self.full_width = max_width
+        self.budget_ms = 1000.0 / fps * self.BUDGET_SHARE
+        self.quality = quality
+        self.max_width = max_width
+        self.ema_ms: Optional[float] = None
+        self.frames_since_step = 0
+        if downlink and downlink < self.SLOW_LINK_MBPS:
+            self.quality = min(quality, max(self.MIN_QUALITY, quality - 20))
+
+    def update(self, capture_ms: float, send_ms: float = 0.0):
+        """Feed the capture+encode and send times of a frame encoded at the current settings."""
+        elapsed_ms = capture_ms + send_ms
+        if self.ema_ms is None:
+            self.ema_ms = elapsed_ms
+        else:
+            self.ema_ms = 0.8 * self.ema_ms + 0.2 * elapsed_ms
+        self.frames_since_step += 1
+
+        if self.ema_ms > self.budget_ms * 1.2:
+            if self.frames_since_step < self.DOWN_HOLD_FRAMES:
+                return
+            if self.quality > self.MIN_QUALITY:
+                self.quality = max(self.MIN_QUALITY, self.quality - self.QUALITY_STEP)
+            elif self.max_width > self.MIN_WIDTH:
+                self.max_width = max(self.MIN_WIDTH, int(self.max_width * self.WIDTH_STEP))
+            else:
+                return
+            self.frames_since_step = 0
+        elif self.ema_ms < self.budget_ms * 0.7:
+            if self.frames_since_step < self.UP_HOLD_FRAMES:
+                return
+            if self.max_width < self.full_width:
+                self.max_width = min(self.full_width, int(self.max_width / self.WIDTH_STEP))
+            elif self.quality < self.max_quality:
+                self.quality = min(self.max_quality, self.quality + self.QUALITY_STEP)
+            else:
+                return
+            self.frames_since_step = 0
+
+
 def _focus_window(hwnd: int):
     """Focus a window using multiple methods for reliability."""
     import time
@@ -319,32 +648,17 @@ class ChromeController:
 
         try:
             import time
-            import pyautogui
-            import pyperclip
 
             # Focus the window first
             _focus_window(hwnd)
-            time.sleep(0.1)
 
-            # Send Ctrl+L to focus address bar
-            pyautogui.hotkey('ctrl', 'l')
+            # Send Ctrl+L to focus address bar (this also selects its text)
+            if not send_key_batch(ord('L'), [win32con.VK_CONTROL]):
+                return False
             time.sleep(0.05)
 
-            # Clear any existing text
-            pyautogui.hotkey('ctrl', 'a')
-            time.sleep(0.02)
-
-            # Type the URL using clipboard (faster than typing)
-            old_clipboard = pyperclip.paste()
-            pyperclip.copy(url)
-            pyautogui.hotkey('ctrl', 'v')
-            time.sleep(0.02)
-            pyperclip.copy(old_clipboard)  # Restore clipboard
-
-            # Press Enter
-            pyautogui.press('enter')
-
-            return True
+            # Type over the selection as Unicode keystrokes (no clipboard round trip), then Enter
+            return bool(send_text(url) and send_key_batch(win32con.VK_RETURN, []))
         except Exception as e:
             print(f"Navigate error: {e}")
             return False
@@ -356,9 +670,7 @@ class ChromeController:
             return False
         try:
             _focus_window(hwnd)
-            import pyautogui
-            pyautogui.hotkey('alt', 'left')
-            return True
+            return _send_key_combo(hwnd, win32con.VK_LEFT, alt=True)
         except Exception as e:
             print(f"go_back error: {e}")
             return False
@@ -370,9 +682,7 @@ class ChromeController:
             return False
         try:
             _focus_window(hwnd)
-            import pyautogui
-            pyautogui.hotkey('alt', 'right')
-            return True
+            return _send_key_combo(hwnd, win32con.VK_RIGHT, alt=True)
         except Exception as e:
             print(f"go_forward error: {e}")
             return False
@@ -384,9 +694,7 @@ class ChromeController:
             return False
         try:
             _focus_window(hwnd)
-            import pyautogui
-            pyautogui.press('f5')
-            return True
+            return _send_key(hwnd, win32con.VK_F5)
         except Exception as e:
             print(f"refresh error: {e}")
             return False
@@ -398,9 +706,7 @@ class ChromeController:
             return False
         try:
             _focus_window(hwnd)
-            import pyautogui
-            pyautogui.hotkey('ctrl', 't')
-            return True
+            return _send_key_combo(hwnd, 'T', ctrl=True)
         except Exception as e:
             print(f"new_tab error: {e}")
             return False
@@ -412,9 +718,7 @@ class ChromeController:
             return False
         try:
             _focus_window(hwnd)
-            import pyautogui
-            pyautogui.hotkey('ctrl', 'w')
-            return True
+            return _send_key_combo(hwnd, 'W', ctrl=True)
         except Exception as e:
             print(f"close_tab error: {e}")
             return False
@@ -426,9 +730,7 @@ class ChromeController:
             return False
         try:
             _focus_window(hwnd)
-            import pyautogui
-            pyautogui.hotkey('ctrl', 'tab')
-            return True
+            return _send_key_combo(hwnd, win32con.VK_TAB, ctrl=True)
         except Exception as e:
             print(f"next_tab error: {e}")
             return False
@@ -440,53 +742,90 @@ class ChromeController:
             return False
         try:
             _focus_window(hwnd)
-            import pyautogui
-            pyautogui.hotkey('ctrl', 'shift', 'tab')
-            return True
+            return _send_key_combo(hwnd, win32con.VK_TAB, ctrl=True, shift=True)
         except Exception as e:
             print(f"prev_tab error: {e}")
             return False
 
 
-def _send_key(hwnd: int, vk_code: int):
+# SendInput structures (MOUSEINPUT is only here so the union has the right size)
+INPUT_KEYBOARD = 1
+KEYEVENTF_KEYUP = 0x0002
+KEYEVENTF_UNICODE = 0x0004
+
+
+class _KEYBDINPUT(Structure):
+    _fields_ = [("wVk", WORD), ("wScan", WORD), ("dwFlags", DWORD),
+                ("time", DWORD), ("dwExtraInfo", c_size_t)]
+
+
+class _MOUSEINPUT(Structure):
+    _fields_ = [("dx", LONG), ("dy", LONG), ("mouseData", DWORD),
+                ("dwFlags", DWORD), ("time", DWORD), ("dwExtraInfo", c_size_t)]
+
+
+class _INPUTUNION(Union):
+    _fields_ = [("ki", _KEYBDINPUT), ("mi", _MOUSEINPUT)]
+
+
+class _INPUT(Structure):
+    _fields_ = [("type", DWORD), ("u", _INPUTUNION)]
+
+
+def _send_keyboard_input(events: list) -> int:
+    """Inject (vk, scan, flags) keyboard events in one SendInput call; returns the number injected."""
+    inputs = (_INPUT * len(events))()
+    for i, (vk, scan, flags) in enumerate(events):
+        inputs[i].type = INPUT_KEYBOARD
+        inputs[i].u.ki = _KEYBDINPUT(vk, scan, flags, 0, 0)
+    return windll.user32.SendInput(len(events), inputs, sizeof(_INPUT))
+
+
+def send_key_batch(vk_code: int, modifier_vks: list) -> int:
+    """Press modifiers, tap the key and release modifiers in a single SendInput call."""
+    events = [(vk, 0, 0) for vk in modifier_vks]
+    events += [(vk_code, 0, 0), (vk_code, 0, KEYEVENTF_KEYUP)]
+    events += [(vk, 0, KEYEVENTF_KEYUP) for vk in reversed(modifier_vks)]
+    return _send_keyboard_input(events)
+
+
+def send_text(text: str) -> int:
+    """Type text into the foreground window as Unicode keystrokes, independent of keyboard layout."""
+    events = []
+    for unit in memoryview(text.encode('utf-16-le')).cast('H'):
+        events += [(0, unit, KEYEVENTF_UNICODE), (0, unit, KEYEVENTF_UNICODE | KEYEVENTF_KEYUP)]
+    return _send_keyboard_input(events) if events else 1
+
+
+def _send_key(hwnd: int, vk_code: int, post_message: bool = False) -> bool:
     """Send a single key press."""
-    win32gui.PostMessage(hwnd, win32con.WM_KEYDOWN, vk_code, 0)
-    win32gui.PostMessage(hwnd, win32con.WM_KEYUP, vk_code, 0)
+    return _send_key_combo(hwnd, vk_code, post_message=post_message)
 
 
-def _send_key_combo(hwnd: int, key, ctrl: bool = False, alt: bool = False, shift: bool = False):
-    """Send a key combination."""
-    import time
+def _send_key_combo(hwnd: int, key, ctrl: bool = False, alt: bool = False, shift: bool = False,
+                    post_message: bool = False) -> bool:
+    """Send a key combination to the foreground window in one SendInput call.
 
+    post_message=True posts WM_KEYDOWN/WM_KEYUP to hwnd instead; that needs no focus
+    but many apps (Chrome included) ignore posted shortcuts.
+    """
     # Convert character to virtual key code if needed
     if isinstance(key, str):
         vk_code = ord(key.upper())
     else:
         vk_code = key
 
-    # Press modifiers
-    if ctrl:
-        win32gui.PostMessage(hwnd, win32con.WM_KEYDOWN, win32con.VK_CONTROL, 0)
-    if alt:
-        win32gui.PostMessage(hwnd, win32con.WM_KEYDOWN, win32con.VK_MENU, 0)
-    if shift:
-        win32gui.PostMessage(hwnd, win32con.WM_KEYDOWN, win32con.VK_SHIFT, 0)
-
-    time.sleep(0.01)
-
-    # Press main key
-    win32gui.PostMessage(hwnd, win32con.WM_KEYDOWN, vk_code, 0)
-    win32gui.PostMessage(hwnd, win32con.WM_KEYUP, vk_code, 0)
-
-    time.sleep(0.01)
-
-    # Release modifiers
-    if shift:
-        win32gui.PostMessage(hwnd, win32con.WM_KEYUP, win32con.VK_SHIFT, 0)
-    if alt:
-        win32gui.PostMessage(hwnd, win32con.WM_KEYUP, win32con.VK_MENU, 0)
-    if ctrl:
-        win32gui.PostMessage(hwnd, win32con.WM_KEYUP, win32con.VK_CONTROL, 0)
+    modifier_vks = [vk for vk, pressed in ((win32con.VK_CONTROL, ctrl), (win32con.VK_MENU, alt),
+                                           (win32con.VK_SHIFT, shift)) if pressed]
+
+    if post_message:
+        for vk in modifier_vks + [vk_code]:
+            win32gui.PostMessage(hwnd, win32con.WM_KEYDOWN, vk, 0)
+        for vk in [vk_code] + modifier_vks[::-1]:
+            win32gui.PostMessage(hwnd, win32con.WM_KEYUP, vk, 0)
+        return True
+
+    return bool(send_key_batch(vk_code, modifier_vks))
 
 
 # Test code